@@ -1,17 +1,56 @@
+import time
+START_TIME = time.perf_counter()
+
 import tkinter as tk
 from tkinter import messagebox, ttk, filedialog
-import json
 import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import threading
 import ttkbootstrap as tb
-import csv
 from datetime import datetime
-from PIL import Image, ImageTk
+from functools import lru_cache
+import charts
+import perf
+from importer import parse_files
+from ledger import BudgetExceededError, Ledger, LedgerError, narrows, parse_date
+from storage import open_storage
+from transaction_store import ordinal_to_date
+from virtual_table import VirtualTable
 
 # Fix matplotlib permission issues
 os.environ['MPLCONFIGDIR'] = os.path.join(os.getcwd(), 'matplotlib_config')
 
+# Quiet time after the last keystroke before the filters are re-applied
+FILTER_DELAY_MS = 250
+# How often to look for changes other processes saved to the data files
+EXTERNAL_POLL_MS = 1000
+# How often to run requests queued by the ingestion API when it is idle, how
+# long after the last request to keep checking every millisecond instead, and
+# how often to refresh the list while requests come in
+API_POLL_MS = 50
+API_BUSY_SECONDS = 0.5
+API_REFRESH_MS = 250
+# How often to look for recurring transactions that came due
+RECURRING_CHECK_MS = 60 * 1000
+
+
+def load_matplotlib():
+    # matplotlib is by far the slowest import, so it waits until the first chart is opened.
+    # Figures are created directly instead of through pyplot, so nothing keeps them
+    # alive in pyplot's global registry once their window is closed.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    return Figure, FigureCanvasTkAgg
+
+
+@lru_cache(maxsize=None)
+def load_logo(width, height):
+    # Decoded and resized once per size; the cache also keeps the Tk image alive
+    from PIL import Image, ImageTk
+    img = Image.open("logo.png")
+    img = img.resize((width, height))
+    return ImageTk.PhotoImage(img)
+
+
 class BudgetHandler:
     def __init__(self, root):
         self.root = root
@@ -20,9 +59,6 @@ class BudgetHandler:
         self.root.resizable(False, False)
 
         # Initialize variables
-        self.balance = 0
-        self.transactions = []
-        self.budgets = {}
         self.categories = ["Salary", "Food", "Rent", "Utilities", "Entertainment", "Others"]
 
         # Style configuration
@@ -30,11 +66,26 @@ class BudgetHandler:
         self.current_theme = "darkly"
 
         # Load data
-        self.load_data()
+        self.ledger = Ledger(open_storage(os.environ.get("MONEY_MAP_STORAGE", "journal")),
+                             float(os.environ.get("MONEY_MAP_SAVE_DELAY", "0.5")))
+        self.save_status_job = None
+        self.startup_time = None
+        self.filter_job = None
+        self.last_filter = self.last_result = None
+        self.api = None
+        self.api_refresh_job = None
+        self.api_active = 0
+        # Set when the user turns down the due recurring transactions, until a rule changes
+        self.recurring_paused = False
 
         # Setup UI
         self.create_widgets()
         self.setup_bindings()
+        self.root.after(EXTERNAL_POLL_MS, self.poll_external_changes)
+        if os.environ.get("MONEY_MAP_API_PORT"):
+            self.start_api(int(os.environ["MONEY_MAP_API_PORT"]))
+        # Everything that came due while the app was closed is added right after startup
+        self.root.after_idle(self.recurring_timer)
 
         # Set window icon
         self.set_window_icon()
@@ -53,10 +104,14 @@ class BudgetHandler:
         right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5)
 
         # Balance display
-        self.balance_label = tb.Label(left_frame, text=f"Balance: €{self.balance:.2f}",
+        self.balance_label = tb.Label(left_frame, text=f"Balance: €{self.ledger.balance:.2f}",
                                     font=("Arial", 16, "bold"), bootstyle="success")
         self.balance_label.pack(pady=10)
 
+        # Save status (writes happen in the background)
+        self.save_status_label = tb.Label(left_frame, text="All changes saved", bootstyle="secondary")
+        self.save_status_label.pack()
+
         # Date Entry
         date_frame = tb.Frame(left_frame)
         date_frame.pack(pady=5)
@@ -128,13 +183,16 @@ class BudgetHandler:
         transaction_frame = tb.Frame(right_frame)
         transaction_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        self.transaction_tree = tb.Treeview(transaction_frame, columns=("Date", "Description", "Amount", "Category", "Type"),
-                                          show="headings", height=15)
+        # Only the 15 visible rows exist as Treeview items, scrolling recycles them
+        self.transaction_table = VirtualTable(transaction_frame, ("Date", "Description", "Amount", "Category", "Type"),
+                                              15, self.format_transaction_row)
+        self.transaction_tree = self.transaction_table.tree
         self.transaction_tree.heading("Date", text="Date")
         self.transaction_tree.heading("Description", text="Description")
         self.transaction_tree.heading("Amount", text="Amount")
         self.transaction_tree.heading("Category", text="Category")
         self.transaction_tree.heading("Type", text="Type")
+        self.transaction_table.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.transaction_tree.pack(fill=tk.BOTH, expand=True)
 
         # Add horizontal scrollbar
@@ -143,6 +201,15 @@ class BudgetHandler:
         self.transaction_tree.configure(xscrollcommand=scrollbar_x.set)
 
         # Filter controls
+        search_frame = tb.Frame(right_frame)
+        search_frame.pack(pady=(5, 0), fill=tk.X)
+
+        tb.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_text = tb.Entry(search_frame, width=40)
+        self.search_text.pack(side=tk.LEFT, padx=5)
+        tb.Label(search_frame, text="description or category; end a word with * to match word starts",
+                 bootstyle="secondary").pack(side=tk.LEFT)
+
         filter_frame = tb.Frame(right_frame)
         filter_frame.pack(pady=5, fill=tk.X)
 
@@ -154,6 +221,9 @@ class BudgetHandler:
         tb.Label(filter_frame, text="Start Date:").pack(side=tk.LEFT, padx=5)
         self.start_date = tb.Entry(filter_frame, width=10)
         self.start_date.pack(side=tk.LEFT)
+        if self.ledger.unloaded_years():
+            # Older years stay on disk until the filter reaches back into them
+            self.start_date.insert(0, f"01-01-{datetime.now().year}")
 
         tb.Label(filter_frame, text="End Date:").pack(side=tk.LEFT, padx=5)
         self.end_date = tb.Entry(filter_frame, width=10)
@@ -170,7 +240,13 @@ class BudgetHandler:
                  bootstyle="primary-outline").pack(side=tk.LEFT, padx=2)
         tb.Button(control_frame, text="Budget Report", command=self.show_budget_report,
                  bootstyle="primary-outline").pack(side=tk.LEFT, padx=2)
-        tb.Button(control_frame, text="Export CSV", command=self.export_csv,
+        tb.Button(control_frame, text="Trends Report", command=self.show_trends_report,
+                 bootstyle="primary-outline").pack(side=tk.LEFT, padx=2)
+        tb.Button(control_frame, text="Recurring", command=self.show_recurring_window,
+                 bootstyle="info-outline").pack(side=tk.LEFT, padx=2)
+        tb.Button(control_frame, text="Import", command=self.import_statements,
+                 bootstyle="success-outline").pack(side=tk.LEFT, padx=2)
+        tb.Button(control_frame, text="Export", command=self.export_csv,
                  bootstyle="success-outline").pack(side=tk.LEFT, padx=2)
         tb.Button(control_frame, text="Delete Data", command=self.delete_data,
                  bootstyle="danger-outline").pack(side=tk.LEFT, padx=2)
@@ -188,6 +264,12 @@ class BudgetHandler:
         self.transaction_tree.bind("<Button-3>", self.show_context_menu)
         self.category_combobox.bind("<<ComboboxSelected>>", self.toggle_custom_category_transaction)
         self.budget_category.bind("<<ComboboxSelected>>", self.toggle_custom_category_budget)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.bind("<Control-P>", lambda event: self.show_performance_window())
+        # Filters apply as you type
+        self.filter_category.bind("<<ComboboxSelected>>", self.schedule_live_filter)
+        for widget in (self.search_text, self.filter_category, self.start_date, self.end_date):
+            widget.bind("<KeyRelease>", self.schedule_live_filter)
 
     def show_context_menu(self, event):
         item = self.transaction_tree.identify_row(event.y)
@@ -195,69 +277,239 @@ class BudgetHandler:
             self.transaction_tree.selection_set(item)
             self.context_menu.post(event.x_root, event.y_root)
 
-    def load_data(self):
-        # Load transactions
-        if os.path.exists("transactions.json"):
-            with open("transactions.json", "r") as f:
-                data = json.load(f)
-                self.transactions = data.get("transactions", [])
-                self.balance = data.get("balance", 0)
+    def update_save_status(self):
+        if self.save_status_job is not None:
+            self.root.after_cancel(self.save_status_job)
+            self.save_status_job = None
+
+        writer = self.ledger.writer
+        pending = writer.pending()
+        if writer.error is not None:
+            self.save_status_label.config(text=f"Save failed: {writer.error}", bootstyle="danger")
+        elif pending:
+            self.save_status_label.config(text=f"Saving {pending} change(s)...", bootstyle="warning")
+        else:
+            self.save_status_label.config(text="All changes saved", bootstyle="secondary")
+        if pending:
+            self.save_status_job = self.root.after(250, self.update_save_status)
+
+    def flush(self):
+        return self.ledger.flush()
+
+    def on_close(self):
+        if self.api is not None:
+            self.api.stop()
+        self.ledger.writer.close()
+        if self.ledger.writer.error is not None:
+            messagebox.showerror("Error", f"Some changes could not be saved: {self.ledger.writer.error}")
+        self.ledger.close()
+        self.root.destroy()
+
+    def poll_external_changes(self):
+        # Scripts or a second window saving to the same files
+        try:
+            changed = self.ledger.poll_external()
+        except (OSError, ValueError):
+            # e.g. a JSON file caught half-written by a script that does not take the lock
+            changed = False
+        if changed:
+            self.update_ui()
+        self.root.after(EXTERNAL_POLL_MS, self.poll_external_changes)
 
-        # Load budgets
-        if os.path.exists("budgets.json"):
-            with open("budgets.json", "r") as f:
-                self.budgets = json.load(f)
+    def start_api(self, port):
+        # Local HTTP/JSON ingestion for scripts (see api.py)
+        from api import IngestServer
+        try:
+            self.api = IngestServer(self.ledger, port=port).start()
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not start the API on port {port}: {e}")
+            return
+        self.root.after(API_POLL_MS, self.drain_api)
+
+    def drain_api(self):
+        # API requests run here on the Tk thread, a short slice at a time so the
+        # window keeps responding under a flood of them. The list is refreshed
+        # once per API_REFRESH_MS however many arrived.
+        if self.api.drain():
+            self.api_active = time.perf_counter()
+            if self.api_refresh_job is None:
+                self.api_refresh_job = self.root.after(API_REFRESH_MS, self.refresh_after_api)
+        busy = self.api.pending() or time.perf_counter() - self.api_active < API_BUSY_SECONDS
+        self.root.after(1 if busy else API_POLL_MS, self.drain_api)
+
+    def refresh_after_api(self):
+        self.api_refresh_job = None
+        self.update_ui()
+        self.update_save_status()
 
-    def save_data(self):
-        with open("transactions.json", "w") as f:
-            json.dump({"balance": self.balance, "transactions": self.transactions}, f, indent=2)
+    def recurring_timer(self):
+        self.check_recurring()
+        self.root.after(RECURRING_CHECK_MS, self.recurring_timer)
 
-        with open("budgets.json", "w") as f:
-            json.dump(self.budgets, f, indent=2)
+    def check_recurring(self):
+        # Adds all due occurrences of the recurring rules in one batch, with one
+        # budget check and one refresh however many periods were missed
+        if self.recurring_paused or not self.ledger.recurring_due():
+            return
+        try:
+            try:
+                self.ledger.materialize_recurring()
+            except BudgetExceededError as e:
+                if not messagebox.askyesno(e.title, f"Recurring transactions: {e}\n\nAdd them anyway?"):
+                    self.recurring_paused = True
+                    return
+                self.ledger.materialize_recurring(allow_over_budget=True)
+        except LedgerError as e:
+            messagebox.showerror(e.title, f"Recurring transactions: {e}")
+            self.recurring_paused = True
+            return
+        self.update_ui()
+        self.update_save_status()
+
+    def show_recurring_window(self):
+        recurring_window = tk.Toplevel(self.root)
+        recurring_window.title("Recurring Transactions")
+        recurring_window.geometry("700x480")
+
+        # Set window icon
+        self.set_window_icon(recurring_window)
+
+        columns = ("Description", "Amount", "Category", "Every", "Next")
+        rule_tree = tb.Treeview(recurring_window, columns=columns, show="headings", height=8)
+        for col in columns:
+            rule_tree.heading(col, text=col)
+            rule_tree.column(col, width=130)
+        rule_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+
+        def refresh_rules():
+            rule_tree.delete(*rule_tree.get_children())
+            for rule in self.ledger.rules:
+                next_date = rule.next_date()
+                every = "month" if rule.interval == 1 else f"{rule.interval} months"
+                rule_tree.insert("", tk.END, iid=str(rule.id), values=(
+                    rule.description, f"€{rule.amount:.2f}", rule.category, f"{every}, day {rule.day}",
+                    ordinal_to_date(next_date) if next_date is not None else "ended"))
+
+        form = tb.Frame(recurring_window)
+        form.pack(pady=5)
+        entries = {}
+        for row, (label, width) in enumerate([("Description", 20), ("Amount", 20), ("Day of month", 8),
+                                              ("Every (months)", 8), ("Start (DD-MM-YYYY)", 12),
+                                              ("End (optional)", 12)]):
+            tb.Label(form, text=f"{label}:").grid(row=row % 3, column=row // 3 * 2, sticky=tk.W, padx=5, pady=2)
+            entries[label] = tb.Entry(form, width=width)
+            entries[label].grid(row=row % 3, column=row // 3 * 2 + 1, sticky=tk.W, pady=2)
+        entries["Every (months)"].insert(0, "1")
+        entries["Start (DD-MM-YYYY)"].insert(0, datetime.now().strftime("%d-%m-%Y"))
+        tb.Label(form, text="Category:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
+        category_combobox = tb.Combobox(form, values=self.categories)
+        category_combobox.grid(row=3, column=1, sticky=tk.W, pady=2)
+        category_combobox.set(self.categories[0])
+        tb.Label(form, text="Type:").grid(row=3, column=2, sticky=tk.W, padx=5, pady=2)
+        type_combobox = tb.Combobox(form, values=["Income", "Expense"], width=10, state="readonly")
+        type_combobox.grid(row=3, column=3, sticky=tk.W, pady=2)
+        type_combobox.set("Income")
+
+        def add_rule():
+            try:
+                self.ledger.add_rule(entries["Description"].get(), entries["Amount"].get(), category_combobox.get(),
+                                     type_combobox.get() == "Income", entries["Day of month"].get(),
+                                     entries["Every (months)"].get(), entries["Start (DD-MM-YYYY)"].get(),
+                                     entries["End (optional)"].get())
+            except LedgerError as e:
+                messagebox.showerror(e.title, str(e), parent=recurring_window)
+                return
+            self.recurring_paused = False
+            self.check_recurring()
+            self.update_save_status()
+            refresh_rules()
+
+        def remove_rule():
+            for item in rule_tree.selection():
+                self.ledger.remove_rule(int(item))
+            self.recurring_paused = False
+            self.update_save_status()
+            refresh_rules()
+
+        btn_frame = tb.Frame(recurring_window)
+        btn_frame.pack(pady=10)
+        tb.Button(btn_frame, text="Add Rule", command=add_rule, bootstyle="success-outline").pack(side=tk.LEFT, padx=2)
+        tb.Button(btn_frame, text="Remove Rule", command=remove_rule,
+                  bootstyle="danger-outline").pack(side=tk.LEFT, padx=2)
+        refresh_rules()
 
     def delete_data(self):
         confirm = messagebox.askyesno("Confirm Deletion", "Are you sure you want to delete all data?")
         if confirm:
-            self.transactions = []
-            self.budgets = {}
-            self.balance = 0
-            self.save_data()
+            self.ledger.clear()
             self.update_ui()
+            self.update_save_status()
             messagebox.showinfo("Success", "All data has been deleted successfully!")
 
+    @perf.timed("update_ui")
     def update_ui(self):
         # Update balance
-        self.balance_label.config(text=f"Balance: €{self.balance:.2f}",
-                                bootstyle="success" if self.balance >= 0 else "danger")
+        self.balance_label.config(text=f"Balance: €{self.ledger.balance:.2f}",
+                                bootstyle="success" if self.ledger.balance >= 0 else "danger")
 
         # Filter transactions
-        filtered = self.transactions
         category_filter = self.filter_category.get()
         start_date = self.start_date.get()
         end_date = self.end_date.get()
-
-        if category_filter != "All":
-            filtered = [t for t in filtered if t["category"] == category_filter]
+        start = end = None
 
         try:
             if start_date:
-                start = datetime.strptime(start_date, "%d-%m-%Y")
-                filtered = [t for t in filtered if datetime.strptime(t["date"], "%d-%m-%Y") >= start]
+                start = parse_date(start_date)
             if end_date:
-                end = datetime.strptime(end_date, "%d-%m-%Y")
-                filtered = [t for t in filtered if datetime.strptime(t["date"], "%d-%m-%Y") <= end]
-        except ValueError:
-            messagebox.showerror("Invalid Date", "Please use DD-MM-YYYY format")
+                end = parse_date(end_date)
+        except LedgerError as e:
+            messagebox.showerror(e.title, str(e))
+
+        self.cancel_live_filter()
+        filters = (None if category_filter == "All" else category_filter, start, end, self.search_text.get())
+        filtered = self.ledger.filter(*filters)
+        # The ledger may have changed, so live filtering starts over from this result
+        self.last_filter, self.last_result = filters, filtered
 
         # Update transaction list
-        self.transaction_tree.delete(*self.transaction_tree.get_children())
-        for t in filtered:
-            amount = f"€{t['amount']:.2f}"
-            category = t["category"]
-            description = t["description"]
-            date = t["date"]
-            transaction_type = "Income" if t["amount"] > 0 else "Expense"
-            self.transaction_tree.insert("", "end", values=(date, description, amount, category, transaction_type))
+        self.transaction_table.set_items(filtered)
+
+    def schedule_live_filter(self, event=None):
+        # Every keystroke restarts the timer, so a burst of typing costs one refresh
+        self.cancel_live_filter()
+        self.filter_job = self.root.after(FILTER_DELAY_MS, self.apply_live_filter)
+
+    def cancel_live_filter(self):
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+            self.filter_job = None
+
+    def apply_live_filter(self):
+        self.filter_job = None
+        dates = []
+        for entry in (self.start_date, self.end_date):
+            text = entry.get().strip()
+            try:
+                dates.append(datetime.strptime(text, "%d-%m-%Y") if text else None)
+            except ValueError:
+                # Probably still being typed: flag it and keep the current rows
+                entry.configure(bootstyle="danger")
+                return
+            entry.configure(style="TEntry")
+
+        category = self.filter_category.get()
+        filters = (None if category in ("All", "") else category, *dates, self.search_text.get())
+        if filters == self.last_filter:
+            return
+        # e.g. a later start date: only the rows already shown can still match
+        within = self.last_result if self.last_filter is not None and narrows(filters, self.last_filter) else None
+        filtered = self.ledger.filter(*filters, within=within)
+        self.last_filter, self.last_result = filters, filtered
+        self.transaction_table.set_items(filtered)
+
+    def format_transaction_row(self, transaction_id):
+        return self.ledger.table_row(transaction_id)
 
     def add_income(self):
         self.add_transaction(is_income=True)
@@ -265,73 +517,50 @@ class BudgetHandler:
     def add_expense(self):
         self.add_transaction(is_income=False)
 
-    def add_transaction(self, is_income):
-        description = self.description_entry.get()
-        amount = self.amount_entry.get()
-        date_str = self.date_entry.get()
+    def transaction_category(self):
+        category = self.category_combobox.get()
+        if category == "Others":
+            category = self.custom_category_entry_transaction.get()
+            if not category:
+                messagebox.showerror("Error", "Please enter a custom category name.")
+                return None
+        return category
 
-        if not all([description, amount, date_str]):
-            messagebox.showerror("Error", "Please fill in all fields.")
+    def add_transaction(self, is_income):
+        category = self.transaction_category()
+        if category is None:
             return
 
         try:
-            # Validate date format
-            date_obj = datetime.strptime(date_str, "%d-%m-%Y")
-            formatted_date = date_obj.strftime("%d-%m-%Y")
-            amount = float(amount)
-            if amount <= 0:
-                raise ValueError("Amount must be positive.")
-
-            category = self.category_combobox.get()
-            if category == "Others":
-                category = self.custom_category_entry_transaction.get()
-                if not category:
-                    messagebox.showerror("Error", "Please enter a custom category name.")
-                    return
-
-            if not is_income and amount > self.balance:
-                messagebox.showerror("Error", "Insufficient balance!")
-                return
-
-            # Check budget
-            if not is_income and not self.check_budget(category, amount):
-                return
-
-            amount = amount if is_income else -amount
-            self.balance += amount
-            self.transactions.append({
-                "date": formatted_date,
-                "description": description,
-                "amount": amount,
-                "category": category
-            })
-            self.update_ui()
-            messagebox.showinfo("Success", "Transaction added successfully!")
-            self.clear_entries()
-            self.save_data()
+            self.ledger.add_transaction(self.date_entry.get(), self.description_entry.get(),
+                                        self.amount_entry.get(), category, is_income)
+        except LedgerError as e:
+            messagebox.showerror(e.title, str(e))
+            return
 
-        except ValueError as e:
-            messagebox.showerror("Error", f"Invalid input: {str(e)}")
+        self.update_ui()
+        self.update_save_status()
+        messagebox.showinfo("Success", "Transaction added successfully!")
+        self.clear_entries()
 
     def edit_transaction(self):
-        selected = self.transaction_tree.selection()
-        if not selected:
+        transaction_id = self.transaction_table.selected_item()
+        if transaction_id is None:
             return
 
-        index = self.transaction_tree.index(selected[0])
-        transaction = self.transactions[index]
+        transaction = self.ledger.get(transaction_id)
 
         # Populate fields
         self.date_entry.delete(0, tk.END)
-        self.date_entry.insert(0, transaction["date"])
+        self.date_entry.insert(0, transaction.date)
         self.description_entry.delete(0, tk.END)
-        self.description_entry.insert(0, transaction["description"])
+        self.description_entry.insert(0, transaction.description)
         self.amount_entry.delete(0, tk.END)
-        self.amount_entry.insert(0, abs(transaction["amount"]))
-        self.category_combobox.set(transaction["category"])
+        self.amount_entry.insert(0, f"{abs(transaction.amount):.2f}")
+        self.category_combobox.set(transaction.category)
 
         # Temporarily change button functions
-        self.add_income_btn.config(text="Save Changes", command=lambda: self.save_edit(index, is_income=transaction["amount"] > 0))
+        self.add_income_btn.config(text="Save Changes", command=lambda: self.save_edit(transaction_id, is_income=transaction.cents > 0))
         self.add_expense_btn.config(text="Cancel", command=self.cancel_edit)
 
     def cancel_edit(self):
@@ -339,74 +568,35 @@ class BudgetHandler:
         self.add_income_btn.config(text="Add Income", command=self.add_income)
         self.add_expense_btn.config(text="Add Expense", command=self.add_expense)
 
-    def save_edit(self, index, is_income):
-        description = self.description_entry.get()
-        amount = self.amount_entry.get()
-        date_str = self.date_entry.get()
-
-        if not all([description, amount, date_str]):
-            messagebox.showerror("Error", "Please fill in all fields.")
+    def save_edit(self, transaction_id, is_income):
+        category = self.transaction_category()
+        if category is None:
             return
 
         try:
-            # Validate date format
-            date_obj = datetime.strptime(date_str, "%d-%m-%Y")
-            formatted_date = date_obj.strftime("%d-%m-%Y")
-            amount = float(amount)
-            if amount <= 0:
-                raise ValueError("Amount must be positive.")
-
-            category = self.category_combobox.get()
-            if category == "Others":
-                category = self.custom_category_entry_transaction.get()
-                if not category:
-                    messagebox.showerror("Error", "Please enter a custom category name.")
-                    return
-
-            if not is_income and amount > self.balance + abs(self.transactions[index]["amount"]):
-                messagebox.showerror("Error", "Insufficient balance!")
-                return
-
-            # Check budget
-            if not is_income and not self.check_budget(category, amount):
-                return
-
-            # Update transaction
-            old_amount = self.transactions[index]["amount"]
-            self.balance -= old_amount  # Remove old amount
-            new_amount = amount if is_income else -amount
-            self.balance += new_amount  # Add new amount
-
-            self.transactions[index] = {
-                "date": formatted_date,
-                "description": description,
-                "amount": new_amount,
-                "category": category
-            }
-
-            self.update_ui()
-            messagebox.showinfo("Success", "Transaction updated successfully!")
-            self.clear_entries()
-            self.save_data()
+            self.ledger.edit_transaction(transaction_id, self.date_entry.get(), self.description_entry.get(),
+                                         self.amount_entry.get(), category, is_income)
+        except LedgerError as e:
+            messagebox.showerror(e.title, str(e))
+            return
 
-            # Reset buttons
-            self.add_income_btn.config(text="Add Income", command=self.add_income)
-            self.add_expense_btn.config(text="Add Expense", command=self.add_expense)
+        self.update_ui()
+        self.update_save_status()
+        messagebox.showinfo("Success", "Transaction updated successfully!")
+        self.clear_entries()
 
-        except ValueError as e:
-            messagebox.showerror("Error", f"Invalid input: {str(e)}")
+        # Reset buttons
+        self.add_income_btn.config(text="Add Income", command=self.add_income)
+        self.add_expense_btn.config(text="Add Expense", command=self.add_expense)
 
     def delete_transaction(self):
-        selected = self.transaction_tree.selection()
-        if not selected:
+        transaction_id = self.transaction_table.selected_item()
+        if transaction_id is None:
             return
 
-        index = self.transaction_tree.index(selected[0])
-        amount = self.transactions[index]["amount"]
-        self.balance -= amount
-        del self.transactions[index]
+        self.ledger.delete_transaction(transaction_id)
         self.update_ui()
-        self.save_data()
+        self.update_save_status()
         messagebox.showinfo("Success", "Transaction deleted successfully!")
 
     def set_budget(self):
@@ -418,14 +608,11 @@ class BudgetHandler:
                 return
 
         try:
-            amount = float(self.budget_amount.get())
-            if amount <= 0:
-                raise ValueError
-            self.budgets[category] = amount
-            self.save_data()
+            self.ledger.set_budget(category, self.budget_amount.get())
+            self.update_save_status()
             messagebox.showinfo("Success", f"Budget set for {category}")
-        except (ValueError, tk.TclError):
-            messagebox.showerror("Invalid Amount", "Please enter a positive number")
+        except LedgerError as e:
+            messagebox.showerror(e.title, str(e))
 
     def remove_budget(self):
         category = self.budget_category.get()
@@ -435,27 +622,12 @@ class BudgetHandler:
                 messagebox.showerror("Error", "Please enter a custom category name.")
                 return
 
-        if category in self.budgets:
-            del self.budgets[category]
-            self.save_data()
+        if self.ledger.remove_budget(category):
+            self.update_save_status()
             messagebox.showinfo("Success", f"Budget removed for {category}")
 
-    def check_budget(self, category, amount):
-        if category in self.budgets:
-            spent = sum(t["amount"] for t in self.transactions
-                      if t["category"] == category and t["amount"] < 0)
-            remaining = self.budgets[category] + spent
-            if abs(amount) > remaining:
-                messagebox.showerror("Budget Exceeded",
-                                   f"This purchase exceeds your {category} budget by €{abs(amount) - remaining:.2f}")
-                return False
-        return True
-
     def show_transaction_report(self):
-        expenses = {}
-        for transaction in self.transactions:
-            if transaction["amount"] < 0:
-                expenses[transaction["category"]] = expenses.get(transaction["category"], 0) + abs(transaction["amount"])
+        expenses = self.ledger.expense_totals()
 
         if not expenses:
             messagebox.showerror("Error", "No expenses recorded yet.")
@@ -468,45 +640,42 @@ class BudgetHandler:
         # Set window icon
         self.set_window_icon(graph_window)
 
-        fig, ax = plt.subplots(figsize=(5, 5))
-        ax.pie(expenses.values(), labels=expenses.keys(), autopct="%1.1f%%", startangle=140)
-        ax.set_title("Expense Breakdown")
-
+        # One figure and canvas per window, redrawn in place when switching charts
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        fig = Figure(figsize=(5, 5))
         canvas = FigureCanvasTkAgg(fig, master=graph_window)
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-        canvas.draw()
-
-        # Add a button to switch to bar graph
-        switch_btn = tb.Button(graph_window, text="Switch to Bar Graph", command=lambda: self.show_bar_graph(expenses, graph_window), bootstyle="info-outline")
-        switch_btn.pack(pady=10)
 
-    def show_bar_graph(self, expenses, graph_window):
-        fig, ax = plt.subplots(figsize=(5, 5))
-        ax.bar(expenses.keys(), expenses.values(), color='skyblue')
-        ax.set_title("Expense Breakdown")
-        ax.set_xlabel("Category")
-        ax.set_ylabel("Amount (€)")
+        def switch_chart():
+            kind = "bar" if switch_btn.cget("text") == "Switch to Bar Graph" else "pie"
+            self.draw_expense_chart(fig, canvas, expenses, kind)
+            switch_btn.config(text="Switch to Pie Graph" if kind == "bar" else "Switch to Bar Graph")
 
-        canvas = FigureCanvasTkAgg(fig, master=graph_window)
+        # Add a button to switch between pie and bar graph
+        switch_btn = tb.Button(graph_window, text="Switch to Bar Graph", command=switch_chart, bootstyle="info-outline")
+        switch_btn.pack(side=tk.BOTTOM, pady=10)
         canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-        canvas.draw()
+        self.draw_expense_chart(fig, canvas, expenses, "pie")
 
-        # Add a button to switch to pie graph
-        switch_btn = tb.Button(graph_window, text="Switch to Pie Graph", command=lambda: self.show_pie_graph(expenses, graph_window), bootstyle="info-outline")
-        switch_btn.pack(pady=10)
+        graph_window.protocol("WM_DELETE_WINDOW", lambda: self.close_chart_window(graph_window, fig, canvas))
 
-    def show_pie_graph(self, expenses, graph_window):
-        fig, ax = plt.subplots(figsize=(5, 5))
-        ax.pie(expenses.values(), labels=expenses.keys(), autopct="%1.1f%%", startangle=140)
-        ax.set_title("Expense Breakdown")
+    @perf.timed("render.expense_chart")
+    def draw_expense_chart(self, fig, canvas, expenses, kind):
+        charts.draw_expense_chart(fig, expenses, kind)
+        self.draw_canvas(canvas)
 
-        canvas = FigureCanvasTkAgg(fig, master=graph_window)
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-        canvas.draw()
+    def draw_canvas(self, canvas):
+        # While instrumented the canvas is drawn right away, so the render spans
+        # include the actual drawing instead of just scheduling it
+        if perf.enabled:
+            with perf.span("render.draw"):
+                canvas.draw()
+        else:
+            canvas.draw_idle()
 
-        # Add a button to switch to bar graph
-        switch_btn = tb.Button(graph_window, text="Switch to Bar Graph", command=lambda: self.show_bar_graph(expenses, graph_window), bootstyle="info-outline")
-        switch_btn.pack(pady=10)
+    def close_chart_window(self, window, fig, canvas):
+        fig.clear()
+        canvas.get_tk_widget().destroy()
+        window.destroy()
 
     def show_budget_report(self):
         budget_window = tk.Toplevel(self.root)
@@ -524,44 +693,210 @@ class BudgetHandler:
         category_combobox.pack(side=tk.LEFT, padx=5)
         category_combobox.set("")
 
+        # The canvas is created with the first chart and reused for every other category
+        chart = {}
+
         def update_budget_graph(event):
             category = category_combobox.get()
             if category == "":
                 return
 
-            if category not in self.budgets:
-                messagebox.showerror("Error", f"No budget set for {category}")
+            try:
+                spent, remaining = self.ledger.budget_utilization(category)
+            except LedgerError as e:
+                messagebox.showerror(e.title, str(e))
                 return
 
-            spent = sum(t["amount"] for t in self.transactions
-                        if t["category"] == category and t["amount"] < 0)
-            remaining = self.budgets[category] + spent
+            if not chart:
+                Figure, FigureCanvasTkAgg = load_matplotlib()
+                chart["fig"] = Figure(figsize=(5, 5))
+                chart["canvas"] = FigureCanvasTkAgg(chart["fig"], master=budget_window)
+                chart["canvas"].get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-            if remaining < 0:
-                remaining = 0
+            charts.draw_budget_chart(chart["fig"], category, spent, remaining)
+            with perf.span("render.budget_chart"):
+                self.draw_canvas(chart["canvas"])
 
-            fig, ax = plt.subplots(figsize=(5, 5))
-            ax.pie([remaining, abs(spent)], labels=["Remaining", "Spent"], autopct="%1.1f%%", startangle=140)
-            ax.set_title(f"Budget Utilization for {category}")
-
-            canvas = FigureCanvasTkAgg(fig, master=budget_window)
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-            canvas.draw()
+        def close_budget_window():
+            if chart:
+                self.close_chart_window(budget_window, chart["fig"], chart["canvas"])
+            else:
+                budget_window.destroy()
 
         category_combobox.bind("<<ComboboxSelected>>", update_budget_graph)
+        budget_window.protocol("WM_DELETE_WINDOW", close_budget_window)
 
         # Initial graph
         update_budget_graph(None)
 
+    def show_trends_report(self):
+        # Every view here reads the month x category rollup, never the transactions
+        months = self.ledger.transactions.rollup.months()
+        if not months:
+            messagebox.showerror("Error", "No transactions recorded yet.")
+            return
+
+        trends_window = tk.Toplevel(self.root)
+        trends_window.title("Trends Report")
+        trends_window.geometry("700x550")
+
+        # Set window icon
+        self.set_window_icon(trends_window)
+
+        options_frame = tb.Frame(trends_window)
+        options_frame.pack(pady=10)
+
+        views = ["Income vs Expense", "Category Trends", "Month over Month"]
+        tb.Label(options_frame, text="View:").pack(side=tk.LEFT)
+        view_combobox = tb.Combobox(options_frame, values=views, state="readonly", width=20)
+        view_combobox.pack(side=tk.LEFT, padx=5)
+        view_combobox.set(views[0])
+
+        month_labels = [f"{month:02d}-{year}" for year, month in months]
+        tb.Label(options_frame, text="Month:").pack(side=tk.LEFT, padx=(10, 0))
+        month_combobox = tb.Combobox(options_frame, values=month_labels, state="readonly", width=10)
+        month_combobox.pack(side=tk.LEFT, padx=5)
+        month_combobox.set(month_labels[-1])
+
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        fig = Figure(figsize=(6, 5))
+        canvas = FigureCanvasTkAgg(fig, master=trends_window)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        def update_trends_graph(event):
+            period = months[month_labels.index(month_combobox.get())]
+            self.draw_trends_chart(fig, canvas, view_combobox.get(), period)
+
+        view_combobox.bind("<<ComboboxSelected>>", update_trends_graph)
+        month_combobox.bind("<<ComboboxSelected>>", update_trends_graph)
+        trends_window.protocol("WM_DELETE_WINDOW", lambda: self.close_chart_window(trends_window, fig, canvas))
+
+        # Initial graph
+        update_trends_graph(None)
+
+    @perf.timed("render.trends_chart")
+    def draw_trends_chart(self, fig, canvas, view, period):
+        if view == "Income vs Expense":
+            charts.draw_income_expense_chart(fig, self.ledger.monthly_totals())
+        elif view == "Category Trends":
+            charts.draw_category_trends_chart(fig, *self.ledger.category_trends())
+        else:
+            charts.draw_month_over_month_chart(fig, period, self.ledger.compare_periods(period))
+        self.draw_canvas(canvas)
+
+    def import_statements(self):
+        paths = filedialog.askopenfilenames(filetypes=[("Bank statements", "*.csv *.ofx *.qfx *.qif"),
+                                                       ("All files", "*.*")])
+        if not paths:
+            return
+
+        # Parsing runs on a worker thread (and in worker processes for several files)
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Importing")
+        progress_window.geometry("350x100")
+        progress_window.transient(self.root)
+
+        # Set window icon
+        self.set_window_icon(progress_window)
+
+        tb.Label(progress_window, text=f"Reading {len(paths)} file(s)...").pack(pady=(15, 5))
+        progress_bar = tb.Progressbar(progress_window, mode="indeterminate", length=300, bootstyle="success-striped")
+        progress_bar.pack(pady=5)
+        progress_bar.start()
+
+        parsed = {}
+
+        def parse():
+            try:
+                parsed["results"] = parse_files(list(paths))
+            except Exception as e:
+                parsed["error"] = e
+
+        worker = threading.Thread(target=parse, name="money-map-import", daemon=True)
+        worker.start()
+
+        def poll_import():
+            if worker.is_alive():
+                self.root.after(100, poll_import)
+                return
+            progress_bar.stop()
+            progress_window.destroy()
+            if "error" in parsed:
+                messagebox.showerror("Error", f"Import failed: {parsed['error']}")
+                return
+            self.commit_import(parsed["results"])
+
+        poll_import()
+
+    def commit_import(self, results):
+        new, duplicates = self.ledger.find_duplicates([rows for rows, errors in results])
+        errors = [error for rows, errors in results for error in errors]
+
+        summary = f"{len(new)} new transactions, {len(duplicates)} duplicates skipped"
+        if errors:
+            summary += f", {len(errors)} unreadable rows:\n" + "\n".join(errors[:5])
+        if not new:
+            messagebox.showinfo("Import", summary)
+            return
+        if not messagebox.askyesno("Import", summary + "\n\nImport the new transactions?"):
+            return
+
+        try:
+            try:
+                self.ledger.import_transactions(new)
+            except BudgetExceededError as e:
+                if not messagebox.askyesno(e.title, f"{e}\n\nImport anyway?"):
+                    return
+                self.ledger.import_transactions(new, allow_over_budget=True)
+        except LedgerError as e:
+            messagebox.showerror(e.title, str(e))
+            return
+
+        self.update_ui()
+        self.update_save_status()
+        messagebox.showinfo("Success", f"{len(new)} transactions imported successfully!")
+
     def export_csv(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
-        if file_path:
-            with open(file_path, "w", newline="") as file:
-                writer = csv.writer(file)
-                writer.writerow(["Date", "Description", "Amount", "Category"])
-                for t in self.transactions:
-                    writer.writerow([t["date"], t["description"], t["amount"], t["category"]])
-            messagebox.showinfo("Success", "Transactions exported successfully!")
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                                 filetypes=[("CSV files", "*.csv"),
+                                                            ("Compressed CSV files", "*.csv.gz"),
+                                                            ("JSON Lines files", "*.jsonl")])
+        if not file_path:
+            return
+
+        # Exports what the table currently shows, on a worker thread
+        export = self.ledger.export(file_path, self.transaction_table.items)
+
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Exporting")
+        progress_window.geometry("350x120")
+        progress_window.transient(self.root)
+
+        # Set window icon
+        self.set_window_icon(progress_window)
+
+        progress_label = tb.Label(progress_window, text=f"0 of {export.total} transactions")
+        progress_label.pack(pady=(15, 5))
+        progress_bar = tb.Progressbar(progress_window, maximum=max(1, export.total), length=300,
+                                      bootstyle="success-striped")
+        progress_bar.pack(pady=5)
+        tb.Button(progress_window, text="Cancel", command=export.cancel,
+                 bootstyle="danger-outline").pack(pady=5)
+        progress_window.protocol("WM_DELETE_WINDOW", export.cancel)
+
+        def poll_export():
+            progress_bar.config(value=export.done)
+            progress_label.config(text=f"{export.done} of {export.total} transactions")
+            if not export.finished:
+                self.root.after(100, poll_export)
+                return
+            progress_window.destroy()
+            if export.error is not None:
+                messagebox.showerror("Error", f"Export failed: {export.error}")
+            elif not export.cancelled:
+                messagebox.showinfo("Success", "Transactions exported successfully!")
+
+        poll_export()
 
     def toggle_theme(self):
         self.current_theme = "cosmo" if self.current_theme == "darkly" else "darkly"
@@ -602,26 +937,89 @@ class BudgetHandler:
     def view_budgets(self):
         budget_window = tk.Toplevel(self.root)
         budget_window.title("View Budgets")
-        budget_window.geometry("300x200")
+        budget_window.geometry("450x200")
 
         # Set window icon
         self.set_window_icon(budget_window)
 
-        budget_list = tk.Listbox(budget_window, width=50)
+        budget_list = tk.Listbox(budget_window, width=70)
         budget_list.pack(pady=10)
 
-        for category, amount in self.budgets.items():
-            budget_list.insert(tk.END, f"{category}: €{amount:.2f}")
+        this_month = (datetime.now().year, datetime.now().month)
+        for category, amount in self.ledger.budgets.items():
+            spent = self.ledger.spent_in_category(category)
+            budget_list.insert(tk.END, f"{category}: €{amount:.2f} (spent €{spent:.2f}, "
+                                       f"€{self.ledger.spent_in_category(category, this_month):.2f} this month)")
+
+    def show_performance_window(self):
+        # Hidden diagnostics window (Ctrl+Shift+P): recent spans, counters and a profiler toggle
+        perf_window = tk.Toplevel(self.root)
+        perf_window.title("Performance")
+        perf_window.geometry("640x480")
+
+        # Set window icon
+        self.set_window_icon(perf_window)
+
+        columns = ("Span", "Calls", "Last (ms)", "p50 (ms)", "p95 (ms)", "Max (ms)")
+        span_tree = tb.Treeview(perf_window, columns=columns, show="headings", height=12)
+        for col in columns:
+            span_tree.heading(col, text=col)
+            span_tree.column(col, width=90 if col != "Span" else 180, anchor=tk.W if col == "Span" else tk.E)
+        span_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+
+        counters_label = tb.Label(perf_window, text="", justify=tk.LEFT)
+        counters_label.pack(fill=tk.X, padx=10)
+
+        btn_frame = tb.Frame(perf_window)
+        btn_frame.pack(pady=10)
+
+        def toggle_instrumentation():
+            if perf.enabled:
+                perf.disable()
+            else:
+                perf.enable()
+            instrument_btn.config(text="Disable Instrumentation" if perf.enabled else "Enable Instrumentation")
+
+        def toggle_profile():
+            if perf.profiler is None:
+                perf.start_profile()
+                profile_btn.config(text="Stop cProfile")
+                return
+            profile_btn.config(text="Start cProfile")
+            path = filedialog.asksaveasfilename(parent=perf_window, defaultextension=".prof",
+                                                filetypes=[("Profile files", "*.prof")])
+            report = perf.stop_profile(path or None)
+            report_window = tk.Toplevel(perf_window)
+            report_window.title("cProfile")
+            text = tk.Text(report_window, wrap=tk.NONE, width=120, height=35)
+            text.insert(tk.END, report)
+            text.pack(fill=tk.BOTH, expand=True)
+
+        instrument_btn = tb.Button(btn_frame, command=toggle_instrumentation, bootstyle="primary-outline",
+                                   text="Disable Instrumentation" if perf.enabled else "Enable Instrumentation")
+        instrument_btn.pack(side=tk.LEFT, padx=2)
+        profile_btn = tb.Button(btn_frame, command=toggle_profile, bootstyle="warning-outline",
+                                text="Stop cProfile" if perf.profiler is not None else "Start cProfile")
+        profile_btn.pack(side=tk.LEFT, padx=2)
+        tb.Button(btn_frame, text="Reset", command=perf.reset, bootstyle="secondary-outline").pack(side=tk.LEFT, padx=2)
+
+        def refresh():
+            if not perf_window.winfo_exists():
+                return
+            span_tree.delete(*span_tree.get_children())
+            for name, calls, last, p50, p95, worst in perf.summary():
+                span_tree.insert("", "end", values=(name, calls, f"{last:.2f}", f"{p50:.2f}", f"{p95:.2f}", f"{worst:.2f}"))
+            counters_label.config(text="   ".join(f"{name}: {value:,}" for name, value in sorted(perf.counters.items())))
+            perf_window.after(1000, refresh)
+
+        refresh()
 
     def set_window_icon(self, window=None):
         if window is None:
             window = self.root
 
         try:
-            img = Image.open("logo.png")
-            img = img.resize((32, 32))  # Adjust size as needed
-            icon_image = ImageTk.PhotoImage(img)
-            window.iconphoto(True, icon_image)
+            window.iconphoto(True, load_logo(32, 32))
         except Exception as e:
             print(f"Error setting window icon: {e}")
 
@@ -635,16 +1033,12 @@ if __name__ == "__main__":
     splash.attributes("-topmost", True)
 
     try:
-        img = Image.open("logo.png")
-        img = img.resize((300, 300))  # Adjust size as needed
-
         # Remove background and set transparent
         splash.configure(bg='white')
         splash.attributes('-transparentcolor', 'white')
 
-        splash_image = ImageTk.PhotoImage(img)
+        splash_image = load_logo(300, 300)
         label = tk.Label(splash, image=splash_image, bg='white')
-        label.image = splash_image
         label.pack()
 
         # Center splash screen
@@ -654,13 +1048,29 @@ if __name__ == "__main__":
         x = (root.winfo_screenwidth() // 2) - (width // 2)
         y = (root.winfo_screenheight() // 2) - (height // 2)
         splash.geometry(f"+{x}+{y}")
-
-        # Close splash after 5 seconds and show main window
-        splash.after(5000, lambda: [splash.destroy(), root.deiconify()])
+        splash.update()  # Draw it now, loading below blocks the event loop
     except Exception as e:
         print(f"Splash screen error: {e}")
         splash.destroy()
-        root.deiconify()
+        splash = None
 
     app = BudgetHandler(root)
+
+    def report_startup():
+        app.startup_time = time.perf_counter() - START_TIME
+        if perf.enabled:
+            perf.record("startup", START_TIME, app.startup_time)
+        print(f"Money Map ready in {app.startup_time:.3f}s")
+
+    def show_main_window():
+        if splash is not None:
+            splash.destroy()
+        root.deiconify()
+        root.after_idle(report_startup)
+
+    # Close the splash as soon as everything is loaded, optionally keeping it up
+    # for at least MONEY_MAP_SPLASH_MIN seconds
+    minimum = float(os.environ.get("MONEY_MAP_SPLASH_MIN", "0"))
+    remaining = minimum - (time.perf_counter() - START_TIME)
+    root.after(max(0, int(remaining * 1000)), show_main_window)
     root.mainloop()
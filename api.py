@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http import HTTPStatus
+
+import perf
+from importer import DEFAULT_CATEGORY
+from ledger import BudgetExceededError, InsufficientBalanceError, Ledger, LedgerError, budget_amount
+from storage import open_storage
+
+# Local HTTP/JSON endpoint for feeding the ledger from scripts and other tools.
+# It only listens on 127.0.0.1, and only takes requests sent as
+# application/json without an Origin header, so web pages cannot post to it.
+#
+#   POST /transactions   one transaction, a list of them, or {"transactions": [...]}:
+#                        {"date": "DD-MM-YYYY", "description": ..., "amount": 12.5,
+#                         "category": "Food", "type": "expense" | "income"}
+#                        Without "type", a negative amount is an expense.
+#                        A list is added whole or not at all.
+#   POST /budgets        {"category": "Food", "amount": 300}, or
+#                        {"budgets": {"Food": 300, "Rent": null}}; null removes
+#   GET  /status         balance, transaction count and budgets
+#
+# Requests are parsed on the server's own thread. Everything that touches the
+# ledger is queued and run by drain() on the thread that owns the ledger (the
+# Tk thread in the app), which takes whatever has arrived in one go.
+#
+#   python api.py --port 8765    serves the ledger without the window
+
+DEFAULT_PORT = 8765
+MAX_BODY = 16 * 1024 * 1024
+# How long one drain() may keep the ledger's thread busy
+DRAIN_SECONDS = 0.02
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def reject_constant(name):
+    raise ValueError(f"{name} is not a number")
+
+
+def parse_entry(t):
+    # One JSON transaction to add_transactions()'s (date_str, description, amount, category, is_income)
+    if not isinstance(t, dict):
+        raise ApiError(400, "Each transaction must be a JSON object")
+    amount = t.get("amount")
+    if isinstance(amount, bool) or not isinstance(amount, (int, float, str, type(None))):
+        raise ApiError(400, "amount must be a number")
+    kind = t.get("type")
+    if kind not in (None, "income", "expense"):
+        raise ApiError(400, 'type must be "income" or "expense"')
+    if isinstance(amount, str):
+        # "12" is 12, so a text amount gets its sign from the number it holds
+        try:
+            amount = float(amount)
+        except ValueError:
+            raise ApiError(400, "amount must be a number")
+    if kind is None and amount is not None:
+        kind = "expense" if amount < 0 else "income"
+        amount = abs(amount)
+    fields = [t.get(name) for name in ("date", "description", "category")]
+    if not all(isinstance(value, (str, type(None))) for value in fields):
+        raise ApiError(400, "date, description and category must be strings")
+    date_str, description, category = fields
+    return date_str, description, amount, category or DEFAULT_CATEGORY, kind == "income"
+
+
+def transactions_job(payload):
+    if isinstance(payload, dict) and "transactions" in payload:
+        payload = payload["transactions"]
+    entries = [parse_entry(t) for t in (payload if isinstance(payload, list) else [payload])]
+    if not entries:
+        raise ApiError(400, "No transactions")
+
+    def job(ledger):
+        return 201, {"ids": ledger.add_transactions(entries), "balance": ledger.balance}
+    return job
+
+
+def budgets_job(payload):
+    if not isinstance(payload, dict):
+        raise ApiError(400, "Expected a JSON object")
+    if "budgets" not in payload and "amount" not in payload:
+        raise ApiError(400, "Expected an amount")
+    budgets = payload.get("budgets", {payload.get("category"): payload.get("amount")})
+    if not isinstance(budgets, dict) or not all(isinstance(category, str) and category for category in budgets):
+        raise ApiError(400, "Budgets need a category name")
+    for amount in budgets.values():
+        if isinstance(amount, bool) or not isinstance(amount, (int, float, str, type(None))):
+            raise ApiError(400, "amount must be a number")
+
+    def job(ledger):
+        # Checked before any is set, so a bad amount leaves every budget as it was
+        for amount in budgets.values():
+            if amount is not None:
+                budget_amount(amount)
+        for category, amount in budgets.items():
+            if amount is None:
+                ledger.remove_budget(category)
+            else:
+                ledger.set_budget(category, amount)
+        return 200, {"budgets": dict(ledger.budgets)}
+    return job
+
+
+def status_job(payload):
+    def job(ledger):
+        return 200, {"balance": ledger.balance, "transactions": len(ledger.transactions),
+                     "budgets": dict(ledger.budgets)}
+    return job
+
+
+ROUTES = {
+    "/transactions": ("POST", transactions_job),
+    "/budgets": ("POST", budgets_job),
+    "/status": ("GET", status_job),
+}
+
+
+def error_status(error):
+    if isinstance(error, (InsufficientBalanceError, BudgetExceededError)):
+        return 409
+    return 422
+
+
+class IngestServer:
+    # Serves the API on a background thread with its own event loop; the
+    # owner of `ledger` calls drain() regularly to run the queued requests
+    def __init__(self, ledger, host="127.0.0.1", port=DEFAULT_PORT):
+        self.ledger = ledger
+        self.host = host
+        self.port = port
+        self.jobs = queue.SimpleQueue()
+        self.loop = None
+        self.server = None
+        self.error = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="money-map-api", daemon=True)
+
+    def start(self):
+        # Returns once the port is open; raises OSError if it cannot be
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.serve_client, self.host, self.port))
+        except OSError as e:
+            self.error = e
+            self.ready.set()
+            self.loop.close()
+            return
+        # Port 0 picks a free one
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def drain(self, seconds=DRAIN_SECONDS, wait=None):
+        # Runs queued requests against the ledger until the queue is empty or
+        # `seconds` have passed, waiting up to `wait` seconds for the first.
+        # Returns how many ran; pending() says whether some are left. Each
+        # request saves on its own, and the writer batches those saves anyway.
+        count = 0
+        deadline = None
+        while deadline is None or time.perf_counter() < deadline:
+            try:
+                job, future = self.jobs.get(timeout=wait) if wait and deadline is None else self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if deadline is None:
+                deadline = time.perf_counter() + seconds
+            if not future.set_running_or_notify_cancel():
+                # The client went away while it was queued
+                continue
+            try:
+                result = job(self.ledger)
+            except LedgerError as e:
+                body = {"error": str(e), "title": e.title}
+                if e.index is not None:
+                    body["index"] = e.index
+                result = error_status(e), body
+            except Exception as e:
+                result = 500, {"error": str(e)}
+            future.set_result(result)
+            count += 1
+        if count:
+            perf.count("api requests", count)
+        return count
+
+    def pending(self):
+        return not self.jobs.empty()
+
+    async def handle(self, method, path, headers, body):
+        route = ROUTES.get(path)
+        if route is None:
+            return 404, {"error": f"No such endpoint: {path}"}
+        route_method, make_job = route
+        if method != route_method:
+            return 405, {"error": f"{path} only takes {route_method}"}
+        if "origin" in headers:
+            return 403, {"error": "Requests from web pages are not accepted"}
+        payload = None
+        if method == "POST":
+            if headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+                return 415, {"error": "Send the body as application/json"}
+            try:
+                payload = json.loads(body, parse_constant=reject_constant)
+            except ValueError as e:
+                return 400, {"error": f"Invalid JSON: {e}"}
+        try:
+            job = make_job(payload)
+        except ApiError as e:
+            return e.status, {"error": str(e)}
+        future = Future()
+        self.jobs.put((job, future))
+        return await asyncio.wrap_future(future)
+
+    async def serve_client(self, reader, writer):
+        # Plain HTTP/1.1 with keep-alive, so a client can stream requests over one connection
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": f"Body larger than {MAX_BODY} bytes"}, False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b""
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                status, payload = await self.handle(method, target.split("?")[0], headers, body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: a line longer than the stream buffer
+            pass
+        except asyncio.CancelledError:
+            # stop() with the connection still open; it is closed below and
+            # the task ends quietly instead of logging the cancellation
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Money Map ingestion API without the window")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MONEY_MAP_API_PORT", DEFAULT_PORT)))
+    args = parser.parse_args(argv)
+    ledger = Ledger(open_storage(os.environ.get("MONEY_MAP_STORAGE", "journal")),
+                    float(os.environ.get("MONEY_MAP_SAVE_DELAY", "0.5")))
+    try:
+        server = IngestServer(ledger, port=args.port).start()
+    except OSError as e:
+        print(e, file=sys.stderr)
+        ledger.close()
+        return 1
+    print(f"Listening on http://{server.host}:{server.port}")
+    try:
+        while True:
+            server.drain(wait=1)
+            ledger.poll_external()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        ledger.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
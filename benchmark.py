@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from ledger import Ledger
+from storage import open_storage, write_json_atomic
+
+# Synthetic ledgers and headless timings of the hot paths. Every case runs on
+# a real Ledger; the GUI parts (table refresh, charts) run the app's own code
+# against stub widgets and an Agg canvas, so no display is needed.
+#
+#   python benchmark.py --sizes 1000 100000 1000000 --output bench.json
+#   python benchmark.py --sizes 100000 --compare bench.json
+
+CATEGORIES = [
+    # (category, share of transactions, typical amount, spread); negative means expense
+    ("Food", 0.45, -18, 0.8),
+    ("Entertainment", 0.2, -35, 1.0),
+    ("Utilities", 0.1, -70, 0.4),
+    ("Others", 0.15, -25, 1.2),
+    ("Rent", 0.04, -950, 0.1),
+    ("Salary", 0.06, 2800, 0.2),
+]
+DESCRIPTIONS = {
+    "Food": ["Supermarket", "Bakery", "Lunch", "Coffee", "Groceries", "Takeaway"],
+    "Entertainment": ["Cinema", "Concert", "Streaming", "Books", "Games"],
+    "Utilities": ["Electricity", "Water", "Internet", "Phone", "Gas"],
+    "Others": ["Pharmacy", "Clothes", "Gift", "Taxi", "Haircut", "Hardware store"],
+    "Rent": ["Rent"],
+    "Salary": ["Salary", "Bonus"],
+}
+
+
+def generate_transactions(size, seed=0, days_per_1000=120, end=None):
+    # Dates are spread evenly back from `end`, amounts are log-normal per
+    # category, and salaries are scaled so the running balance stays positive
+    rng = random.Random(seed)
+    end = end or date.today()
+    days = max(30, size * days_per_1000 // 1000)
+    start = end - timedelta(days=days)
+    names = [c[0] for c in CATEGORIES]
+    weights = [c[1] for c in CATEGORIES]
+    params = {c[0]: (c[2], c[3]) for c in CATEGORIES}
+    expected = sum(share * amount for name, share, amount, spread in CATEGORIES)
+    salary_scale = 1 + max(0, -expected) * 1.2 / (CATEGORIES[-1][1] * CATEGORIES[-1][2])
+
+    for i in range(size):
+        category = rng.choices(names, weights)[0]
+        typical, spread = params[category]
+        amount = abs(typical) * rng.lognormvariate(0, spread)
+        if typical > 0:
+            amount *= salary_scale
+        yield {
+            "id": i + 1,
+            "date": (start + timedelta(days=days * i // size)).strftime("%d-%m-%Y"),
+            "description": rng.choice(DESCRIPTIONS[category]),
+            "amount": round(amount if typical > 0 else -amount, 2),
+            "category": category
+        }
+
+
+def write_ledger(directory, size, seed=0):
+    # transactions.json and budgets.json in the app's own schema
+    transactions = list(generate_transactions(size, seed))
+    balance = round(sum(t["amount"] for t in transactions), 2)
+    write_json_atomic(os.path.join(directory, "transactions.json"), {"balance": balance, "transactions": transactions})
+    write_json_atomic(os.path.join(directory, "budgets.json"), {"Food": 1e12, "Entertainment": 1e12})
+    return balance
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(name, function, size, repeat, rows=None):
+    # Timed runs first, then one extra run under tracemalloc for the peak
+    # memory (tracing slows things down too much to time at the same time)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    total = sum(samples)
+    return {
+        "case": name,
+        "size": size,
+        "runs": repeat,
+        "rows_per_second": (rows if rows is not None else size) * repeat / total if total else None,
+        "p50_ms": percentile(samples, 0.5) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "max_ms": max(samples) * 1000,
+        "peak_memory_mb": peak / 1e6,
+    }
+
+
+class StubTree:
+    # Just enough of a Treeview for VirtualTable
+    def item(self, row, values=None):
+        self.values = values
+
+    def move(self, row, parent, index):
+        pass
+
+    def detach(self, row):
+        pass
+
+    def selection_set(self, items):
+        pass
+
+
+class StubScrollbar:
+    def set(self, first, last):
+        pass
+
+
+def stub_table(ledger, height=20):
+    from virtual_table import VirtualTable
+    table = VirtualTable.__new__(VirtualTable)
+    table.height = height
+    table.format_row = ledger.table_row
+    table.items = []
+    table.offset = 0
+    table.selected = None
+    table.tree = StubTree()
+    table.scrollbar = StubScrollbar()
+    table.rows = [f"row{slot}" for slot in range(height)]
+    return table
+
+
+def run_size(size, mode, repeat, seed, render):
+    directory = tempfile.mkdtemp(prefix="money-map-bench-")
+    results = []
+    try:
+        write_ledger(directory, size, seed)
+        rng = random.Random(seed)
+
+        def load():
+            Ledger(open_storage(mode, directory), save_delay=0).close()
+        # The first open migrates the JSON files for sqlite/partitioned/binary, which is not what is measured
+        load()
+        results.append(measure("load", load, size, max(1, repeat // 10)))
+
+        ledger = Ledger(open_storage(mode, directory), save_delay=0)
+        months = ledger.transactions.rollup.months()
+
+        def random_filter():
+            category = rng.choice([None] + [c[0] for c in CATEGORIES])
+            first, last = sorted(rng.sample(range(len(months)), 2)) if len(months) > 1 else (0, 0)
+            start = datetime(*months[first], 1)
+            end = datetime(*months[last], 28)
+            return ledger.filter(category, start, end)
+        results.append(measure("filter", random_filter, size, repeat))
+        words = ["sup", "bake*", "rent", "coffee food", "ga", "store"]
+        results.append(measure("search", lambda: ledger.filter(text=rng.choice(words)), size, repeat))
+
+        table = stub_table(ledger)
+        results.append(measure("update_ui", lambda: table.set_items(random_filter()), size, repeat))
+        results.append(measure("check_budget", lambda: ledger.check_budget("Food", 10), size, repeat * 10, rows=1))
+        results.append(measure("expense_totals", ledger.expense_totals, size, repeat))
+        results.append(measure("monthly_totals", ledger.monthly_totals, size, repeat))
+
+        if render:
+            import charts
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            # Drawn synchronously, where the app would schedule an idle redraw
+            fig = Figure(figsize=(6, 5))
+            canvas = FigureCanvasAgg(fig)
+
+            def render_report():
+                charts.draw_expense_chart(fig, ledger.expense_totals(), "pie")
+                canvas.draw()
+                charts.draw_category_trends_chart(fig, *ledger.category_trends())
+                canvas.draw()
+            results.append(measure("report_render", render_report, size, max(1, repeat // 10)))
+
+        export_file = os.path.join(directory, "export.csv")
+        results.append(measure("export_csv", lambda: ledger.export_csv(export_file), size, max(1, repeat // 10)))
+
+        def add_and_save():
+            year, month = months[-1]
+            ledger.add_transaction(f"15-{month:02d}-{year}", "Benchmark", "1.00", "Food", False)
+            ledger.flush()
+        results.append(measure("add_transaction_saved", add_and_save, size, repeat, rows=1))
+        ledger.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline_file, threshold):
+    # Prints p50 changes against an earlier run; returns the regressed cases
+    with open(baseline_file) as f:
+        baseline = {(r["case"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["case"], r["size"]))
+        if old is None:
+            continue
+        ratio = r["p50_ms"] / old["p50_ms"] if old["p50_ms"] else 1
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{r['case']:<22}{r['size']:>10}{old['p50_ms']:>12.3f}{r['p50_ms']:>12.3f}{ratio:>8.2f}x{flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Money Map on synthetic ledgers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--storage", choices=["json", "journal", "sqlite", "partitioned", "binary"], default="journal")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-render", action="store_true", help="skip the matplotlib report rendering")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("MPLCONFIGDIR", os.path.join(tempfile.gettempdir(), "money-map-matplotlib"))
+    results = []
+    print(f"{'case':<22}{'rows':>10}{'rows/s':>14}{'p50 ms':>12}{'p95 ms':>12}{'peak MB':>10}")
+    for size in args.sizes:
+        for r in run_size(size, args.storage, args.repeat, args.seed, not args.no_render):
+            results.append(r)
+            print(f"{r['case']:<22}{r['size']:>10}{r['rows_per_second'] or 0:>14.0f}"
+                  f"{r['p50_ms']:>12.3f}{r['p95_ms']:>12.3f}{r['peak_memory_mb']:>10.1f}")
+
+    if args.output:
+        write_json_atomic(args.output, {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "storage": args.storage,
+                "repeat": args.repeat,
+                "seed": args.seed,
+            },
+            "results": results,
+        })
+    if args.compare:
+        print(f"\n{'case':<22}{'rows':>10}{'old p50':>12}{'new p50':>12}{'ratio':>9}")
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# The report charts, drawn onto a matplotlib Figure from plain data. The
+# window draws them into Tk canvases and report.py into Agg canvases in worker
+# processes, so nothing here touches Tk, pyplot or the ledger.
+
+
+def month_label(period):
+    year, month = period
+    return f"{month:02d}-{year}"
+
+
+def draw_expense_chart(fig, expenses, kind="pie"):
+    # `expenses` is {category: euros}
+    fig.clear()
+    ax = fig.add_subplot()
+    if kind == "bar":
+        ax.bar(expenses.keys(), expenses.values(), color='skyblue')
+        ax.set_xlabel("Category")
+        ax.set_ylabel("Amount (€)")
+    else:
+        ax.pie(expenses.values(), labels=expenses.keys(), autopct="%1.1f%%", startangle=140)
+    ax.set_title("Expense Breakdown")
+
+
+def draw_budget_chart(fig, category, spent, remaining):
+    fig.clear()
+    ax = fig.add_subplot()
+    ax.pie([remaining, spent], labels=["Remaining", "Spent"], autopct="%1.1f%%", startangle=140)
+    ax.set_title(f"Budget Utilization for {category}")
+
+
+def draw_income_expense_chart(fig, monthly):
+    # `monthly` is [((year, month), income, expense), ...]
+    fig.clear()
+    ax = fig.add_subplot()
+    labels = [month_label(period) for period, income, expense in monthly]
+    positions = range(len(monthly))
+    ax.bar([x - 0.2 for x in positions], [income for _, income, _ in monthly], width=0.4,
+           label="Income", color="mediumseagreen")
+    ax.bar([x + 0.2 for x in positions], [expense for _, _, expense in monthly], width=0.4,
+           label="Expense", color="indianred")
+    ax.set_xticks(list(positions), labels, rotation=45, ha="right")
+    ax.set_title("Monthly Income vs Expense")
+    finish_trends_chart(fig, ax)
+
+
+def draw_category_trends_chart(fig, months, trends):
+    # `trends` is {category: [euros per month in `months`]}
+    fig.clear()
+    ax = fig.add_subplot()
+    labels = [month_label(period) for period in months]
+    for category, expenses in sorted(trends.items()):
+        ax.plot(labels, expenses, marker="o", label=category)
+    ax.tick_params(axis="x", rotation=45)
+    ax.set_title("Expenses by Category per Month")
+    finish_trends_chart(fig, ax)
+
+
+def draw_month_over_month_chart(fig, period, comparison):
+    # `comparison` is {category: (previous month, `period`)} in euros
+    fig.clear()
+    ax = fig.add_subplot()
+    categories = sorted(comparison)
+    positions = range(len(categories))
+    ax.bar([x - 0.2 for x in positions], [comparison[c][0] for c in categories], width=0.4,
+           label="Previous Month", color="lightgray")
+    ax.bar([x + 0.2 for x in positions], [comparison[c][1] for c in categories], width=0.4,
+           label=month_label(period), color="skyblue")
+    ax.set_xticks(list(positions), categories, rotation=45, ha="right")
+    ax.set_title("Month over Month Expenses")
+    finish_trends_chart(fig, ax)
+
+
+def finish_trends_chart(fig, ax):
+    ax.set_ylabel("Amount (€)")
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend()
+    fig.tight_layout()
+
+
+CHARTS = {
+    "expenses": draw_expense_chart,
+    "budget": draw_budget_chart,
+    "income_expense": draw_income_expense_chart,
+    "category_trends": draw_category_trends_chart,
+    "month_over_month": draw_month_over_month_chart,
+}
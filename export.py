@@ -0,0 +1,104 @@
+import csv
+import gzip
+import json
+import os
+import threading
+
+import perf
+
+CSV_HEADER = ["Date", "Description", "Amount", "Category"]
+
+
+def export_format(path):
+    # Picked from the file name: .csv.gz, .jsonl or plain CSV
+    if path.endswith(".gz"):
+        return "csv.gz"
+    if path.endswith(".jsonl"):
+        return "jsonl"
+    return "csv"
+
+
+def iter_transactions(store, ids=None):
+    # Transactions one at a time, all of them or just `ids` in the given order
+    if ids is None:
+        yield from store
+        return
+    slots = store.slots
+    for transaction_id in ids:
+        yield store.row(slots[transaction_id])
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def open_output(path, fmt):
+    if fmt == "csv.gz":
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    return open(path, "w", newline="", encoding="utf-8", buffering=1 << 20)
+
+
+class Export:
+    # Streams transactions to a file on a worker thread, `chunk_size` rows at a
+    # time, so only one chunk is ever held in memory. The Tk thread polls
+    # `done`/`total` for progress and may `cancel()` at any point. Output goes
+    # to a temporary file first, so a cancelled or failed export leaves no
+    # partial file behind and never clobbers an existing one.
+    def __init__(self, store, path, ids=None, fmt=None, chunk_size=10000):
+        self.store = store
+        self.path = path
+        self.ids = ids
+        self.fmt = fmt or export_format(path)
+        self.chunk_size = chunk_size
+        self.total = len(store) if ids is None else len(ids)
+        self.done = 0
+        self.cancelled = False
+        self.finished = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="money-map-export", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+        return self.finished
+
+    @perf.timed("export")
+    def run(self):
+        tmp_path = self.path + ".part"
+        try:
+            self.write(tmp_path)
+            if not self.cancelled:
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.error = e
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        self.finished = True
+
+    def write(self, path):
+        with open_output(path, self.fmt) as file:
+            writer = csv.writer(file) if self.fmt != "jsonl" else None
+            if writer:
+                writer.writerow(CSV_HEADER)
+            for chunk in chunked(iter_transactions(self.store, self.ids), self.chunk_size):
+                if self.cancelled:
+                    return
+                if writer:
+                    writer.writerows([t.date, t.description, t.amount, t.category] for t in chunk)
+                else:
+                    file.write("".join(json.dumps(t.to_dict()) + "\n" for t in chunk))
+                self.done += len(chunk)
+                perf.count("rows exported", len(chunk))
@@ -0,0 +1,172 @@
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import perf
+from transaction_store import to_cents
+
+DEFAULT_CATEGORY = "Others"
+
+# Tried in order, so day-first formats win over month-first ones
+DATE_FORMATS = ["%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y", "%Y/%m/%d", "%d-%m-%y", "%d/%m/%y", "%Y%m%d"]
+# Quicken writes US dates, sometimes with an apostrophe before the year
+QIF_DATE_FORMATS = ["%m/%d/%Y", "%m/%d/%y", "%m/%d'%y", "%m/%d'%Y", "%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"]
+
+CSV_COLUMNS = {
+    "date": {"date", "booking date", "transaction date", "posted date", "posting date", "value date"},
+    "description": {"description", "memo", "payee", "details", "narrative", "name", "reference"},
+    "amount": {"amount", "value", "sum"},
+    "debit": {"debit", "withdrawal", "withdrawals", "money out", "out"},
+    "credit": {"credit", "deposit", "deposits", "money in", "in"},
+    "category": {"category"},
+}
+
+
+def normalize_date(value, formats=DATE_FORMATS):
+    # Any of `formats` to the app's DD-MM-YYYY
+    value = value.strip()
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt).strftime("%d-%m-%Y")
+        except ValueError:
+            pass
+    raise ValueError(f"unrecognized date {value!r}")
+
+
+def parse_amount(value):
+    # Accepts currency signs, thousands separators, decimal commas and (negatives)
+    text = value.strip().replace("€", "").replace("$", "").replace("£", "").replace(" ", "")
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()")
+    if "," in text and "." in text:
+        # Whichever separator comes last is the decimal point
+        text = text.replace(".", "").replace(",", ".") if text.rfind(",") > text.rfind(".") else text.replace(",", "")
+    elif "," in text:
+        whole, _, fraction = text.rpartition(",")
+        text = f"{whole.replace(',', '')}.{fraction}" if len(fraction) <= 2 else text.replace(",", "")
+    amount = float(text)
+    return -amount if negative else amount
+
+
+def make_transaction(date, description, amount, category=None):
+    if not amount:
+        raise ValueError("zero amount")
+    # Rejects NaN, infinity and amounts too large for the ledger here, with the row's line number
+    to_cents(amount)
+    return {
+        "date": date,
+        "description": description.strip() or "Imported",
+        "amount": amount,
+        "category": (category or "").strip() or DEFAULT_CATEGORY
+    }
+
+
+def parse_csv(path):
+    rows, errors = [], []
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(file, dialect)
+        header = [name.strip().lower() for name in next(reader, [])]
+        columns = {key: next((i for i, name in enumerate(header) if name in names), None)
+                   for key, names in CSV_COLUMNS.items()}
+        if columns["date"] is None:
+            # No recognizable header: Date, Description, Amount[, Category] like our own export
+            columns = {"date": 0, "description": 1, "amount": 2, "debit": None, "credit": None, "category": 3}
+            file.seek(0)
+            reader = csv.reader(file, dialect)
+
+        def cell(row, key):
+            index = columns[key]
+            return row[index] if index is not None and index < len(row) else ""
+
+        for row in reader:
+            if not any(row):
+                continue
+            try:
+                if columns["amount"] is not None:
+                    amount = parse_amount(cell(row, "amount"))
+                else:
+                    credit, debit = cell(row, "credit"), cell(row, "debit")
+                    amount = (parse_amount(credit) if credit.strip() else 0) - \
+                             (abs(parse_amount(debit)) if debit.strip() else 0)
+                rows.append(make_transaction(normalize_date(cell(row, "date")), cell(row, "description"),
+                                             amount, cell(row, "category")))
+            except ValueError as e:
+                errors.append(f"{os.path.basename(path)}:{reader.line_num}: {e}")
+    return rows, errors
+
+
+def parse_ofx(path):
+    # The <STMTTRN> blocks of an OFX/QFX statement; SGML and XML flavours alike
+    rows, errors = [], []
+    with open(path, encoding="utf-8", errors="replace") as file:
+        content = file.read()
+    for number, block in enumerate(re.split(r"<STMTTRN>", content, flags=re.IGNORECASE)[1:], 1):
+        fields = {tag.upper(): value.strip() for tag, value in re.findall(r"<(\w+)>([^<\r\n]*)", block)}
+        try:
+            rows.append(make_transaction(normalize_date(fields.get("DTPOSTED", "")[:8], ["%Y%m%d"]),
+                                         fields.get("NAME") or fields.get("MEMO", ""),
+                                         parse_amount(fields.get("TRNAMT", ""))))
+        except ValueError as e:
+            errors.append(f"{os.path.basename(path)}: transaction {number}: {e}")
+    return rows, errors
+
+
+def parse_qif(path):
+    # D(ate), T/U (amount), P(ayee), M(emo) and L (category) lines; ^ ends a record
+    rows, errors = [], []
+    record = {}
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.rstrip("\r\n")
+            if not line or line.startswith("!"):
+                continue
+            if line.startswith("^"):
+                if record:
+                    try:
+                        category = record.get("L", "")
+                        rows.append(make_transaction(normalize_date(record.get("D", ""), QIF_DATE_FORMATS),
+                                                     record.get("P") or record.get("M", ""),
+                                                     parse_amount(record.get("T") or record.get("U", "")),
+                                                     "" if category.startswith("[") else category))
+                    except ValueError as e:
+                        errors.append(f"{os.path.basename(path)}:{line_number}: {e}")
+                record = {}
+            else:
+                record[line[0]] = line[1:]
+    return rows, errors
+
+
+PARSERS = {".csv": parse_csv, ".ofx": parse_ofx, ".qfx": parse_ofx, ".qif": parse_qif}
+
+
+def parse_file(path):
+    # Returns (rows, errors); runs in a worker process, so it only takes and returns plain data
+    parser = PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is None:
+        return [], [f"{os.path.basename(path)}: unsupported file type"]
+    try:
+        return parser(path)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        return [], [f"{os.path.basename(path)}: {e}"]
+
+
+@perf.timed("import.parse")
+def parse_files(paths):
+    # One (rows, errors) pair per path, in order; several files are parsed in parallel
+    if len(paths) < 2:
+        return [parse_file(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as pool:
+        return list(pool.map(parse_file, paths))
+
+
+def content_key(ordinal, description, cents):
+    # What makes two transactions the same for duplicate detection
+    return ordinal, description.strip().lower(), cents
@@ -0,0 +1,552 @@
+from collections import Counter
+from datetime import date, datetime
+
+import perf
+from export import Export
+from importer import content_key, parse_files
+from recurring import RecurringRule, first_occurrence
+from storage import WriteBehind, open_storage, record_keys
+from transaction_store import Transaction, TransactionStore, date_to_ordinal, from_cents, search_terms, to_cents
+
+
+class LedgerError(Exception):
+    # `title` is what the GUI puts on the error dialog; `index` is the failing
+    # entry of a batch (see add_transactions)
+    def __init__(self, message, title="Error"):
+        super().__init__(message)
+        self.title = title
+        self.index = None
+
+
+class ValidationError(LedgerError):
+    pass
+
+
+class InsufficientBalanceError(LedgerError):
+    def __init__(self):
+        super().__init__("Insufficient balance!")
+
+
+class BudgetExceededError(LedgerError):
+    def __init__(self, category, excess):
+        super().__init__(f"This purchase exceeds your {category} budget by €{excess:.2f}", title="Budget Exceeded")
+        self.category = category
+        self.excess = excess
+
+
+class NoBudgetError(LedgerError):
+    def __init__(self, category):
+        super().__init__(f"No budget set for {category}")
+        self.category = category
+
+
+def parse_date(date_str):
+    try:
+        return datetime.strptime(date_str, "%d-%m-%Y")
+    except ValueError:
+        raise ValidationError("Please use DD-MM-YYYY format", title="Invalid Date")
+
+
+def budget_amount(amount):
+    # A budget entered as text or a number, as a positive float
+    try:
+        amount = float(amount)
+        # Budgets are compared in cents, which rules out NaN and infinity too
+        to_cents(amount)
+    except ValueError:
+        amount = 0
+    if amount <= 0:
+        raise ValidationError("Please enter a positive number", title="Invalid Amount")
+    return amount
+
+
+def implies(term, old_term):
+    # Whether anything search term `term` matches is matched by `old_term` too
+    (text, prefix), (old_text, old_prefix) = term, old_term
+    if old_prefix:
+        return prefix and text.startswith(old_text)
+    return old_text in text
+
+
+def narrows(new, old):
+    # Whether filter `new` (category, start, end, search text) can only match
+    # a subset of what `old` matched; None is "All" / open-ended
+    category, start, end, text = new
+    old_category, old_start, old_end, old_text = old
+    terms = search_terms(text or "")
+    return ((old_category is None or category == old_category) and
+            (old_start is None or (start is not None and start >= old_start)) and
+            (old_end is None or (end is not None and end <= old_end)) and
+            all(any(implies(term, old_term) for term in terms) for old_term in search_terms(old_text or "")))
+
+
+class Ledger:
+    # Transactions, budgets and balance with all the rules around them, free of
+    # any GUI code so it can be scripted, batch-run and profiled headlessly.
+    # Every change, the recurring transaction rules included, is persisted
+    # through a background WriteBehind writer.
+    # Money is kept in integer cents internally; the public methods take and
+    # return euros. Other processes may save to the same files at the same
+    # time; poll_external() merges what they wrote.
+    def __init__(self, storage=None, save_delay=0.5):
+        self.storage = storage if storage is not None else open_storage()
+        self.balance_cents = 0
+        self.id_limit = 0
+        self.transactions = TransactionStore()
+        self.budgets = {}
+        self.rules = []
+        self.load()
+        self.writer = WriteBehind(self.storage, save_delay)
+
+    @perf.timed("load")
+    def load(self):
+        # Load transactions and budgets (snapshot plus any journaled changes)
+        balance, transactions, self.budgets = self.storage.load()
+        self.balance_cents = to_cents(balance)
+        # Binary snapshots hand over a ready-made store
+        self.transactions = transactions if isinstance(transactions, TransactionStore) else \
+            TransactionStore(transactions)
+        self.id_limit = 0
+        self.rules = [RecurringRule.from_dict(r) for r in sorted(self.storage.rules.values(), key=lambda r: r["id"])]
+        if hasattr(self.storage, "load_partition"):
+            # Years still on disk count in the rollup through their manifest totals
+            self.transactions.partitions = set(self.storage.loaded_years)
+            self.transactions.next_id = max(self.transactions.next_id, self.storage.manifest["next_id"])
+            for year in self.unloaded_years():
+                self.transactions.rollup.add_cells(self.storage.partition_cells(year))
+
+    def unloaded_years(self):
+        if self.transactions.partitions is None:
+            return []
+        return [year for year in self.storage.partition_years() if year not in self.transactions.partitions]
+
+    def load_years(self, first=None, last=None):
+        # Brings the partitioned years first..last (inclusive, open-ended if None) into memory
+        store = self.transactions
+        for year in self.unloaded_years():
+            if (first is None or year >= first) and (last is None or year <= last):
+                with perf.span("load_partition"):
+                    store.rollup.add_cells(self.storage.partition_cells(year), sign=-1)
+                    store.extend([Transaction.from_dict(t) for t in self.storage.load_partition(year)])
+                store.partitions.add(year)
+
+    def ensure_year(self, ordinal):
+        # A change dated `ordinal` needs its year in memory, so it is saved with the rest of that year
+        if self.transactions.partitions is not None:
+            year = date.fromordinal(ordinal).year
+            self.load_years(year, year)
+            self.transactions.partitions.add(year)
+
+    def claim_ids(self, count):
+        # New ids come from blocks the storage reserves, so processes sharing
+        # the files never hand out the same id twice
+        reserve = getattr(self.storage, "reserve_ids", None)
+        store = self.transactions
+        if reserve is not None and store.next_id + count > self.id_limit:
+            store.next_id, self.id_limit = reserve(store.next_id, count)
+
+    def poll_external(self):
+        # Merges the changes other processes saved since the last call, without
+        # re-reading the files unless they were rewritten. Returns whether
+        # anything changed. Idle, this is a few stat calls.
+        changed = getattr(self.storage, "changed", None)
+        if changed is None or not changed():
+            return False
+        # Our own queued changes go to disk first, so the journal order is final
+        self.flush()
+        records, reload = self.storage.changes()
+        if reload or any(record["op"] == "clear" for record in records):
+            self.load()
+            return True
+        written = self.storage.written
+        for record in records:
+            # Where this process changed the same thing later, its change is the one on disk
+            if all(written.get(key, 0) < record["seq"] for key in record_keys(record)):
+                self.apply_external(record)
+        return bool(records)
+
+    def apply_external(self, record):
+        # A journal record saved by another process, applied in memory only
+        op = record["op"]
+        store = self.transactions
+        if op in ("add", "add_many", "edit"):
+            # All converted before the balance or the store changes
+            transactions = [Transaction.from_dict(t) for t in record.get("transactions") or [record["transaction"]]]
+            new = []
+            for t in transactions:
+                self.balance_cents += t.cents
+                if t.id in store:
+                    self.balance_cents -= store.get(t.id).cents
+                    store.update(t.id, t)
+                else:
+                    new.append(t)
+            store.extend(new)
+            for progress in record.get("rules", ()):
+                rule = self.get_rule(progress["id"])
+                if rule is not None:
+                    rule.done = max(rule.done, progress["done"])
+        elif op == "delete":
+            if record["id"] in store:
+                self.balance_cents -= store.get(record["id"]).cents
+                store.remove(record["id"])
+        elif op == "set_budget":
+            self.budgets[record["category"]] = record["amount"]
+        elif op == "remove_budget":
+            self.budgets.pop(record["category"], None)
+        elif op == "set_rule":
+            rule = RecurringRule.from_dict(record["rule"])
+            self.rules = sorted([r for r in self.rules if r.id != rule.id] + [rule], key=lambda r: r.id)
+        elif op == "remove_rule":
+            self.rules = [r for r in self.rules if r.id != record["id"]]
+
+    @property
+    def balance(self):
+        return from_cents(self.balance_cents)
+
+    def snapshot(self):
+        return self.balance, self.transactions.copy(), dict(self.budgets)
+
+    def save(self, record=None):
+        # Queued for the background writer; journaled storage appends `record`,
+        # a full save happens when it is None
+        snapshot = self.snapshot() if self.storage.needs_snapshot(record) else None
+        self.writer.submit(record, snapshot)
+
+    def flush(self):
+        return self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+        self.storage.close(self.balance, self.transactions, self.budgets)
+
+    def validate(self, date_str, description, amount):
+        # Returns the date as an ordinal and the amount as positive cents
+        if not all([description, amount, date_str]):
+            raise ValidationError("Please fill in all fields.")
+        try:
+            # Validate date format
+            date_obj = datetime.strptime(date_str, "%d-%m-%Y")
+            cents = to_cents(amount)
+            if cents <= 0:
+                raise ValueError("Amount must be positive.")
+        except ValueError as e:
+            raise ValidationError(f"Invalid input: {str(e)}")
+        return date_obj.toordinal(), cents
+
+    def get(self, transaction_id):
+        return self.transactions.get(transaction_id)
+
+    def table_row(self, transaction_id):
+        # The values the transaction table shows for a transaction
+        t = self.transactions.get(transaction_id)
+        transaction_type = "Income" if t.cents > 0 else "Expense"
+        return (t.date, t.description, f"€{t.amount:.2f}", t.category, transaction_type)
+
+    def add_transaction(self, date_str, description, amount, category, is_income):
+        ordinal, cents = self.validate(date_str, description, amount)
+
+        if not is_income and cents > self.balance_cents:
+            raise InsufficientBalanceError()
+
+        # Check budget
+        if not is_income:
+            self.check_budget_cents(category, cents)
+
+        cents = cents if is_income else -cents
+        self.balance_cents += cents
+        self.ensure_year(ordinal)
+        self.claim_ids(1)
+        transaction_id = self.transactions.append(Transaction(None, ordinal, description, cents, category))
+        self.save({"op": "add", "transaction": self.get(transaction_id).to_dict()})
+        return transaction_id
+
+    def edit_transaction(self, transaction_id, date_str, description, amount, category, is_income):
+        ordinal, cents = self.validate(date_str, description, amount)
+
+        old_cents = self.get(transaction_id).cents
+        if not is_income and cents > self.balance_cents + abs(old_cents):
+            raise InsufficientBalanceError()
+
+        # Check budget
+        if not is_income:
+            self.check_budget_cents(category, cents)
+
+        # Update transaction
+        new_cents = cents if is_income else -cents
+        self.balance_cents += new_cents - old_cents
+        self.ensure_year(ordinal)
+
+        self.transactions.update(transaction_id, Transaction(transaction_id, ordinal, description, new_cents, category))
+        self.save({"op": "edit", "transaction": self.get(transaction_id).to_dict()})
+
+    def delete_transaction(self, transaction_id):
+        self.balance_cents -= self.get(transaction_id).cents
+        self.transactions.remove(transaction_id)
+        self.save({"op": "delete", "id": transaction_id})
+
+    def find_duplicates(self, batches):
+        # Splits parsed statement rows (one list per file) into (new, duplicates).
+        # A row is a duplicate when the ledger, or an earlier file, already has
+        # as many identical transactions; repeats within one file are kept.
+        for year in {int(t["date"][-4:]) for rows in batches for t in rows}:
+            self.load_years(year, year)
+        seen = Counter(content_key(ordinal, description, cents)
+                       for transaction_id, ordinal, description, cents in zip(
+                           self.transactions.ids, self.transactions.dates,
+                           self.transactions.descriptions, self.transactions.cents)
+                       if transaction_id)
+        new, duplicates = [], []
+        for rows in batches:
+            in_file = Counter()
+            for t in rows:
+                key = content_key(date_to_ordinal(t["date"]), t["description"], to_cents(t["amount"]))
+                in_file[key] += 1
+                (duplicates if in_file[key] <= seen[key] else new).append(t)
+            for key, count in in_file.items():
+                seen[key] = max(seen[key], count)
+        return new, duplicates
+
+    def budget_excess(self, transactions):
+        # {category: euros over budget} if all of `transactions` were added
+        expenses = Counter()
+        for t in transactions:
+            if t.cents < 0 and t.category in self.budgets:
+                expenses[t.category] -= t.cents
+        excess = {}
+        for category, spent in expenses.items():
+            remaining = self.budget_remaining_cents(category)
+            if spent > remaining:
+                excess[category] = from_cents(spent - remaining)
+        return excess
+
+    @perf.timed("import")
+    def import_transactions(self, transactions, allow_over_budget=False):
+        # Adds a batch of signed transactions (dicts in the JSON file format)
+        # with one budget pass and one save; nothing is added if any is invalid
+        rows = []
+        for t in transactions:
+            ordinal, cents = self.validate(t["date"], t["description"], abs(t["amount"]))
+            rows.append(Transaction(None, ordinal, t["description"], cents if t["amount"] > 0 else -cents,
+                                    t["category"]))
+        return self.add_rows(rows, allow_over_budget)
+
+    def add_rows(self, rows, allow_over_budget=False, rules=None):
+        # Adds validated Transactions after one balance and budget check of the
+        # whole batch, with one save; returns their ids. `rules` is the
+        # [{"id", "done"}, ...] progress of the recurring rules they come from,
+        # saved in the same record.
+        balance_cents = self.balance_cents + sum(t.cents for t in rows)
+        if balance_cents < 0:
+            raise InsufficientBalanceError()
+
+        excess = self.budget_excess(rows)
+        if excess and not allow_over_budget:
+            category = max(excess, key=excess.get)
+            raise BudgetExceededError(category, excess[category])
+
+        self.balance_cents = balance_cents
+        for ordinal in {t.ordinal for t in rows}:
+            self.ensure_year(ordinal)
+        self.claim_ids(len(rows))
+        ids = self.transactions.extend(rows)
+        record = {"op": "add_many", "transactions": [self.get(i).to_dict() for i in ids]}
+        if rules:
+            record["rules"] = rules
+        self.save(record)
+        return ids
+
+    @perf.timed("add_transactions")
+    def add_transactions(self, entries):
+        # add_transaction() for each (date_str, description, amount, category,
+        # is_income) in turn, with the same checks against the balance and
+        # budgets the earlier entries leave, but one save for all of them.
+        # Nothing is added if any entry fails; the error's `index` says which.
+        rows = []
+        balance_cents = self.balance_cents
+        spent = Counter()
+        for index, (date_str, description, amount, category, is_income) in enumerate(entries):
+            try:
+                ordinal, cents = self.validate(date_str, description, amount)
+                if not is_income:
+                    if cents > balance_cents:
+                        raise InsufficientBalanceError()
+                    spent[category] += cents
+                    self.check_budget_cents(category, spent[category])
+            except LedgerError as e:
+                e.index = index
+                raise
+            cents = cents if is_income else -cents
+            balance_cents += cents
+            rows.append(Transaction(None, ordinal, description, cents, category))
+        if not rows:
+            return []
+
+        self.balance_cents = balance_cents
+        for ordinal in {t.ordinal for t in rows}:
+            self.ensure_year(ordinal)
+        self.claim_ids(len(rows))
+        ids = self.transactions.extend(rows)
+        self.save({"op": "add_many", "transactions": [self.get(i).to_dict() for i in ids]})
+        return ids
+
+    def import_files(self, paths, allow_over_budget=False):
+        # Parse, drop duplicates and import; returns (ids, duplicates, errors)
+        results = parse_files(paths)
+        new, duplicates = self.find_duplicates([rows for rows, errors in results])
+        ids = self.import_transactions(new, allow_over_budget)
+        return ids, duplicates, [error for rows, errors in results for error in errors]
+
+    def clear(self):
+        self.transactions = TransactionStore()
+        self.budgets = {}
+        self.balance_cents = 0
+        self.rules = []
+        self.save({"op": "clear"})
+
+    def set_budget(self, category, amount):
+        amount = budget_amount(amount)
+        self.budgets[category] = amount
+        self.save({"op": "set_budget", "category": category, "amount": amount})
+
+    def remove_budget(self, category):
+        # Returns whether there was a budget to remove
+        if category not in self.budgets:
+            return False
+        del self.budgets[category]
+        self.save({"op": "remove_budget", "category": category})
+        return True
+
+    def add_rule(self, description, amount, category, is_income, day, interval=1, start_date=None, end_date=None):
+        # A transaction repeated every `interval` months on day `day`, from the
+        # first such day on or after `start_date` (default today) until
+        # `end_date`. Occurrences are added by materialize_recurring().
+        start_date = start_date or date.today().strftime("%d-%m-%Y")
+        start, cents = self.validate(start_date, description, amount)
+        try:
+            day, interval = int(day), int(interval)
+        except ValueError:
+            day = interval = 0
+        if not 1 <= day <= 31 or interval < 1:
+            raise ValidationError("Day must be 1-31 and the interval at least one month", title="Invalid Rule")
+        end = parse_date(end_date).toordinal() if end_date else None
+        start = first_occurrence(start, day)
+        if end is not None and end < start:
+            raise ValidationError("The end date is before the first occurrence", title="Invalid Rule")
+        # The id comes from the storage, so processes sharing the files never hand out the same one
+        rule_id = self.storage.next_rule_id(max((r.id for r in self.rules), default=0))
+        rule = RecurringRule(rule_id, description, cents if is_income else -cents, category, day, interval, start, end)
+        self.rules.append(rule)
+        self.save({"op": "set_rule", "rule": rule.to_dict()})
+        return rule
+
+    def get_rule(self, rule_id):
+        return next((rule for rule in self.rules if rule.id == rule_id), None)
+
+    def remove_rule(self, rule_id):
+        # Returns whether there was such a rule; transactions it added stay
+        rules = [rule for rule in self.rules if rule.id != rule_id]
+        if len(rules) == len(self.rules):
+            return False
+        self.rules = rules
+        self.save({"op": "remove_rule", "id": rule_id})
+        return True
+
+    def recurring_due(self, until=None):
+        # Whether any rule has an occurrence up to `until` (an ordinal, default today) still to add
+        until = until or date.today().toordinal()
+        return any(next_date is not None and next_date <= until for next_date in
+                   (rule.next_date() for rule in self.rules))
+
+    @perf.timed("recurring")
+    def materialize_recurring(self, until=None, allow_over_budget=False):
+        # Adds every occurrence due up to `until` (default today), however many
+        # periods were missed, as one batch: one balance and budget check, one
+        # save that also records how far each rule got. Returns the new ids.
+        # Occurrences another process already added are picked up first.
+        self.poll_external()
+        until = until or date.today().toordinal()
+        due = [(rule, rule.due(until)) for rule in self.rules]
+        rows = sorted((t for rule, dates in due for t in rule.transactions(dates)), key=lambda t: t.ordinal)
+        if not rows:
+            return []
+        for rule, dates in due:
+            rule.done += len(dates)
+        try:
+            return self.add_rows(rows, allow_over_budget,
+                                 [{"id": rule.id, "done": rule.done} for rule, dates in due if dates])
+        except LedgerError:
+            for rule, dates in due:
+                rule.done -= len(dates)
+            raise
+
+    def budget_remaining_cents(self, category):
+        return to_cents(self.budgets[category]) - self.transactions.rollup.spent(category)
+
+    def check_budget(self, category, amount):
+        self.check_budget_cents(category, to_cents(abs(amount)))
+
+    def check_budget_cents(self, category, cents):
+        if category in self.budgets:
+            remaining = self.budget_remaining_cents(category)
+            if cents > remaining:
+                raise BudgetExceededError(category, from_cents(cents - remaining))
+
+    def budget_utilization(self, category):
+        # Returns (spent, remaining) for a category with a budget
+        if category not in self.budgets:
+            raise NoBudgetError(category)
+        return self.spent_in_category(category), from_cents(max(0, self.budget_remaining_cents(category)))
+
+    @perf.timed("filter")
+    def filter(self, category=None, start=None, end=None, text=None, within=None):
+        # Ids of the matching transactions; `start` and `end` are inclusive datetimes
+        # and `text` searches the descriptions and categories (see search_terms).
+        # `within` is an earlier result that this filter `narrows`: only its rows
+        # are checked again. Filters are always answered from memory, which
+        # holds the changes the background writer has not saved yet.
+        if within is not None:
+            return self.transactions.refine(within, category, start, end, text)
+        self.load_years(start.year if start is not None else None, end.year if end is not None else None)
+        return self.transactions.select(category, start, end, text=text)
+
+    def spent_in_category(self, category, period=None):
+        # Running totals, constant time however long the ledger is
+        return from_cents(self.transactions.rollup.spent(category, period))
+
+    @perf.timed("report.expense_totals")
+    def expense_totals(self):
+        return {category: from_cents(cents) for category, cents in self.transactions.rollup.totals().items()}
+
+    @perf.timed("report.monthly_totals")
+    def monthly_totals(self):
+        # [((year, month), income, expense), ...] straight from the rollup
+        return [(period, from_cents(income), from_cents(expense))
+                for period, income, expense in self.transactions.rollup.monthly_totals()]
+
+    @perf.timed("report.category_trends")
+    def category_trends(self):
+        months, trends = self.transactions.rollup.category_trends()
+        return months, {category: [from_cents(cents) for cents in series] for category, series in trends.items()}
+
+    @perf.timed("report.compare_periods")
+    def compare_periods(self, period, previous=None):
+        # Expense per category in `period` against `previous` (default: the month before)
+        if previous is None:
+            year, month = period
+            previous = (year, month - 1) if month > 1 else (year - 1, 12)
+        return {category: (from_cents(before), from_cents(after))
+                for category, (before, after) in self.transactions.rollup.compare(period, previous).items()}
+
+    def export(self, file_path, ids=None, fmt=None):
+        # Starts a background Export of all transactions, or of `ids` (e.g. the
+        # current filter result), from a frozen copy of the ledger
+        if ids is None:
+            self.load_years()
+        store = self.transactions.copy(with_slots=ids is not None)
+        return Export(store, file_path, ids[:] if ids is not None else None, fmt).start()
+
+    def export_csv(self, file_path, ids=None):
+        export = self.export(file_path, ids, "csv")
+        export.wait()
+        if export.error is not None:
+            raise export.error
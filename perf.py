@@ -0,0 +1,137 @@
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from functools import wraps
+
+# Timing spans and counters for the hot paths. Off by default: a disabled
+# span is one flag check, so the instrumentation can stay in place for good.
+# MONEY_MAP_PERF=1 turns it on at startup, MONEY_MAP_TRACE=<file> also
+# appends every span to a JSON-lines trace, and the Performance window
+# (Ctrl+Shift+P) can switch it on at any time.
+
+enabled = False
+spans = defaultdict(lambda: deque(maxlen=1000))
+counters = defaultdict(int)
+trace_file = None
+trace_lock = threading.Lock()
+profiler = None
+
+
+def enable(trace_path=None):
+    global enabled, trace_file
+    enabled = True
+    if trace_path and trace_file is None:
+        trace_file = open(trace_path, "a", buffering=1 << 16)
+        atexit.register(trace_file.close)
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    spans.clear()
+    counters.clear()
+
+
+def record(name, start, duration):
+    spans[name].append(duration)
+    if trace_file is not None:
+        line = json.dumps({"name": name, "start": start, "ms": duration * 1000,
+                           "thread": threading.current_thread().name})
+        with trace_lock:
+            trace_file.write(line + "\n")
+
+
+class Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, self.start, time.perf_counter() - self.start)
+
+
+NO_SPAN = nullcontext()
+
+
+def span(name):
+    # with perf.span("render"): ...
+    return Span(name) if enabled else NO_SPAN
+
+
+def timed(name):
+    # Decorator form of `span`
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, start, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    if enabled:
+        counters[name] += amount
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summary():
+    # [(name, calls, last_ms, p50_ms, p95_ms, max_ms)] over the recent spans of each name
+    rows = []
+    for name, durations in sorted(spans.items()):
+        recent = list(durations)
+        if not recent:
+            continue
+        ordered = sorted(recent)
+        rows.append((name, len(recent), recent[-1] * 1000, percentile(ordered, 0.5) * 1000,
+                     percentile(ordered, 0.95) * 1000, ordered[-1] * 1000))
+    return rows
+
+
+def start_profile():
+    # cProfile of the calling (Tk) thread until stop_profile()
+    global profiler
+    if profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def stop_profile(path=None, limit=25):
+    # Saves the raw profile to `path` if given and returns the top functions as text
+    global profiler
+    if profiler is None:
+        return ""
+    profiler.disable()
+    if path:
+        profiler.dump_stats(path)
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+    profiler = None
+    return output.getvalue()
+
+
+if os.environ.get("MONEY_MAP_PERF") or os.environ.get("MONEY_MAP_TRACE"):
+    enable(os.environ.get("MONEY_MAP_TRACE"))
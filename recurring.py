@@ -0,0 +1,86 @@
+import calendar
+import sys
+from datetime import date
+
+from transaction_store import Transaction, date_to_ordinal, from_cents, ordinal_to_date, to_cents
+
+
+def month_day(year, month, day):
+    # `day` of the month, or its last day when the month is shorter
+    return date(year, month, min(day, calendar.monthrange(year, month)[1])).toordinal()
+
+
+def first_occurrence(start, day):
+    # Ordinal of the first `day`-of-month on or after the ordinal `start`
+    first = date.fromordinal(start)
+    ordinal = month_day(first.year, first.month, day)
+    if ordinal < start:
+        year, month = divmod(first.year * 12 + first.month, 12)
+        ordinal = month_day(year, month + 1, day)
+    return ordinal
+
+
+class RecurringRule:
+    # A transaction repeated every `interval` months on day `day`, from the
+    # occurrence dated `start` up to `end` (ordinals; no end if None). The
+    # first `done` occurrences are already in the ledger.
+    def __init__(self, rule_id, description, cents, category, day, interval, start, end=None, done=0):
+        self.id = rule_id
+        self.description = description
+        self.cents = cents
+        self.category = category
+        self.day = day
+        self.interval = interval
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def amount(self):
+        return from_cents(self.cents)
+
+    def occurrence(self, index):
+        # Ordinal of occurrence number `index`, counting from 0
+        first = date.fromordinal(self.start)
+        year, month = divmod(first.year * 12 + first.month - 1 + index * self.interval, 12)
+        return month_day(year, month + 1, self.day)
+
+    def next_date(self):
+        # Ordinal of the next occurrence still to be added, None once the rule has ended
+        ordinal = self.occurrence(self.done)
+        return ordinal if self.end is None or ordinal <= self.end else None
+
+    def due(self, until):
+        # Ordinals of the occurrences up to `until` that are not in the ledger yet
+        last = until if self.end is None else min(until, self.end)
+        dates = []
+        ordinal = self.occurrence(self.done)
+        while ordinal <= last:
+            dates.append(ordinal)
+            ordinal = self.occurrence(self.done + len(dates))
+        return dates
+
+    def transactions(self, dates):
+        return [Transaction(None, ordinal, self.description, self.cents, self.category) for ordinal in dates]
+
+    @classmethod
+    def from_dict(cls, r):
+        return cls(r["id"], sys.intern(r["description"]), to_cents(r["amount"]), sys.intern(r["category"]),
+                   r["day"], r["interval"], date_to_ordinal(r["start"]),
+                   date_to_ordinal(r["end"]) if r.get("end") else None, r.get("done", 0))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "description": self.description,
+            "amount": self.amount,
+            "category": self.category,
+            "day": self.day,
+            "interval": self.interval,
+            "start": ordinal_to_date(self.start),
+            "end": ordinal_to_date(self.end) if self.end is not None else None,
+            "done": self.done
+        }
+
+    def __repr__(self):
+        return f"RecurringRule({self.to_dict()})"
@@ -0,0 +1,200 @@
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import perf
+from charts import CHARTS, month_label
+from ledger import Ledger
+from storage import open_storage
+
+# Month-end report packs without a display: the expense breakdown, the
+# utilization of every budget and the monthly summaries of one or more
+# ledgers, rendered with matplotlib's Agg backend. Loading the ledgers and
+# drawing the charts are both spread over a process pool, one ledger or one
+# chart per task, so a pack for many ledgers scales with the cores.
+#
+#   python report.py -o report.pdf                   this ledger, one PDF
+#   python report.py clients/* -o reports/           a PNG per chart and ledger
+#   python report.py -o reports/ --format svg --month 09-2025
+#
+# For a single PDF every page is drawn and compressed by a worker as an
+# image, and the pages are put together in order. Vector output would have
+# to be written by one process; a directory of .pdf or .svg charts is.
+
+FIGURE_SIZE = (8, 6)
+# Months shown in the income/expense and category trend charts
+TREND_MONTHS = 12
+
+
+def report_charts(directory, mode, month=None, trend_months=TREND_MONTHS):
+    # Runs in a worker process: loads the ledger in `directory` and returns
+    # [(name, chart, args), ...] for the charts of the report month (the
+    # latest month with transactions unless given as (year, month))
+    ledger = Ledger(open_storage(mode, directory, read_only=True), save_delay=0)
+    try:
+        charts = []
+        expenses = ledger.expense_totals()
+        if expenses:
+            charts.append(("expenses", "expenses", (expenses,)))
+        for category in sorted(ledger.budgets):
+            charts.append((f"budget-{slug(category)}", "budget", (category, *ledger.budget_utilization(category))))
+
+        months = ledger.transactions.rollup.months()
+        if months:
+            month = month or months[-1]
+            monthly = [row for row in ledger.monthly_totals() if row[0] <= month][-trend_months:]
+            charts.append(("income-expense", "income_expense", (monthly,)))
+            periods, trends = ledger.category_trends()
+            shown = [i for i, period in enumerate(periods) if period <= month][-trend_months:]
+            charts.append(("category-trends", "category_trends", ([periods[i] for i in shown],
+                                               {category: [series[i] for i in shown]
+                                                for category, series in trends.items()})))
+            charts.append(("month-over-month", "month_over_month", (month, ledger.compare_periods(month))))
+        return charts
+    finally:
+        # The storage is read-only, so closing writes nothing; it only lets go
+        # of the database connection
+        ledger.close()
+
+
+def slug(text):
+    return re.sub(r"\W+", "-", text.lower()).strip("-") or "chart"
+
+
+def render_chart(task):
+    # Runs in a worker process: draws one chart with Agg. Returns the file
+    # content for `fmt`, or for "page" (width, height, zlib-compressed RGB
+    # pixels) to go into write_pdf().
+    chart, args, title, fmt, dpi = task
+    import numpy as np
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIGURE_SIZE, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    CHARTS[chart](fig, *args)
+    if title:
+        fig.suptitle(title, fontsize="small", x=0.01, ha="left")
+    if fmt == "page":
+        canvas.draw()
+        pixels = np.asarray(canvas.buffer_rgba())
+        return pixels.shape[1], pixels.shape[0], zlib.compress(pixels[..., :3].tobytes())
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi)
+    return buffer.getvalue()
+
+
+def write_pdf(path, pages, dpi):
+    # A PDF with one full-page image per render_chart() "page", in order.
+    # Objects 1 and 2 are the catalog and page tree, then each page is a page
+    # object, its image and its content stream.
+    offsets = {}
+    kids = []
+    with open(path + ".tmp", "wb") as f:
+        def write_object(number, content, stream=None):
+            offsets[number] = f.tell()
+            if stream is not None:
+                content = f"{content[:-2]}/Length {len(stream)} >>"
+            f.write(f"{number} 0 obj\n{content}\n".encode("ascii"))
+            if stream is not None:
+                f.write(b"stream\n" + stream + b"\nendstream\n")
+            f.write(b"endobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        for width, height, pixels in pages:
+            number = 3 + 3 * len(kids)
+            width_pt, height_pt = f"{width * 72 / dpi:.2f}", f"{height * 72 / dpi:.2f}"
+            write_object(number, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] "
+                                 f"/Resources << /XObject << /Im0 {number + 1} 0 R >> >> /Contents {number + 2} 0 R >>")
+            write_object(number + 1, f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                     f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode >>", pixels)
+            write_object(number + 2, "<< >>", f"q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q".encode("ascii"))
+            kids.append(f"{number} 0 R")
+        write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(2, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>")
+
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode("ascii"))
+        for number in sorted(offsets):
+            f.write(f"{offsets[number]:010d} 00000 n \n".encode("ascii"))
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+    os.replace(path + ".tmp", path)
+
+
+def ledger_name(directory):
+    return os.path.basename(os.path.normpath(os.path.abspath(directory)))
+
+
+@perf.timed("report")
+def build_report(directories, output, mode="journal", month=None, fmt="png", dpi=150, workers=None,
+                 trend_months=TREND_MONTHS):
+    # Writes the report of every ledger directory to `output`: one PDF if it
+    # ends in .pdf, otherwise a directory with an image per chart (in a
+    # subdirectory per ledger when there are several). Returns the paths written.
+    single_pdf = output.lower().endswith(".pdf")
+    names = [ledger_name(directory) for directory in directories]
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        ledgers = list(pool.map(report_charts, directories, [mode] * len(directories), [month] * len(directories),
+                                [trend_months] * len(directories)))
+        tasks, paths = [], []
+        for name, charts in zip(names, ledgers):
+            title = name if len(directories) > 1 else None
+            folder = os.path.join(output, name) if len(directories) > 1 else output
+            for number, (chart_name, chart, args) in enumerate(charts, 1):
+                tasks.append((chart, args, title, "page" if single_pdf else fmt, dpi))
+                paths.append(os.path.join(folder, f"{number:02d}-{chart_name}.{fmt}"))
+        if not tasks:
+            raise ValueError("Nothing to report: no transactions or budgets")
+        images = pool.map(render_chart, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+
+        if single_pdf:
+            write_pdf(output, images, dpi)
+            return [output]
+        for path, image in zip(paths, images):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(image)
+        return paths
+
+
+def parse_month(value):
+    try:
+        parsed = datetime.strptime(value, "%m-%Y")
+    except ValueError:
+        raise argparse.ArgumentTypeError("use MM-YYYY")
+    return parsed.year, parsed.month
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Money Map reports to PNG/PDF without a display")
+    parser.add_argument("ledgers", nargs="*", default=["."], help="ledger directories (default: this one)")
+    parser.add_argument("-o", "--output", required=True, help="a .pdf file, or a directory for one image per chart")
+    parser.add_argument("--format", choices=["png", "pdf", "svg"], default="png", help="image format in a directory")
+    parser.add_argument("--month", type=parse_month, help="report month as MM-YYYY (default: the latest)")
+    parser.add_argument("--months", type=int, default=TREND_MONTHS, help="months shown in the trend charts")
+    parser.add_argument("--storage", choices=["json", "journal", "sqlite", "partitioned", "binary"],
+                        default=os.environ.get("MONEY_MAP_STORAGE", "journal"))
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("MPLCONFIGDIR", os.path.join(tempfile.gettempdir(), "money-map-matplotlib"))
+    try:
+        paths = build_report(args.ledgers, args.output, args.storage, args.month, args.format, args.dpi,
+                             args.workers, args.months)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    month = f" for {month_label(args.month)}" if args.month else ""
+    print(f"{len(paths)} file(s) written{month}: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
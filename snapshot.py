@@ -0,0 +1,239 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+import perf
+from transaction_store import Transaction, TransactionStore
+
+try:
+    import numpy as np
+except ImportError:  # Records are packed and unpacked one by one instead
+    np = None
+
+# Binary snapshot of the transactions, a fraction of the size of the JSON file
+# and loadable without parsing:
+#
+#   header    magic, version, record size, balance (cents), journal seq,
+#             record count, category count, string table size, CRC-32 of
+#             everything after the header
+#   records   one fixed-width record per transaction: id, date ordinal,
+#             amount in cents, category number, description offset
+#   categories  string table offset of each category name
+#   strings   every distinct description and category name once, as a
+#             4-byte length and UTF-8 bytes
+#
+# All integers are little-endian. Any record can be read straight from the
+# memory map, and the whole table is copied into columns in a few passes.
+#
+#   python snapshot.py to-binary transactions.json transactions.bin
+#   python snapshot.py to-json transactions.bin transactions.json
+
+MAGIC = b"MMAP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHqqQIQI")
+RECORD = struct.Struct("<qiqiI")
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<I")
+
+if np is not None:
+    RECORD_DTYPE = np.dtype({"names": ["id", "ordinal", "cents", "category", "description"],
+                             "formats": ["<i8", "<i4", "<i8", "<i4", "<u4"],
+                             "offsets": [0, 8, 12, 20, 24], "itemsize": RECORD.size})
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class StringTable:
+    # Appends each distinct string once and hands out its byte offset
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, text):
+        offset = self.offsets.get(text)
+        if offset is None:
+            offset = self.offsets[text] = len(self.data)
+            encoded = text.encode("utf-8")
+            self.data += LENGTH.pack(len(encoded))
+            self.data += encoded
+        return offset
+
+
+def snapshot_columns(transactions):
+    # (ids, dates, cents, categories, category names, descriptions) of the live
+    # rows of a TransactionStore, or of a list of dicts in the JSON file format
+    if not isinstance(transactions, TransactionStore):
+        store = TransactionStore()
+        for t in transactions:
+            store.append_columns(Transaction.from_dict(t))
+        transactions = store
+    columns = (transactions.ids, transactions.dates, transactions.cents, transactions.categories)
+    descriptions = transactions.descriptions
+    if transactions.dead:
+        alive = [bool(transaction_id) for transaction_id in transactions.ids]
+        columns = tuple(array(column.typecode, (value for value, keep in zip(column, alive) if keep))
+                        for column in columns)
+        descriptions = [description for description, keep in zip(descriptions, alive) if keep]
+    return (*columns, transactions.category_names, descriptions)
+
+
+def write_snapshot(path, balance_cents, transactions, journal_seq=0):
+    # Written to a temp file and moved into place, like the JSON files
+    ids, dates, cents, categories, category_names, descriptions = snapshot_columns(transactions)
+    strings = StringTable()
+    category_offsets = array("I", [strings.add(name) for name in category_names])
+    distinct = dict.fromkeys(descriptions)
+    for description in distinct:
+        distinct[description] = strings.add(description)
+
+    if np is not None:
+        table = np.empty(len(ids), dtype=RECORD_DTYPE)
+        table["id"] = np.frombuffer(ids, dtype=np.int64)
+        table["ordinal"] = np.frombuffer(dates, dtype=np.intc)
+        table["cents"] = np.frombuffer(cents, dtype=np.int64)
+        table["category"] = np.frombuffer(categories, dtype=np.intc)
+        table["description"] = np.fromiter(map(distinct.__getitem__, descriptions), dtype=np.uint32,
+                                           count=len(descriptions))
+        records = table.tobytes()
+    else:
+        records = b"".join(map(RECORD.pack, ids, dates, cents, categories, map(distinct.__getitem__, descriptions)))
+
+    checksum = 0
+    for part in (records, category_offsets, strings.data):
+        checksum = zlib.crc32(part, checksum)
+    header = HEADER.pack(MAGIC, VERSION, RECORD.size, balance_cents, journal_seq, len(ids),
+                         len(category_names), len(strings.data), checksum)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for part in (header, records, category_offsets, strings.data):
+            f.write(part)
+        f.flush()
+        perf.count("bytes written", f.tell())
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    # Read-only view of a snapshot file through a memory map. Opening it only
+    # checks the header and checksum; records are decoded when asked for.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise SnapshotError(f"{path}: empty file")
+        try:
+            self.check(path)
+        except SnapshotError:
+            self.close()
+            raise
+
+    def check(self, path):
+        if len(self.map) < HEADER.size:
+            raise SnapshotError(f"{path}: not a Money Map snapshot")
+        (magic, version, record_size, self.balance_cents, self.journal_seq, self.count,
+         category_count, strings_size, checksum) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise SnapshotError(f"{path}: not a Money Map snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"{path}: unsupported snapshot version {version}")
+        self.categories_offset = HEADER.size + self.count * RECORD.size
+        self.strings_offset = self.categories_offset + category_count * OFFSET.size
+        if self.strings_offset + strings_size != len(self.map):
+            raise SnapshotError(f"{path}: truncated snapshot")
+        with memoryview(self.map) as view:
+            if zlib.crc32(view[HEADER.size:]) != checksum:
+                raise SnapshotError(f"{path}: checksum mismatch")
+        self.category_names = [sys.intern(self.string(offset)) for (offset,) in
+                               OFFSET.iter_unpack(self.map[self.categories_offset:self.strings_offset])]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if not self.map.closed:
+            self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def string(self, offset):
+        start = self.strings_offset + offset
+        (length,) = LENGTH.unpack_from(self.map, start)
+        return self.map[start + LENGTH.size:start + LENGTH.size + length].decode("utf-8")
+
+    def record(self, index):
+        transaction_id, ordinal, cents, category, description = RECORD.unpack_from(
+            self.map, HEADER.size + index * RECORD.size)
+        return Transaction(transaction_id, ordinal, self.string(description), cents, self.category_names[category])
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.record(index)
+
+    def columns(self):
+        # (ids, dates, cents, categories, descriptions) for the whole table;
+        # each distinct description is decoded once
+        if np is not None:
+            table = np.frombuffer(self.map, dtype=RECORD_DTYPE, count=self.count, offset=HEADER.size)
+            ids = array("q", table["id"].astype(np.int64).tobytes())
+            dates = array("i", table["ordinal"].astype(np.intc).tobytes())
+            cents = array("q", table["cents"].astype(np.int64).tobytes())
+            categories = array("i", table["category"].astype(np.intc).tobytes())
+            offsets, positions = np.unique(table["description"], return_inverse=True)
+            del table
+            strings = [sys.intern(self.string(offset)) for offset in offsets.tolist()]
+            return ids, dates, cents, categories, list(map(strings.__getitem__, positions.tolist()))
+
+        ids, dates, cents, categories = array("q"), array("i"), array("q"), array("i")
+        strings, descriptions = {}, []
+        for transaction_id, ordinal, amount, category, offset in RECORD.iter_unpack(
+                self.map[HEADER.size:self.categories_offset]):
+            ids.append(transaction_id)
+            dates.append(ordinal)
+            cents.append(amount)
+            categories.append(category)
+            description = strings.get(offset)
+            if description is None:
+                description = strings[offset] = sys.intern(self.string(offset))
+            descriptions.append(description)
+        return ids, dates, cents, categories, descriptions
+
+    def store(self):
+        return TransactionStore.from_columns(*self.columns(), self.category_names)
+
+
+def main(argv=None):
+    from storage import json_to_snapshot, snapshot_to_json
+    parser = argparse.ArgumentParser(description="Convert Money Map transactions between JSON and binary snapshots")
+    parser.add_argument("direction", choices=["to-binary", "to-json"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args(argv)
+    try:
+        if args.direction == "to-binary":
+            json_to_snapshot(args.source, args.target)
+        else:
+            snapshot_to_json(args.source, args.target)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{args.source} ({os.path.getsize(args.source):,} bytes) -> {args.target} "
+          f"({os.path.getsize(args.target):,} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
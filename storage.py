@@ -0,0 +1,985 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from urllib.request import pathname2url
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import perf
+from snapshot import Snapshot, write_snapshot
+from transaction_store import Rollup, date_to_ordinal, from_cents, to_cents
+
+TRANSACTIONS_FILE = "transactions.json"
+BUDGETS_FILE = "budgets.json"
+JOURNAL_FILE = "transactions.journal"
+DATABASE_FILE = "money_map.db"
+PARTITIONS_DIR = "ledger"
+SNAPSHOT_FILE = "transactions.bin"
+RECURRING_FILE = "recurring.json"
+# Transaction ids are reserved this many at a time
+ID_BLOCK = 100
+
+
+def write_json_atomic(path, data):
+    # Write to a temp file first so a crash can never leave a half-written file behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        perf.count("bytes written", f.tell())
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def file_stamp(path):
+    # Changes whenever the file is rewritten or appended to
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class FileLock:
+    # Advisory lock shared by every process using the same data files. Nested
+    # use within a process is fine; threads take turns on an RLock first. The
+    # lock file also holds the counters the processes share ({"seq", "next_id", "rule_id"}).
+    # A `shared` lock is for readers: it never creates the file, and where
+    # there is none no writer has used the files, so there is nothing to wait for.
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            try:
+                self.file = open(self.path, "r" if self.shared else "a+")
+            except FileNotFoundError:
+                if not self.shared:
+                    raise
+            if self.file is not None and fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+            elif self.file is not None:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_RLCK if self.shared else msvcrt.LK_LOCK, 1)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0 and self.file is not None:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+    def read_counters(self):
+        # Only while the lock is held
+        self.file.seek(0)
+        try:
+            return json.loads(self.file.read() or "{}")
+        except ValueError:
+            return {}
+
+    def write_counters(self, counters):
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(json.dumps(counters))
+        self.file.flush()
+
+
+def transaction_dicts(transactions):
+    # JSON-ready dicts from a TransactionStore, or a list of them as read from a file
+    dicts = getattr(transactions, "dicts", None)
+    return list(dicts()) if dicts is not None else list(transactions)
+
+
+def assign_ids(transactions):
+    # Backfills stable ids for transactions saved before they had one. Ids are
+    # handed out in file order, so the same file always gets the same ids.
+    next_id = max((t.get("id", 0) for t in transactions), default=0) + 1
+    for t in transactions:
+        if "id" not in t:
+            t["id"] = next_id
+            next_id += 1
+    return transactions
+
+
+def record_id(transactions, record):
+    # Journals written before stable ids address transactions by position
+    if "id" in record:
+        return record["id"]
+    if "transaction" in record and "id" in record["transaction"]:
+        return record["transaction"]["id"]
+    return list(transactions)[record["index"]]
+
+
+def record_keys(record):
+    # What a journal record changes, for telling which process wrote something last
+    op = record["op"]
+    if op == "add_many":
+        return [("id", t["id"]) for t in record["transactions"]]
+    if op in ("set_budget", "remove_budget"):
+        return [("budget", record["category"])]
+    if op == "set_rule":
+        return [("rule", record["rule"]["id"])]
+    if op == "remove_rule":
+        return [("rule", record["id"])]
+    if "transaction" in record:
+        return [("id", record["transaction"].get("id"))]
+    if "id" in record:
+        return [("id", record["id"])]
+    return []
+
+
+def apply_record(state, record):
+    # Replays a single journal record onto a {"balance", "transactions", "budgets"}
+    # state whose transactions are a dict keyed by id
+    op = record["op"]
+    transactions = state["transactions"]
+    if op == "add":
+        transaction = record["transaction"]
+        transaction.setdefault("id", max(transactions, default=0) + 1)
+        transactions[transaction["id"]] = transaction
+        state["balance"] += transaction["amount"]
+    elif op == "add_many":
+        for transaction in record["transactions"]:
+            transactions[transaction["id"]] = transaction
+            state["balance"] += transaction["amount"]
+    elif op == "edit":
+        transaction_id = record_id(transactions, record)
+        transaction = dict(record["transaction"], id=transaction_id)
+        # Another process may have deleted it first; the edit then brings it back
+        previous = transactions.get(transaction_id)
+        if previous is not None:
+            state["balance"] -= previous["amount"]
+        state["balance"] += transaction["amount"]
+        transactions[transaction_id] = transaction
+    elif op == "delete":
+        removed = transactions.pop(record_id(transactions, record), None)
+        if removed is not None:
+            state["balance"] -= removed["amount"]
+    elif op == "set_budget":
+        state["budgets"][record["category"]] = record["amount"]
+    elif op == "remove_budget":
+        state["budgets"].pop(record["category"], None)
+    elif op == "clear":
+        state["balance"] = 0
+        transactions.clear()
+        state["budgets"].clear()
+    elif op not in ("set_rule", "remove_rule"):
+        raise ValueError(f"Unknown journal operation: {op}")
+    if "rules" in state:
+        apply_rules(state["rules"], record)
+
+
+def apply_rules(rules, record):
+    # The recurring rule changes in a record, onto {rule id: rule dict}.
+    # Returns whether there were any.
+    op = record["op"]
+    if op == "set_rule":
+        rules[record["rule"]["id"]] = dict(record["rule"])
+    elif op == "remove_rule":
+        rules.pop(record["id"], None)
+    elif op == "clear":
+        rules.clear()
+    elif "rules" in record:
+        # How far the rules whose occurrences an add_many holds have got. It
+        # only moves forward, and a rule removed in the meantime stays removed.
+        for progress in record["rules"]:
+            rule = rules.get(progress["id"])
+            if rule is not None:
+                rule["done"] = max(rule.get("done", 0), progress["done"])
+    else:
+        return False
+    return True
+
+
+class JsonStorage:
+    # Rewrites transactions.json and budgets.json on every change. The
+    # recurring transaction rules, {rule id: rule dict} in `rules`, are kept
+    # in recurring.json and change through records like everything else.
+    def __init__(self, transactions_file=TRANSACTIONS_FILE, budgets_file=BUDGETS_FILE, rules_file=RECURRING_FILE):
+        self.transactions_file = transactions_file
+        self.budgets_file = budgets_file
+        self.rules_file = rules_file
+        self.rules = {}
+
+    def load(self):
+        data = read_json(self.transactions_file, {})
+        budgets = read_json(self.budgets_file, {})
+        self.rules = self.read_rules()
+        return data.get("balance", 0), assign_ids(data.get("transactions", [])), budgets
+
+    def read_rules(self):
+        return {r["id"]: r for r in read_json(self.rules_file, {}).get("rules", [])}
+
+    def write_rules(self):
+        write_json_atomic(self.rules_file, {"rules": sorted(self.rules.values(), key=lambda r: r["id"])})
+
+    def next_rule_id(self, last):
+        # Id for a new rule, `last` being the highest this process knows of
+        return last + 1
+
+    def save(self, balance, transactions, budgets, record=None):
+        write_json_atomic(self.budgets_file, budgets)
+        write_json_atomic(self.transactions_file, {"balance": balance, "transactions": transaction_dicts(transactions)})
+
+    def needs_snapshot(self, record):
+        # Asked on the Tk thread for every change: should a copy of the full
+        # state travel with it to the background writer?
+        return True
+
+    def write_batch(self, batch):
+        # `batch` is a list of (record, snapshot) pairs, oldest first. Only the
+        # newest snapshot matters when the whole file is rewritten.
+        if any([apply_rules(self.rules, record) for record, snapshot in batch if record is not None]):
+            self.write_rules()
+        for record, snapshot in reversed(batch):
+            if snapshot is not None:
+                self.save(*snapshot)
+                return
+
+    def close(self, balance, transactions, budgets):
+        pass
+
+
+class JournalStorage(JsonStorage):
+    # Appends one line per change to the journal and only rewrites the JSON
+    # snapshot every `compact_every` records (and on close).
+    #
+    # Several processes (the app and scripts using Ledger) can share the files.
+    # Every read and write happens under a FileLock, journal sequence numbers
+    # and transaction ids come from counters in the lock file, and records the
+    # other processes append are picked up by sync() and handed to the Ledger
+    # through changes(). Once another process has written, compaction folds
+    # the files on disk instead of writing this process's copy of the state,
+    # so nobody's changes are lost.
+    #
+    # A `read_only` storage leaves the files exactly as they are (it does not
+    # even cut off a torn journal tail) and cannot save.
+    def __init__(self, transactions_file=TRANSACTIONS_FILE, budgets_file=BUDGETS_FILE,
+                 journal_file=JOURNAL_FILE, compact_every=500, rules_file=RECURRING_FILE, read_only=False):
+        super().__init__(transactions_file, budgets_file, rules_file)
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.read_only = read_only
+        self.seq = 0
+        self.pending = 0
+        self.since_snapshot = 0
+        self.lock = FileLock(os.path.splitext(transactions_file)[0] + ".lock", shared=read_only)
+        self.offset = 0
+        self.stamps = None
+        self.incoming = []
+        self.written = {}
+        self.reload_needed = False
+        self.external = False
+
+    def load(self):
+        with self.lock:
+            state = self.read_state()
+            self.external = self.reload_needed = False
+            self.incoming = []
+            return state
+
+    def read_state(self):
+        data = read_json(self.transactions_file, {})
+        state = {"balance": data.get("balance", 0),
+                 "transactions": {t["id"]: t for t in assign_ids(data.get("transactions", []))},
+                 "budgets": read_json(self.budgets_file, {}), "rules": self.read_rules()}
+        self.seq = data.get("journal_seq", 0)
+        for record in self.read_journal():
+            apply_record(state, record)
+        self.rules = state["rules"]
+        self.stamps = self.file_stamps()
+        return state["balance"], list(state["transactions"].values()), state["budgets"]
+
+    def file_stamps(self):
+        return file_stamp(self.transactions_file), file_stamp(self.budgets_file)
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_file)
+        except OSError:
+            return 0
+
+    def changed(self):
+        # Whether another process may have saved something; a few stat calls,
+        # cheap enough to poll from the Tk loop. Records our own writes have
+        # already read past count too.
+        return (bool(self.incoming) or self.reload_needed or self.journal_size() != self.offset
+                or self.file_stamps() != self.stamps)
+
+    def sync(self):
+        # Called with the lock held: queues the records other processes have
+        # appended since we last looked, or flags a full reload if they
+        # rewrote the files (a compaction, or a script editing the JSON)
+        size = self.journal_size()
+        if self.file_stamps() != self.stamps or size < self.offset:
+            self.reload_needed = self.external = True
+            return
+        if size == self.offset:
+            return
+        with open(self.journal_file, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.offset += len(line)
+                self.seq = max(self.seq, record["seq"])
+                apply_rules(self.rules, record)
+                self.incoming.append(record)
+                self.external = True
+
+    def changes(self):
+        # (records, reload): what other processes saved since the last call.
+        # The records are to be applied in order; reload means the files were
+        # rewritten and only a full load() gets back in step.
+        with self.lock:
+            self.sync()
+            records, self.incoming = self.incoming, []
+            reload, self.reload_needed = self.reload_needed, False
+        return records, reload
+
+    def next_seq(self, count=1):
+        # First of `count` new journal sequence numbers; needs the lock
+        counters = self.lock.read_counters()
+        first = max(self.seq, counters.get("seq", 0)) + 1
+        self.seq = first + count - 1
+        counters["seq"] = self.seq
+        self.lock.write_counters(counters)
+        return first
+
+    def reserve_ids(self, next_id, count):
+        # A block of at least `count` ids that no other process will hand out:
+        # returns (first id, end of the block)
+        with self.lock:
+            counters = self.lock.read_counters()
+            first = max(next_id, counters.get("next_id", 1))
+            counters["next_id"] = first + max(count, ID_BLOCK)
+            self.lock.write_counters(counters)
+        return first, counters["next_id"]
+
+    def next_rule_id(self, last):
+        with self.lock:
+            counters = self.lock.read_counters()
+            counters["rule_id"] = max([last, counters.get("rule_id", 0)] + list(self.rules)) + 1
+            self.lock.write_counters(counters)
+        return counters["rule_id"]
+
+    def read_journal(self):
+        # The tail of the journal written since the last snapshot
+        records = []
+        self.offset = 0
+        if not os.path.exists(self.journal_file):
+            return records
+        snapshot_seq = self.seq
+        good_offset = 0
+        with open(self.journal_file, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash mid-append, nothing after it was committed
+                    break
+                good_offset += len(line)
+                if record["seq"] <= snapshot_seq:
+                    continue
+                records.append(record)
+                self.seq = record["seq"]
+        self.pending += len(records)
+        self.since_snapshot += len(records)
+        if good_offset < os.path.getsize(self.journal_file) and not self.read_only:
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(good_offset)
+        self.offset = good_offset
+        return records
+
+    def needs_snapshot(self, record):
+        # Counted on the submitting thread so compaction always gets a copy
+        # of the state that matches the records before it
+        self.since_snapshot += 1
+        if record is None or self.since_snapshot >= self.compact_every:
+            self.since_snapshot = 0
+            return True
+        return False
+
+    def write_batch(self, batch):
+        if self.read_only:
+            raise PermissionError(f"{self.transactions_file} was opened read-only")
+        last = None
+        for i, (record, snapshot) in enumerate(batch):
+            if snapshot is not None:
+                last = i
+        with self.lock:
+            self.sync()
+            # The rules file written by a compaction may run ahead of the
+            # snapshot; replaying the journal records after it is harmless
+            for record, snapshot in batch:
+                if record is not None:
+                    apply_rules(self.rules, record)
+            if last is not None and not self.external:
+                self.compact(*batch[last][1])
+                batch = batch[last + 1:]
+            self.append([record for record, snapshot in batch])
+            if last is not None and self.external:
+                self.fold()
+
+    def append(self, records):
+        # One write and one fsync for the whole burst. The journal is opened
+        # each time, since another process may have compacted it away.
+        if not records:
+            return
+        with self.lock:
+            self.sync()
+            seq = self.next_seq(len(records))
+            lines = []
+            for record in records:
+                lines.append(json.dumps(dict(record, seq=seq)) + "\n")
+                for key in record_keys(record):
+                    self.written[key] = seq
+                seq += 1
+            data = "".join(lines).encode()
+            with open(self.journal_file, "ab") as journal:
+                journal.write(data)
+                journal.flush()
+                os.fsync(journal.fileno())
+            perf.count("bytes written", len(data))
+            if self.offset + len(data) == self.journal_size():
+                self.offset += len(data)
+            self.pending += len(records)
+
+    def fold(self):
+        # Compaction from what is on disk, other processes' changes included
+        self.compact(*self.read_state())
+
+    def compact(self, balance, transactions, budgets):
+        with self.lock:
+            self.next_seq()
+            write_json_atomic(self.budgets_file, budgets)
+            self.write_rules()
+            # The snapshot remembers the last journal record it contains, so a crash
+            # before the journal is truncated cannot replay records twice
+            write_json_atomic(self.transactions_file,
+                              {"balance": balance, "transactions": transaction_dicts(transactions),
+                               "journal_seq": self.seq})
+            self.truncate_journal()
+
+    def truncate_journal(self):
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.pending = 0
+        self.offset = 0
+        self.stamps = self.file_stamps()
+
+    def close(self, balance, transactions, budgets):
+        if self.read_only:
+            return
+        with self.lock:
+            self.sync()
+            if self.external:
+                self.fold()
+            elif self.pending:
+                self.compact(balance, transactions, budgets)
+
+
+class PartitionedStorage(JournalStorage):
+    # One JSON file per year under `directory`, plus manifest.json holding each
+    # year's transaction count and month x category totals (in cents). Startup
+    # reads the manifest and the current year only; the balance and the
+    # rollup of every other year come from the manifest, and the Ledger asks
+    # for older years with load_partition() once a filter, import or export
+    # reaches into them. Changes go through the same journal as
+    # JournalStorage; compaction rewrites just the years held in memory.
+    # Only one process at a time may use a partitioned ledger: a process
+    # holds just some of the years, so it cannot fold in other processes'
+    # changes.
+    def __init__(self, directory=PARTITIONS_DIR, budgets_file=BUDGETS_FILE, compact_every=500, current_year=None,
+                 rules_file=RECURRING_FILE, read_only=False):
+        super().__init__(os.path.join(directory, "manifest.json"), budgets_file,
+                         os.path.join(directory, "transactions.journal"), compact_every, rules_file, read_only)
+        self.directory = directory
+        self.current_year = current_year or date.today().year
+        self.manifest = {"next_id": 1, "journal_seq": 0, "partitions": {}}
+        self.loaded_years = set()
+
+    def changed(self):
+        return False
+
+    def sync(self):
+        pass
+
+    def partition_file(self, year):
+        return os.path.join(self.directory, f"{year}.json")
+
+    def partition_years(self):
+        return sorted(int(year) for year in self.manifest["partitions"])
+
+    def partition_cells(self, year):
+        return self.manifest["partitions"][str(year)]["cells"]
+
+    def manifest_balance(self):
+        return sum(income - expense for entry in self.manifest["partitions"].values()
+                   for year, month, category, income, expense, count in entry["cells"]) / 100
+
+    def load_partition(self, year):
+        self.loaded_years.add(year)
+        if str(year) not in self.manifest["partitions"]:
+            return []
+        return read_json(self.partition_file(year), {}).get("transactions", [])
+
+    def load(self):
+        if not self.read_only:
+            os.makedirs(self.directory, exist_ok=True)
+        self.manifest = read_json(self.transactions_file, self.manifest)
+        self.seq = self.manifest["journal_seq"]
+        budgets = read_json(self.budgets_file, {})
+        records = self.read_journal()
+        self.rules = self.read_rules()
+        if not records:
+            return self.manifest_balance(), self.load_partition(self.current_year), budgets
+
+        # Unsaved changes from a session that did not close cleanly: replay them
+        # on top of every year. Replaying is keyed by id, so it is also safe if
+        # some partitions were already rewritten when the session ended.
+        state = {"balance": 0, "transactions": {}, "budgets": budgets, "rules": self.rules}
+        for year in self.partition_years():
+            for t in self.load_partition(year):
+                state["transactions"][t["id"]] = t
+        for record in records:
+            apply_record(state, record)
+        transactions = list(state["transactions"].values())
+        self.loaded_years.update(int(t["date"][-4:]) for t in transactions)
+        return sum(to_cents(t["amount"]) for t in transactions) / 100, transactions, state["budgets"]
+
+    def compact(self, balance, transactions, budgets):
+        # `transactions` holds the years in its `partitions` set, or all of them if that is None
+        self.seq += 1
+        write_json_atomic(self.budgets_file, budgets)
+        self.write_rules()
+        years = getattr(transactions, "partitions", None)
+        by_year = {}
+        for t in transaction_dicts(transactions):
+            by_year.setdefault(int(t["date"][-4:]), []).append(t)
+
+        old = self.manifest["partitions"]
+        entries = {} if years is None else {key: entry for key, entry in old.items() if int(key) not in years}
+        for year in set(by_year) | (set(years) if years is not None else set()):
+            rows = by_year.get(year)
+            if rows:
+                rollup = Rollup()
+                for t in rows:
+                    rollup.add(t["category"], date_to_ordinal(t["date"]), to_cents(t["amount"]))
+                write_json_atomic(self.partition_file(year), {"transactions": rows})
+                entries[str(year)] = {"count": len(rows), "cells": rollup.to_json()}
+        for key in set(old) - set(entries):
+            if os.path.exists(self.partition_file(key)):
+                os.remove(self.partition_file(key))
+
+        next_id = max([self.manifest["next_id"]] + [t["id"] + 1 for rows in by_year.values() for t in rows])
+        self.manifest = {"next_id": next_id, "journal_seq": self.seq, "partitions": entries}
+        write_json_atomic(self.transactions_file, self.manifest)
+        self.truncate_journal()
+
+
+class BinaryStorage(JournalStorage):
+    # JournalStorage with a binary snapshot (see snapshot.py) in place of
+    # transactions.json. A clean start copies the columns straight out of the
+    # memory-mapped file; only a journal left over from a crash goes through
+    # the dict-by-dict replay. The journal sits next to the snapshot, apart
+    # from the one of the JSON files.
+    def __init__(self, snapshot_file=SNAPSHOT_FILE, budgets_file=BUDGETS_FILE, journal_file=None,
+                 compact_every=500, rules_file=RECURRING_FILE, read_only=False):
+        super().__init__(snapshot_file, budgets_file, journal_file or snapshot_file + ".journal", compact_every,
+                         rules_file, read_only)
+
+    def read_state(self):
+        budgets = read_json(self.budgets_file, {})
+        self.rules = self.read_rules()
+        self.stamps = self.file_stamps()
+        if not os.path.exists(self.transactions_file):
+            # No compaction yet, so every record in the journal counts
+            self.seq = 0
+            state = {"balance": 0, "transactions": {}, "budgets": budgets, "rules": self.rules}
+        else:
+            with Snapshot(self.transactions_file) as snapshot:
+                self.seq = snapshot.journal_seq
+                balance = from_cents(snapshot.balance_cents)
+                if not os.path.exists(self.journal_file):
+                    self.offset = 0
+                    return balance, snapshot.store(), budgets
+                state = {"balance": balance, "transactions": {t.id: t.to_dict() for t in snapshot},
+                         "budgets": budgets, "rules": self.rules}
+        for record in self.read_journal():
+            apply_record(state, record)
+        return state["balance"], list(state["transactions"].values()), state["budgets"]
+
+    def compact(self, balance, transactions, budgets):
+        with self.lock:
+            self.next_seq()
+            write_json_atomic(self.budgets_file, budgets)
+            self.write_rules()
+            write_snapshot(self.transactions_file, to_cents(balance), transactions, self.seq)
+            self.truncate_journal()
+
+
+def to_iso(date_str):
+    # Dates are shown as DD-MM-YYYY but stored as YYYY-MM-DD so they sort and range-filter
+    return datetime.strptime(date_str, "%d-%m-%Y").strftime("%Y-%m-%d")
+
+
+def from_iso(iso_str):
+    return f"{iso_str[8:10]}-{iso_str[5:7]}-{iso_str[0:4]}"
+
+
+class SQLiteStorage:
+    # Keeps transactions in a SQLite database, one row each, and saves a change
+    # by updating just the rows it touches. The ledger reads everything at
+    # load and filters and sums in memory, so the date and category indexes
+    # in the schema are only of use to other tools reading the file. The row
+    # id is the transaction id. The recurring rules are one JSON value
+    # in the meta table, written in the same SQLite transaction as the records
+    # that change them; until the first change they come from `rules_file`.
+    # A `read_only` connection needs the database to exist and cannot save.
+    def __init__(self, database_file=DATABASE_FILE, rules_file=RECURRING_FILE, read_only=False):
+        self.database_file = database_file
+        self.rules_file = rules_file
+        self.rules = {}
+        # Shared between the Tk thread (queries) and the background writer
+        self.lock = threading.RLock()
+        if read_only:
+            # Without a writer around there is no -wal file, and reading the
+            # database as immutable keeps SQLite from leaving one and a -shm behind
+            options = "mode=ro" if os.path.exists(database_file + "-wal") else "immutable=1"
+            self.conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(database_file))}?{options}", uri=True,
+                                        check_same_thread=False)
+            return
+        self.conn = sqlite3.connect(database_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY,
+                date TEXT NOT NULL,
+                description TEXT NOT NULL,
+                amount REAL NOT NULL,
+                category TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+            CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions(category, date);
+            CREATE TABLE IF NOT EXISTS budgets (
+                category TEXT PRIMARY KEY,
+                amount REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value
+            );
+        """)
+
+    def load(self):
+        with self.lock:
+            transactions = [self.row_to_transaction(row) for row in
+                            self.conn.execute("SELECT id, date, description, amount, category FROM transactions ORDER BY id")]
+            budgets = dict(self.conn.execute("SELECT category, amount FROM budgets"))
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'rules'").fetchone()
+            rules = json.loads(row[0]) if row else read_json(self.rules_file, {}).get("rules", [])
+            self.rules = {r["id"]: r for r in rules}
+            return self.get_balance(), transactions, budgets
+
+    def next_rule_id(self, last):
+        return last + 1
+
+    def save_rules(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rules', ?)",
+                          (json.dumps(sorted(self.rules.values(), key=lambda r: r["id"])),))
+
+    def get_balance(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'balance'").fetchone()
+        return row[0] if row else 0
+
+    def row_to_transaction(self, row):
+        return {"id": row[0], "date": from_iso(row[1]), "description": row[2], "amount": row[3], "category": row[4]}
+
+    def transaction_to_row(self, transaction):
+        return (to_iso(transaction["date"]), transaction["description"], transaction["amount"],
+                transaction["category"], transaction["id"])
+
+    def save(self, balance, transactions, budgets, record=None):
+        with self.lock, self.conn:
+            if record is None:
+                self.replace_all(balance, transactions, budgets)
+            else:
+                self.apply(record)
+
+    def needs_snapshot(self, record):
+        return record is None
+
+    def write_batch(self, batch):
+        # The whole burst is committed as one SQLite transaction
+        with self.lock, self.conn:
+            for record, snapshot in batch:
+                if snapshot is not None:
+                    self.replace_all(*snapshot)
+                else:
+                    self.apply(record)
+
+    def amount_of(self, transaction_id):
+        return self.conn.execute("SELECT amount FROM transactions WHERE id = ?", (transaction_id,)).fetchone()[0]
+
+    def apply(self, record):
+        # The stored balance is moved by the same delta the change made in memory
+        op = record["op"]
+        balance = self.get_balance()
+        if op == "add":
+            self.conn.execute("INSERT INTO transactions (date, description, amount, category, id) VALUES (?, ?, ?, ?, ?)",
+                              self.transaction_to_row(record["transaction"]))
+            balance += record["transaction"]["amount"]
+        elif op == "add_many":
+            self.conn.executemany("INSERT INTO transactions (date, description, amount, category, id) VALUES (?, ?, ?, ?, ?)",
+                                  [self.transaction_to_row(t) for t in record["transactions"]])
+            balance += sum(t["amount"] for t in record["transactions"])
+        elif op == "edit":
+            balance += record["transaction"]["amount"] - self.amount_of(record["transaction"]["id"])
+            self.conn.execute("UPDATE transactions SET date = ?, description = ?, amount = ?, category = ? WHERE id = ?",
+                              self.transaction_to_row(record["transaction"]))
+        elif op == "delete":
+            balance -= self.amount_of(record["id"])
+            self.conn.execute("DELETE FROM transactions WHERE id = ?", (record["id"],))
+        elif op == "set_budget":
+            self.conn.execute("INSERT OR REPLACE INTO budgets (category, amount) VALUES (?, ?)",
+                              (record["category"], record["amount"]))
+        elif op == "remove_budget":
+            self.conn.execute("DELETE FROM budgets WHERE category = ?", (record["category"],))
+        elif op == "clear":
+            self.conn.execute("DELETE FROM transactions")
+            self.conn.execute("DELETE FROM budgets")
+            balance = 0
+        elif op not in ("set_rule", "remove_rule"):
+            raise ValueError(f"Unknown storage operation: {op}")
+        if apply_rules(self.rules, record):
+            self.save_rules()
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('balance', ?)", (balance,))
+
+    def replace_all(self, balance, transactions, budgets):
+        self.conn.execute("DELETE FROM transactions")
+        self.conn.execute("DELETE FROM budgets")
+        self.conn.executemany("INSERT INTO transactions (date, description, amount, category, id) VALUES (?, ?, ?, ?, ?)",
+                              (self.transaction_to_row(t) for t in transaction_dicts(transactions)))
+        self.conn.executemany("INSERT INTO budgets (category, amount) VALUES (?, ?)", budgets.items())
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('balance', ?)", (balance,))
+        self.save_rules()
+
+    def is_empty(self):
+        return (self.conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone() is None
+                and self.conn.execute("SELECT 1 FROM meta WHERE key = 'balance'").fetchone() is None)
+
+    def close(self, balance, transactions, budgets):
+        with self.lock:
+            self.conn.close()
+
+
+class WriteBehind:
+    # Background writer in front of a storage backend. The Tk thread only
+    # queues changes; a burst arriving within `delay` seconds of each other is
+    # coalesced and written by this thread in a single pass, but nothing waits
+    # longer than `max_delay` (by default 4 x `delay`) however long the burst
+    # goes on.
+    def __init__(self, storage, delay=0.5, max_delay=None):
+        self.storage = storage
+        self.delay = delay
+        self.max_delay = max_delay if max_delay is not None else 4 * delay
+        self.queue = []
+        self.writing = False
+        self.flushing = False
+        self.closed = False
+        self.error = None
+        self.last_submit = 0
+        self.first_submit = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name="money-map-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, record, snapshot=None):
+        with self.condition:
+            if snapshot is not None:
+                # A newer snapshot holds everything an older queued one did, and
+                # the backends only write the newest; keeping them all would hold
+                # a copy of the ledger per change. A full save (record None) has
+                # nothing else to write.
+                self.queue = [(queued, None) for queued, _ in self.queue if queued is not None]
+            self.queue.append((record, snapshot))
+            self.last_submit = time.monotonic()
+            if self.first_submit is None:
+                self.first_submit = self.last_submit
+            self.condition.notify_all()
+
+    def pending(self):
+        with self.condition:
+            return len(self.queue) + (1 if self.writing else 0)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                # Debounce: keep collecting until the burst has been quiet for
+                # `delay`, or the oldest change has waited `max_delay`
+                while not (self.closed or self.flushing):
+                    remaining = min(self.last_submit + self.delay,
+                                    self.first_submit + self.max_delay) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.queue = self.queue, []
+                self.first_submit = None
+                self.writing = True
+
+            try:
+                with perf.span("save"):
+                    self.storage.write_batch(batch)
+                perf.count("records saved", len(batch))
+                self.error = None
+            except Exception as e:
+                # Kept for the status indicator; the batch is retried after a pause
+                self.error = e
+                with self.condition:
+                    if any(snapshot is not None for record, snapshot in self.queue):
+                        batch = [(record, None) for record, snapshot in batch if record is not None]
+                    self.queue[:0] = batch
+                    self.first_submit = self.first_submit or time.monotonic()
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+            if self.error is not None:
+                if self.closed:
+                    return
+                time.sleep(self.delay)
+
+    def flush(self, timeout=None):
+        # Blocks until everything queued so far is on disk
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            done = self.condition.wait_for(lambda: not (self.queue or self.writing) or
+                                           self.error is not None,
+                                           timeout)
+            self.flushing = False
+            return done and self.error is None
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+def json_files(transactions_file, budgets_file, rules_file, read_only=False):
+    # The JSON files and the journal next to them, as the migrations read them
+    journal_file = os.path.join(os.path.dirname(transactions_file), JOURNAL_FILE)
+    return JournalStorage(transactions_file, budgets_file, journal_file, rules_file=rules_file, read_only=read_only)
+
+
+def load_json_files(storage, transactions_file, budgets_file, rules_file):
+    # The state in the JSON files (plus any journal tail), with its rules handed to `storage`
+    source = json_files(transactions_file, budgets_file, rules_file)
+    state = source.load()
+    storage.rules = source.rules
+    return state
+
+
+# With `read_only` the migrations change nothing: a ledger not converted yet
+# is read straight from its JSON files instead.
+
+def migrate_json_to_sqlite(database_file=DATABASE_FILE, transactions_file=TRANSACTIONS_FILE,
+                           budgets_file=BUDGETS_FILE, rules_file=RECURRING_FILE, read_only=False):
+    # One-shot import of the JSON files (plus any journal tail) into an empty database
+    if read_only:
+        if not os.path.exists(database_file):
+            return json_files(transactions_file, budgets_file, rules_file, read_only)
+        return SQLiteStorage(database_file, rules_file, read_only)
+    storage = SQLiteStorage(database_file, rules_file)
+    if storage.is_empty():
+        storage.save(*load_json_files(storage, transactions_file, budgets_file, rules_file))
+    return storage
+
+
+def migrate_json_to_partitions(directory=PARTITIONS_DIR, transactions_file=TRANSACTIONS_FILE,
+                               budgets_file=BUDGETS_FILE, rules_file=RECURRING_FILE, read_only=False):
+    # One-shot split of the JSON files (plus any journal tail) into yearly partitions
+    storage = PartitionedStorage(directory, budgets_file, rules_file=rules_file, read_only=read_only)
+    if not os.path.exists(storage.transactions_file) and os.path.exists(transactions_file):
+        if read_only:
+            return json_files(transactions_file, budgets_file, rules_file, read_only)
+        os.makedirs(directory, exist_ok=True)
+        storage.compact(*load_json_files(storage, transactions_file, budgets_file, rules_file))
+    return storage
+
+
+def migrate_json_to_binary(snapshot_file=SNAPSHOT_FILE, transactions_file=TRANSACTIONS_FILE,
+                           budgets_file=BUDGETS_FILE, rules_file=RECURRING_FILE, read_only=False):
+    # One-shot conversion of the JSON files (plus any journal tail) into a binary snapshot
+    storage = BinaryStorage(snapshot_file, budgets_file, rules_file=rules_file, read_only=read_only)
+    if not os.path.exists(snapshot_file) and os.path.exists(transactions_file):
+        if read_only:
+            return json_files(transactions_file, budgets_file, rules_file, read_only)
+        storage.compact(*load_json_files(storage, transactions_file, budgets_file, rules_file))
+    return storage
+
+
+def json_to_snapshot(json_file, snapshot_file):
+    data = read_json(json_file, {})
+    write_snapshot(snapshot_file, to_cents(data.get("balance", 0)), assign_ids(data.get("transactions", [])))
+
+
+def snapshot_to_json(snapshot_file, json_file):
+    with Snapshot(snapshot_file) as snapshot:
+        write_json_atomic(json_file, {"balance": from_cents(snapshot.balance_cents),
+                                      "transactions": [t.to_dict() for t in snapshot]})
+
+
+def open_storage(mode="journal", directory="", read_only=False):
+    # The data files of `mode` in `directory` (by default the working directory).
+    # A `read_only` storage creates, migrates and repairs nothing on disk.
+    def path(name):
+        return os.path.join(directory, name)
+    files = path(TRANSACTIONS_FILE), path(BUDGETS_FILE)
+    rules_file = path(RECURRING_FILE)
+    if mode == "json":
+        return JsonStorage(*files, rules_file)
+    if mode == "journal":
+        return JournalStorage(*files, path(JOURNAL_FILE), rules_file=rules_file, read_only=read_only)
+    if mode == "sqlite":
+        return migrate_json_to_sqlite(path(DATABASE_FILE), *files, rules_file, read_only)
+    if mode == "partitioned":
+        return migrate_json_to_partitions(path(PARTITIONS_DIR), *files, rules_file, read_only)
+    if mode == "binary":
+        return migrate_json_to_binary(path(SNAPSHOT_FILE), *files, rules_file, read_only)
+    raise ValueError(f"Unknown storage mode: {mode}")
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+# The modules live in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ledger import Ledger  # noqa: E402
+from storage import open_storage  # noqa: E402
+
+STORAGE_MODES = ["json", "journal", "sqlite", "partitioned", "binary"]
+
+
+def open_ledger(directory, mode="journal", save_delay=0):
+    # A Ledger whose files all live in `directory`
+    return Ledger(open_storage(mode, str(directory)), save_delay=save_delay)
+
+
+@pytest.fixture
+def make_ledger(tmp_path):
+    # Opens ledgers on tmp_path and closes whatever is still open afterwards
+    ledgers = []
+
+    def make(mode="journal", save_delay=0):
+        ledger = open_ledger(tmp_path, mode, save_delay)
+        ledgers.append(ledger)
+        return ledger
+    yield make
+    for ledger in ledgers:
+        if ledger.writer.thread.is_alive():
+            ledger.close()
@@ -0,0 +1,62 @@
+import pytest
+
+from importer import make_transaction
+from ledger import ValidationError, budget_amount
+from transaction_store import Transaction, TransactionStore, to_cents
+
+BAD_AMOUNTS = ["inf", "-inf", "nan", "1e400", "1e17", float("inf"), float("nan"), 2e17]
+
+
+@pytest.mark.parametrize("amount", BAD_AMOUNTS)
+def test_to_cents_rejects(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+def test_to_cents_rounds():
+    assert to_cents("12.345") == 1234
+    assert to_cents(-0.1) == -10
+    assert to_cents(9e16) == 9 * 10 ** 18
+
+
+@pytest.mark.parametrize("amount", BAD_AMOUNTS)
+def test_budget_amount_rejects(amount):
+    with pytest.raises(ValidationError):
+        budget_amount(amount)
+
+
+@pytest.mark.parametrize("amount", BAD_AMOUNTS)
+def test_ledger_rejects_without_changes(make_ledger, amount):
+    ledger = make_ledger()
+    ledger.add_transaction("01-01-2024", "Salary", 1000, "Income", True)
+    food = ledger.add_transaction("02-01-2024", "Groceries", 50, "Food", False)
+    with pytest.raises(ValidationError):
+        ledger.add_transaction("03-01-2024", "Lottery", amount, "Income", True)
+    with pytest.raises(ValidationError):
+        ledger.edit_transaction(food, "02-01-2024", "Groceries", amount, "Food", True)
+    with pytest.raises(ValidationError):
+        ledger.add_transactions([("03-01-2024", "Fine", 5, "Food", False),
+                                 ("03-01-2024", "Lottery", amount, "Income", True)])
+    with pytest.raises(ValidationError):
+        ledger.import_transactions([{"date": "03-01-2024", "description": "Lottery", "amount": float(amount),
+                                     "category": "Income"}])
+    with pytest.raises(ValidationError):
+        ledger.set_budget("Food", amount)
+    assert ledger.balance == 950
+    assert len(ledger.transactions) == 2
+    assert ledger.budgets == {}
+    assert ledger.transactions.rollup.verify(ledger.transactions)
+
+
+def test_store_columns_stay_aligned():
+    store = TransactionStore()
+    store.append(Transaction(None, 738000, "Fine", 100, "Food"))
+    with pytest.raises(OverflowError):
+        store.append(Transaction(None, 738000, "Huge", 2 ** 64, "Food"))
+    assert len(store.ids) == len(store.dates) == len(store.cents) == len(store.descriptions) == 1
+    assert [t.description for t in store] == ["Fine"]
+
+
+def test_import_rows_are_checked():
+    with pytest.raises(ValueError):
+        make_transaction("01-01-2024", "Overflow", 1e300)
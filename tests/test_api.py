@@ -0,0 +1,149 @@
+import http.client
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api import MAX_BODY, IngestServer
+from conftest import open_ledger
+
+
+@pytest.fixture
+def server(make_ledger):
+    server = IngestServer(make_ledger(), port=0).start()
+    yield server
+    server.stop()
+
+
+def send(server, method, path, payload=None, headers=None, body=None):
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=10)
+    try:
+        if payload is not None:
+            body = json.dumps(payload)
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def request(server, *args, **kwargs):
+    # The client runs on a thread of its own while this one, the ledger's
+    # owner, drains the queued requests like the window does
+    with ThreadPoolExecutor(1) as pool:
+        future = pool.submit(send, server, *args, **kwargs)
+        while not future.done():
+            server.drain(wait=0.01)
+        return future.result()
+
+
+def fund(server, amount=1000):
+    status, body = request(server, "POST", "/transactions", {"date": "01-01-2024", "description": "Salary",
+                                                             "amount": amount, "category": "Income"})
+    assert status == 201
+
+
+def test_single_transaction(server):
+    status, body = request(server, "POST", "/transactions",
+                           {"date": "01-01-2024", "description": "Salary", "amount": 1000, "type": "income"})
+    assert status == 201
+    assert body["balance"] == 1000
+    transaction = server.ledger.get(body["ids"][0])
+    assert (transaction.description, transaction.category) == ("Salary", "Others")
+
+    # The sign says which it is, also in a string
+    status, body = request(server, "POST", "/transactions",
+                           {"date": "02-01-2024", "description": "Groceries", "amount": "-42.50", "category": "Food"})
+    assert (status, body["balance"]) == (201, 957.5)
+    status, body = request(server, "POST", "/transactions",
+                           {"date": "03-01-2024", "description": "Refund", "amount": "12", "category": "Food"})
+    assert (status, body["balance"]) == (201, 969.5)
+
+
+def test_list_of_transactions(server):
+    fund(server)
+    status, body = request(server, "POST", "/transactions", {"transactions": [
+        {"date": "02-01-2024", "description": "Rent", "amount": 700, "category": "Rent", "type": "expense"},
+        {"date": "03-01-2024", "description": "Bakery", "amount": -4.2, "category": "Food"}]})
+    assert status == 201
+    assert len(body["ids"]) == 2
+    assert body["balance"] == 295.8
+    assert len(server.ledger.transactions) == 3
+
+
+def test_list_is_all_or_nothing(server):
+    fund(server)
+    request(server, "POST", "/budgets", {"category": "Food", "amount": 100})
+    entries = [{"date": "02-01-2024", "description": "Rent", "amount": -700, "category": "Rent"},
+               {"date": "03-01-2024", "description": "Party", "amount": -400, "category": "Fun"}]
+    status, body = request(server, "POST", "/transactions", entries)
+    assert (status, body["index"]) == (409, 1)
+    assert body["error"] == "Insufficient balance!"
+
+    entries[1] = {"date": "03-01-2024", "description": "Dinner", "amount": -150, "category": "Food"}
+    status, body = request(server, "POST", "/transactions", entries)
+    assert (status, body["index"], body["title"]) == (409, 1, "Budget Exceeded")
+
+    entries[1] = {"date": "31-02-2024", "description": "Dinner", "amount": -15, "category": "Food"}
+    status, body = request(server, "POST", "/transactions", entries)
+    assert (status, body["index"]) == (422, 1)
+
+    status, body = request(server, "GET", "/status")
+    assert (body["balance"], body["transactions"]) == (1000, 1)
+
+
+def test_bad_entries(server):
+    for entry in [{"amount": "lots"}, {"amount": [1]}, {"amount": 1, "type": "gift"}, {"amount": 1, "date": 1}, []]:
+        status, body = request(server, "POST", "/transactions", entry)
+        assert status == 400, entry
+    assert len(server.ledger.transactions) == 0
+
+
+def test_budgets(server):
+    status, body = request(server, "POST", "/budgets", {"category": "Food", "amount": "250"})
+    assert (status, body["budgets"]) == (200, {"Food": 250})
+    status, body = request(server, "POST", "/budgets", {"budgets": {"Food": None, "Rent": 900}})
+    assert body["budgets"] == {"Rent": 900}
+    # One bad amount and none of them is set
+    status, body = request(server, "POST", "/budgets", {"budgets": {"Fun": 50, "Rent": -1}})
+    assert status == 422
+    assert server.ledger.budgets == {"Rent": 900}
+
+
+def test_status(server):
+    fund(server, 50)
+    request(server, "POST", "/budgets", {"category": "Food", "amount": 20})
+    status, body = request(server, "GET", "/status")
+    assert (status, body) == (200, {"balance": 50, "transactions": 1, "budgets": {"Food": 20}})
+
+
+def test_rejections(server):
+    payload = {"date": "01-01-2024", "description": "Salary", "amount": 10}
+    status, body = request(server, "POST", "/transactions", payload, {"Origin": "http://example.com"})
+    assert status == 403
+    status, body = request(server, "POST", "/transactions", payload, {"Content-Type": "text/plain"})
+    assert status == 415
+    status, body = request(server, "POST", "/transactions", body="{not json")
+    assert status == 400
+    assert request(server, "GET", "/transactions")[0] == 405
+    assert request(server, "GET", "/nowhere")[0] == 404
+
+    # Turned away on the header, before any of the body is read
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=10)
+    connection.putrequest("POST", "/transactions")
+    connection.putheader("Content-Type", "application/json")
+    connection.putheader("Content-Length", str(MAX_BODY + 1))
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == 413
+    connection.close()
+    assert len(server.ledger.transactions) == 0
+
+
+def test_saved(server, tmp_path):
+    fund(server)
+    server.ledger.close()
+    reopened = open_ledger(tmp_path)
+    assert reopened.balance == 1000
+    reopened.close()
@@ -0,0 +1,117 @@
+import csv
+import gzip
+import json
+import os
+
+import pytest
+
+from export import CSV_HEADER, Export, export_format
+from transaction_store import TransactionStore
+
+ROWS = [{"id": i, "date": f"{i % 28 + 1:02d}-01-2024", "description": f"Row, \"{i}\"", "amount": i - 12.5,
+         "category": "Food" if i % 2 else "Income"} for i in range(1, 26)]
+
+
+@pytest.fixture
+def store():
+    return TransactionStore(ROWS)
+
+
+def run(store, path, ids=None, chunk_size=4):
+    export = Export(store, str(path), ids, chunk_size=chunk_size).start()
+    assert export.wait(10)
+    assert export.error is None
+    return export
+
+
+def read_csv(file):
+    rows = list(csv.reader(file))
+    assert rows[0] == CSV_HEADER
+    return [[date, description, float(amount), category] for date, description, amount, category in rows[1:]]
+
+
+def expected(ids=None):
+    rows = ROWS if ids is None else [ROWS[i - 1] for i in ids]
+    return [[t["date"], t["description"], t["amount"], t["category"]] for t in rows]
+
+
+def test_csv(store, tmp_path):
+    export = run(store, tmp_path / "out.csv")
+    assert export.done == export.total == 25
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as f:
+        assert read_csv(f) == expected()
+
+
+def test_csv_gz_with_ids(store, tmp_path):
+    # Just the given ids, in their order
+    run(store, tmp_path / "out.csv.gz", ids=[7, 3, 25])
+    with gzip.open(tmp_path / "out.csv.gz", "rt", newline="", encoding="utf-8") as f:
+        assert read_csv(f) == expected([7, 3, 25])
+
+
+def test_jsonl(store, tmp_path):
+    store.remove(2)
+    run(store, tmp_path / "out.jsonl")
+    with open(tmp_path / "out.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [dict(t, amount=float(t["amount"])) for t in ROWS if t["id"] != 2]
+
+
+def test_format_from_name():
+    assert [export_format(name) for name in ["a.csv", "a.csv.gz", "a.jsonl", "a.txt"]] == \
+        ["csv", "csv.gz", "jsonl", "csv"]
+
+
+class CancellingStore:
+    # Cancels the export after handing out `after` rows
+    def __init__(self, store, after):
+        self.store = store
+        self.after = after
+        self.slots = store.slots
+        self.export = None
+
+    def __len__(self):
+        return len(self.store)
+
+    def row(self, slot):
+        self.after -= 1
+        if self.after == 0:
+            self.export.cancel()
+        return self.store.row(slot)
+
+
+@pytest.mark.parametrize("name", ["out.csv", "out.csv.gz", "out.jsonl"])
+def test_cancel_leaves_nothing(store, tmp_path, name):
+    cancelling = CancellingStore(store, after=10)
+    export = Export(cancelling, str(tmp_path / name), list(store.slots), chunk_size=4)
+    cancelling.export = export
+    export.start()
+    assert export.wait(10)
+    assert export.error is None
+    assert 0 < export.done < export.total
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancel_keeps_the_old_file(store, tmp_path):
+    target = tmp_path / "out.csv"
+    target.write_text("earlier export")
+    export = Export(store, str(target))
+    export.cancel()
+    export.start().wait(10)
+    assert target.read_text() == "earlier export"
+    assert os.listdir(tmp_path) == ["out.csv"]
+
+
+def test_failure_leaves_nothing(store, tmp_path):
+    export = Export(store, str(tmp_path / "missing" / "out.csv")).start()
+    export.wait(10)
+    assert isinstance(export.error, OSError)
+    assert os.listdir(tmp_path) == []
+
+
+def test_ledger_export_csv(make_ledger, tmp_path):
+    ledger = make_ledger()
+    ledger.add_transaction("01-01-2024", "Salary", 1000, "Income", True)
+    ledger.add_transaction("02-01-2024", "Groceries", 40, "Food", False)
+    ledger.export_csv(str(tmp_path / "all.csv"))
+    with open(tmp_path / "all.csv", newline="", encoding="utf-8") as f:
+        assert read_csv(f) == [["01-01-2024", "Salary", 1000.0, "Income"], ["02-01-2024", "Groceries", -40.0, "Food"]]
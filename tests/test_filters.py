@@ -0,0 +1,142 @@
+import random
+from datetime import date, datetime
+
+import pytest
+
+import transaction_store
+from ledger import narrows
+from transaction_store import DateIndex, Transaction, TransactionStore
+
+CATEGORIES = ["Food", "Rent", "Fun", "Income"]
+FIRST = date(2024, 1, 1).toordinal()
+
+
+@pytest.fixture(params=["numpy", "python"])
+def store(request, monkeypatch):
+    # A store that has seen appends, bulk extends, edits and deletes, built
+    # with and without numpy
+    if request.param == "python":
+        monkeypatch.setattr(transaction_store, "np", None)
+    rng = random.Random(7)
+
+    def row():
+        return Transaction(None, FIRST + rng.randrange(90), rng.choice(["Bakery", "Rent", "Cinema"]),
+                           rng.randrange(-5000, 5000) or 1, rng.choice(CATEGORIES))
+    store = TransactionStore()
+    for _ in range(100):
+        store.append(row())
+    store.extend([row() for _ in range(300)])
+    for transaction_id in rng.sample(range(1, 401), 60):
+        store.update(transaction_id, row())
+    for transaction_id in rng.sample(range(1, 401), 80):
+        if transaction_id in store:
+            store.remove(transaction_id)
+    assert store.dead
+    return store
+
+
+def brute_force(store, category=None, start=None, end=None):
+    return [t.id for t in store if (category is None or t.category == category) and
+            (start is None or t.ordinal >= start.toordinal()) and (end is None or t.ordinal <= end.toordinal())]
+
+
+def day(offset):
+    return datetime.fromordinal(FIRST + offset)
+
+
+RANGES = [(None, None), (day(0), None), (None, day(0)), (day(10), day(10)), (day(10), day(40)),
+          (day(89), day(89)), (day(50), day(20)), (day(-30), day(-1)), (day(90), None)]
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+@pytest.mark.parametrize("category", [None, "Food", "Income", "Missing"])
+def test_select_matches_a_full_scan(store, category, start, end):
+    expected = brute_force(store, category, start, end)
+    assert list(store.select(category, start, end)) == expected
+
+    by_date = store.select(category, start, end, by_date=True)
+    assert sorted(by_date) == expected
+    dates = [store.get(i).ordinal for i in by_date]
+    assert dates == sorted(dates)
+
+
+def test_boundaries_are_inclusive(store):
+    # Every row on the first and last day of a range is in it, none a day outside
+    for offset in (0, 45, 89):
+        on_day = brute_force(store, start=day(offset), end=day(offset))
+        assert on_day
+        assert list(store.select(start=day(offset), end=day(offset))) == on_day
+        assert set(on_day) <= set(store.select(start=day(offset)))
+        assert set(on_day) <= set(store.select(end=day(offset)))
+        assert not set(on_day) & set(store.select(start=day(offset + 1)))
+
+
+def test_deleted_rows_are_never_selected(store):
+    dead = [slot for slot, transaction_id in enumerate(store.ids) if not transaction_id]
+    assert 0 not in store.select()
+    assert not set(dead) & set(store.date_index.positions)
+    store.compact()
+    assert not store.dead
+    assert list(store.select(start=day(10), end=day(40))) == brute_force(store, start=day(10), end=day(40))
+
+
+def test_date_index():
+    index = DateIndex()
+    for position, ordinal in enumerate([5, 3, 5, 1, 9, 5]):
+        index.insert(ordinal, position)
+    assert list(index.dates) == [1, 3, 5, 5, 5, 9]
+    # Equal dates keep the order they came in
+    assert list(index.range(5, 5)) == [0, 2, 5]
+    assert list(index.range(2, 8)) == [1, 0, 2, 5]
+    assert list(index.range(None, 0)) == []
+    assert list(index.range(10, None)) == []
+    index.remove(5, 2)
+    assert list(index.range(5, 5)) == [0, 5]
+    assert len(index) == 5
+
+
+FILTERS = [(category, start, end, text) for category in (None, "Food")
+           for start, end in [(None, None), (day(10), None), (day(10), day(40)), (day(20), day(30))]
+           for text in (None, "", "ba", "bak*", "bakery", "r", "re* n", "foo*")]
+
+
+def test_narrowing_filters_can_be_refined(store):
+    # Whenever `narrows` says so, refining the old result gives what a fresh filter would
+    refined = 0
+    for old in FILTERS:
+        previous = list(store.select(*old[:3], text=old[3]))
+        for new in FILTERS:
+            if narrows(new, old):
+                assert store.refine(previous, *new) == list(store.select(*new[:3], text=new[3])), (old, new)
+                refined += 1
+    assert refined > len(FILTERS)
+
+
+def test_refine_drops_deleted_rows(store):
+    previous = list(store.select("Food"))
+    gone = previous[::3]
+    for transaction_id in gone:
+        store.remove(transaction_id)
+    assert store.refine(previous, "Food") == [i for i in previous if i not in gone]
+    assert store.refine(previous, "Food", text="bakery") == [i for i in previous if i not in gone and
+                                                             store.get(i).description == "Bakery"]
+
+
+def test_narrows():
+    everything = (None, None, None, None)
+    january = (None, datetime(2024, 1, 1), datetime(2024, 1, 31), None)
+    assert narrows(("Food", None, None, None), everything)
+    assert not narrows(everything, ("Food", None, None, None))
+    assert not narrows(("Rent", None, None, None), ("Food", None, None, None))
+    assert narrows(january, everything)
+    assert narrows((None, datetime(2024, 1, 10), datetime(2024, 1, 31), None), january)
+    assert not narrows((None, datetime(2023, 12, 31), datetime(2024, 1, 31), None), january)
+    assert not narrows((None, datetime(2024, 1, 1), None, None), january)
+    # Longer text, more terms or a prefix in place of a substring only ever match less
+    assert narrows((None, None, None, "supe"), (None, None, None, "sup"))
+    assert narrows((None, None, None, "super*"), (None, None, None, "sup*"))
+    assert narrows((None, None, None, "sup*"), (None, None, None, "sup"))
+    assert narrows((None, None, None, "sup rent"), (None, None, None, "sup"))
+    assert not narrows((None, None, None, "sup"), (None, None, None, "sup*"))
+    assert not narrows((None, None, None, "su"), (None, None, None, "sup"))
+    assert not narrows((None, None, None, "sup"), (None, None, None, "sup rent"))
@@ -0,0 +1,164 @@
+import json
+import os
+
+import pytest
+
+from importer import normalize_date, parse_amount, parse_csv, parse_file, parse_ofx, parse_qif
+from ledger import BudgetExceededError
+from storage import JOURNAL_FILE
+
+BANK_CSV = """Booking date;Payee;Debit;Credit;Category
+02.01.2024;Bakery;4,20;;Food
+03/01/2024;Salary;;"2.500,00"
+2024-01-04;Rent;950;;Rent
+05.01.2024;Nothing;;
+31.02.2024;Bad date;1;;
+"""
+
+PLAIN_CSV = """01-01-2024,Salary,1000.00,Income
+02-01-2024,Groceries,-42.50,Food
+
+02-01-2024,Lottery,lots,Fun
+"""
+
+OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240102120000[0:GMT]<TRNAMT>-4.20<NAME>Bakery</STMTTRN>
+<STMTTRN>
+  <TRNTYPE>CREDIT</TRNTYPE>
+  <DTPOSTED>20240103</DTPOSTED>
+  <TRNAMT>2500.00</TRNAMT>
+  <MEMO>Salary</MEMO>
+</STMTTRN>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>2024<TRNAMT>-1<NAME>Broken</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+QIF = """!Type:Bank
+D01/02'24
+T-4.20
+PBakery
+LFood
+^
+D1/3/2024
+U2,500.00
+MSalary
+L[Savings]
+^
+D13/13/2024
+T-1
+PBroken
+^
+"""
+
+
+def write(tmp_path, name, content):
+    path = os.path.join(tmp_path, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def summary(rows):
+    return [(t["date"], t["description"], t["amount"], t["category"]) for t in rows]
+
+
+def test_bank_csv(tmp_path):
+    rows, errors = parse_csv(write(tmp_path, "bank.csv", BANK_CSV))
+    # `;` delimited, debit and credit columns, several date formats
+    assert summary(rows) == [("02-01-2024", "Bakery", -4.2, "Food"),
+                             ("03-01-2024", "Salary", 2500.0, "Others"),
+                             ("04-01-2024", "Rent", -950.0, "Rent")]
+    assert errors == ["bank.csv:5: zero amount", "bank.csv:6: unrecognized date '31.02.2024'"]
+
+
+def test_headerless_csv(tmp_path):
+    # Our own export's columns, without the header
+    rows, errors = parse_csv(write(tmp_path, "plain.csv", PLAIN_CSV))
+    assert summary(rows) == [("01-01-2024", "Salary", 1000.0, "Income"), ("02-01-2024", "Groceries", -42.5, "Food")]
+    assert len(errors) == 1 and errors[0].startswith("plain.csv:4:")
+
+
+def test_ofx(tmp_path):
+    rows, errors = parse_ofx(write(tmp_path, "bank.ofx", OFX))
+    assert summary(rows) == [("02-01-2024", "Bakery", -4.2, "Others"), ("03-01-2024", "Salary", 2500.0, "Others")]
+    assert errors == ["bank.ofx: transaction 3: unrecognized date '2024'"]
+
+
+def test_qif(tmp_path):
+    rows, errors = parse_qif(write(tmp_path, "bank.qif", QIF))
+    # Transfers ([Account]) are not categories
+    assert summary(rows) == [("02-01-2024", "Bakery", -4.2, "Food"), ("03-01-2024", "Salary", 2500.0, "Others")]
+    assert errors == ["bank.qif:15: unrecognized date '13/13/2024'"]
+
+
+def test_unsupported_and_unreadable(tmp_path):
+    assert parse_file(write(tmp_path, "notes.txt", "hello")) == ([], ["notes.txt: unsupported file type"])
+    rows, errors = parse_file(os.path.join(tmp_path, "missing.csv"))
+    assert rows == [] and errors[0].startswith("missing.csv: ")
+
+
+@pytest.mark.parametrize("text, amount", [("1,234.56", 1234.56), ("1.234,56", 1234.56), ("12,5", 12.5),
+                                          ("1,234", 1234.0), ("€ -3.10", -3.1), ("(7.25)", -7.25), ("$10", 10.0)])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == amount
+
+
+def test_normalize_date():
+    assert normalize_date(" 2024-03-01 ") == "01-03-2024"
+    assert normalize_date("01/03/24") == "01-03-2024"
+    assert normalize_date("20240301") == "01-03-2024"
+    with pytest.raises(ValueError):
+        normalize_date("March 1st")
+
+
+def journal_ops(directory):
+    with open(os.path.join(directory, JOURNAL_FILE)) as f:
+        return [json.loads(line)["op"] for line in f]
+
+
+def test_duplicates_against_ledger_and_earlier_files(make_ledger):
+    ledger = make_ledger()
+    ledger.add_transaction("01-01-2024", "Savings", 5000, "Income", True)
+    ledger.add_transaction("02-01-2024", "Bakery", 4.2, "Food", False)
+    bakery = {"date": "02-01-2024", "description": " BAKERY ", "amount": -4.2, "category": "Food"}
+    salary = {"date": "03-01-2024", "description": "Salary", "amount": 2500.0, "category": "Others"}
+    # The ledger has one bakery row: a second one in the same file is new. The
+    # next file repeats the first and adds nothing new but a third bakery row.
+    new, duplicates = ledger.find_duplicates([[bakery, bakery, salary], [salary, bakery, bakery, bakery]])
+    assert new == [bakery, salary, bakery]
+    assert duplicates == [bakery, salary, bakery, bakery]
+
+
+def test_import_files(make_ledger, tmp_path):
+    ledger = make_ledger()
+    ledger.add_transaction("01-01-2024", "Savings", 5000, "Income", True)
+    ledger.flush()
+    paths = [write(tmp_path, "bank.csv", BANK_CSV), write(tmp_path, "bank.ofx", OFX),
+             write(tmp_path, "bank.qif", QIF)]
+    ids, duplicates, errors = ledger.import_files(paths)
+    # The same bakery and salary rows are in all three statements
+    assert sorted(ledger.get(i).description for i in ids) == ["Bakery", "Rent", "Salary"]
+    assert len(duplicates) == 4
+    assert len(errors) == 4
+    assert ledger.balance == 5000 - 4.2 + 2500 - 950
+    ledger.flush()
+    # One record for the whole import
+    assert journal_ops(tmp_path) == ["add", "add_many"]
+
+    # Importing the same files again adds nothing
+    ids, duplicates, errors = ledger.import_files(paths)
+    assert ids == [] and len(duplicates) == 7
+
+
+def test_import_is_all_or_nothing(make_ledger):
+    ledger = make_ledger()
+    ledger.add_transaction("01-01-2024", "Savings", 100, "Income", True)
+    ledger.set_budget("Food", 10)
+    rows = [{"date": "02-01-2024", "description": "Bakery", "amount": -4, "category": "Food"},
+            {"date": "03-01-2024", "description": "Dinner", "amount": -8, "category": "Food"}]
+    with pytest.raises(BudgetExceededError):
+        ledger.import_transactions(rows)
+    assert len(ledger.transactions) == 1
+    assert ledger.import_transactions(rows, allow_over_budget=True)
+    assert ledger.balance == 88
@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from conftest import open_ledger
+from storage import JOURNAL_FILE, TRANSACTIONS_FILE
+
+WORKERS = 4
+PER_WORKER = 60
+
+
+def journal_lines(directory):
+    path = os.path.join(directory, JOURNAL_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        return f.read().splitlines()
+
+
+def test_replay_after_torn_write(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.add_transaction("01-01-2024", "Salary", 1000, "Income", True)
+    ledger.add_transaction("02-01-2024", "Groceries", 40, "Food", False)
+    ledger.set_budget("Food", 200)
+    ledger.flush()
+    # A crash halfway through the next append, without closing
+    ledger.writer.close()
+    with open(os.path.join(tmp_path, JOURNAL_FILE), "ab") as f:
+        f.write(b'{"op": "add", "transaction": {"id": 3, "date": "03-01')
+    good = len(journal_lines(tmp_path)) - 1
+
+    reopened = open_ledger(tmp_path)
+    assert reopened.balance == 960
+    assert reopened.budgets == {"Food": 200}
+    assert [t.description for t in reopened.transactions] == ["Salary", "Groceries"]
+    # The torn tail is cut off, so the next record starts on a line of its own
+    assert len(journal_lines(tmp_path)) == good
+    reopened.add_transaction("03-01-2024", "Bakery", 5, "Food", False)
+    reopened.flush()
+    assert len(journal_lines(tmp_path)) == good + 1
+    reopened.writer.close()
+    assert open_ledger(tmp_path).balance == 955
+
+
+def test_compaction(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.storage.compact_every = 5
+    for day in range(1, 13):
+        ledger.add_transaction(f"{day:02d}-01-2024", f"Day {day}", 10, "Income", True)
+    ledger.flush()
+    # Folded into the snapshot every few records, which remembers the last one it holds
+    assert len(journal_lines(tmp_path)) < 5
+    with open(os.path.join(tmp_path, TRANSACTIONS_FILE)) as f:
+        snapshot = json.load(f)
+    assert snapshot["journal_seq"] > 0
+    assert len(snapshot["transactions"]) + len(journal_lines(tmp_path)) == 12
+    ledger.close()
+    assert not journal_lines(tmp_path)
+    reopened = open_ledger(tmp_path)
+    assert reopened.balance == 120
+    assert len(reopened.transactions) == 12
+    reopened.close()
+
+
+def test_compaction_keeps_other_writers(tmp_path):
+    first, second = open_ledger(tmp_path), open_ledger(tmp_path)
+    first.add_transaction("01-01-2024", "First", 10, "Income", True)
+    second.add_transaction("01-01-2024", "Second", 20, "Income", True)
+    first.flush()
+    second.flush()
+    # `first` never saw the other row, yet its compaction must not drop it
+    first.close()
+    assert second.poll_external()
+    assert sorted(t.description for t in second.transactions) == ["First", "Second"]
+    second.close()
+    reopened = open_ledger(tmp_path)
+    assert reopened.balance == 30
+    assert len({t.id for t in reopened.transactions}) == 2
+    reopened.close()
+
+
+def append_rows(directory, mode, worker):
+    ledger = open_ledger(directory, mode)
+    # Small enough that the workers compact while the others are appending
+    ledger.storage.compact_every = 25
+    for i in range(0, PER_WORKER, 3):
+        ledger.add_transaction("01-02-2024", f"w{worker}-{i}", 1, "Income", True)
+        ledger.add_transactions([("02-02-2024", f"w{worker}-{i + 1}", 2, "Income", True),
+                                 ("03-02-2024", f"w{worker}-{i + 2}", 3, "Income", True)])
+        ledger.poll_external()
+    ledger.close()
+
+
+# Partitioned ledgers are single-process by design
+@pytest.mark.parametrize("mode", ["journal", "binary"])
+def test_concurrent_appends(tmp_path, mode):
+    open_ledger(tmp_path, mode).close()
+    processes = [multiprocessing.Process(target=append_rows, args=(str(tmp_path), mode, worker))
+                 for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * WORKERS
+
+    ledger = open_ledger(tmp_path, mode)
+    ledger.load_years()
+    rows = list(ledger.transactions)
+    assert len(rows) == WORKERS * PER_WORKER
+    assert len({t.id for t in rows}) == len(rows)
+    assert {t.description for t in rows} == {f"w{worker}-{i}" for worker in range(WORKERS)
+                                             for i in range(PER_WORKER)}
+    assert ledger.balance == WORKERS * PER_WORKER // 3 * 6
+    ledger.close()
@@ -0,0 +1,146 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from ledger import Ledger
+from storage import PartitionedStorage
+from transaction_store import from_cents, to_cents
+
+YEARS = [2021, 2022, 2023, 2024]
+
+
+def open_partitioned(directory):
+    # 2024 is the current year, whatever today is
+    storage = PartitionedStorage(str(directory / "ledger"), str(directory / "budgets.json"), current_year=2024,
+                                 rules_file=str(directory / "recurring.json"))
+    return Ledger(storage, save_delay=0)
+
+
+def rows():
+    return [{"date": f"{day:02d}-{month:02d}-{year}", "description": f"{category} {year}", "amount": amount,
+             "category": category}
+            for year in YEARS for month in (3, 9) for day in (1, 15)
+            for category, amount in [("Income", 500), ("Food", -20.5), ("Rent", -300)]]
+
+
+def partition(directory, year):
+    with open(directory / "ledger" / f"{year}.json") as f:
+        return json.load(f)["transactions"]
+
+
+def stamp(directory, year):
+    stat = os.stat(directory / "ledger" / f"{year}.json")
+    return stat.st_mtime_ns, stat.st_ino
+
+
+@pytest.fixture
+def directory(tmp_path):
+    ledger = open_partitioned(tmp_path)
+    ledger.import_transactions(rows())
+    ledger.set_budget("Food", 100)
+    ledger.close()
+    return tmp_path
+
+
+def test_split_by_year(directory):
+    with open(directory / "ledger" / "manifest.json") as f:
+        manifest = json.load(f)
+    assert sorted(manifest["partitions"]) == [str(year) for year in YEARS]
+    for year in YEARS:
+        saved = partition(directory, year)
+        assert len(saved) == manifest["partitions"][str(year)]["count"] == 12
+        assert {t["date"][-4:] for t in saved} == {str(year)}
+    assert manifest["next_id"] == len(rows()) + 1
+
+
+def test_only_the_current_year_is_loaded(directory):
+    ledger = open_partitioned(directory)
+    assert ledger.transactions.partitions == {2024}
+    assert len(ledger.transactions) == 12
+    # Balance and reports cover every year through the manifest
+    total = sum(to_cents(t["amount"]) for t in rows())
+    assert ledger.balance == from_cents(total)
+    assert ledger.expense_totals() == {"Food": 20.5 * 16, "Rent": 300 * 16}
+    assert [period for period, income, expense in ledger.monthly_totals()] == \
+        [(year, month) for year in YEARS for month in (3, 9)]
+    assert ledger.budget_utilization("Food") == (20.5 * 16, 0)
+    ledger.close()
+
+
+def test_filters_load_older_years(directory):
+    ledger = open_partitioned(directory)
+    found = ledger.filter("Rent", datetime(2022, 1, 1), datetime(2022, 12, 31))
+    assert [ledger.get(i).description for i in found] == ["Rent 2022"] * 4
+    assert ledger.transactions.partitions == {2022, 2024}
+    # The rollup does not count a year twice once it is in memory
+    assert ledger.expense_totals() == {"Food": 20.5 * 16, "Rent": 300 * 16}
+    assert len(ledger.filter()) == 48
+    assert ledger.transactions.partitions == set(YEARS)
+    assert ledger.transactions.rollup.verify(ledger.transactions)
+    ledger.close()
+
+
+def test_imports_and_exports_load_older_years(directory, tmp_path):
+    ledger = open_partitioned(directory)
+    # Duplicates are found in the year the rows belong to
+    old = [t for t in rows() if t["date"].endswith("2021")][:3]
+    new, duplicates = ledger.find_duplicates([old])
+    assert (new, duplicates) == ([], old)
+    assert 2021 in ledger.transactions.partitions
+
+    export_file = tmp_path / "all.csv"
+    ledger.export_csv(str(export_file))
+    with open(export_file) as f:
+        assert len(f.readlines()) == 1 + len(rows())
+    ledger.close()
+
+
+def test_compaction_rewrites_only_loaded_years(directory):
+    ledger = open_partitioned(directory)
+    untouched = {year: stamp(directory, year) for year in (2021, 2022)}
+    ledger.filter(start=datetime(2023, 1, 1), end=datetime(2023, 12, 31))
+    rent_2023 = ledger.filter("Rent", datetime(2023, 1, 1), datetime(2023, 12, 31))
+    for transaction_id in rent_2023:
+        ledger.delete_transaction(transaction_id)
+    ledger.add_transaction("01-10-2024", "New", 10, "Income", True)
+    ledger.close()
+
+    assert {year: stamp(directory, year) for year in (2021, 2022)} == untouched
+    assert len(partition(directory, 2023)) == 8
+    assert len(partition(directory, 2024)) == 13
+    reopened = open_partitioned(directory)
+    assert reopened.balance == from_cents(sum(to_cents(t["amount"]) for t in rows()) + 300 * 400 + 1000)
+    reopened.load_years()
+    assert len(reopened.transactions) == 48 - 4 + 1
+    reopened.close()
+
+
+def test_emptied_year_is_removed(directory):
+    ledger = open_partitioned(directory)
+    for transaction_id in ledger.filter(start=datetime(2021, 1, 1), end=datetime(2021, 12, 31)):
+        ledger.delete_transaction(transaction_id)
+    ledger.close()
+    assert not os.path.exists(directory / "ledger" / "2021.json")
+    reopened = open_partitioned(directory)
+    assert reopened.storage.partition_years() == [2022, 2023, 2024]
+    reopened.close()
+
+
+def test_unsaved_changes_are_replayed(directory):
+    ledger = open_partitioned(directory)
+    ledger.filter(start=datetime(2022, 1, 1), end=datetime(2022, 12, 31))
+    old = ledger.filter("Food", datetime(2022, 1, 1), datetime(2022, 12, 31))[0]
+    ledger.delete_transaction(old)
+    ledger.add_transaction("02-10-2024", "After", 5, "Income", True)
+    ledger.flush()
+    # A crash: the journal holds the changes, the partitions do not
+    ledger.writer.close()
+
+    reopened = open_partitioned(directory)
+    reopened.load_years()
+    assert old not in reopened.transactions
+    assert "After" in {t.description for t in reopened.transactions}
+    assert reopened.balance == from_cents(sum(to_cents(t["amount"]) for t in rows()) + 2050 + 500)
+    reopened.close()
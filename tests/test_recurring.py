@@ -0,0 +1,138 @@
+import os
+from datetime import date
+
+import pytest
+
+from conftest import STORAGE_MODES, open_ledger
+from storage import RECURRING_FILE, write_json_atomic
+
+JUNE = date(2024, 6, 30).toordinal()
+
+
+def add_rent(ledger, end_date=None):
+    return ledger.add_rule("Rent", 500, "Rent", False, 1, start_date="01-01-2024", end_date=end_date)
+
+
+def descriptions(ledger):
+    return sorted(t.description for t in ledger.transactions)
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_rules_are_saved_with_the_data(tmp_path, mode):
+    ledger = open_ledger(tmp_path, mode)
+    ledger.add_transaction("01-01-2024", "Savings", 10000, "Income", True)
+    rent = add_rent(ledger)
+    salary = ledger.add_rule("Salary", 2000, "Income", True, 25, start_date="01-01-2024")
+    gym = ledger.add_rule("Gym", 30, "Fun", False, 5, start_date="01-01-2024")
+    assert len({rent.id, salary.id, gym.id}) == 3
+    ledger.remove_rule(gym.id)
+    assert len(ledger.materialize_recurring(JUNE)) == 12
+    ledger.close()
+
+    reopened = open_ledger(tmp_path, mode)
+    assert [(rule.id, rule.description, rule.done) for rule in reopened.rules] == \
+        [(rent.id, "Rent", 6), (salary.id, "Salary", 6)]
+    assert reopened.materialize_recurring(JUNE) == []
+    reopened.load_years()
+    assert len(reopened.transactions) == 13
+    reopened.close()
+
+
+@pytest.mark.parametrize("mode", ["json", "sqlite", "partitioned", "binary"])
+def test_rules_file_is_migrated(tmp_path, mode):
+    # Rules saved by the JSON modes come along when the ledger moves to another mode
+    write_json_atomic(os.path.join(tmp_path, RECURRING_FILE), {"rules": [
+        {"id": 3, "description": "Rent", "amount": -500, "category": "Rent", "day": 1, "interval": 1,
+         "start": "01-01-2024", "end": None, "done": 2}]})
+    write_json_atomic(os.path.join(tmp_path, "transactions.json"), {"balance": 0, "transactions": []})
+    ledger = open_ledger(tmp_path, mode)
+    assert [(rule.id, rule.done) for rule in ledger.rules] == [(3, 2)]
+    assert add_rent(ledger).id == 4
+    ledger.close()
+
+
+def test_crash_after_occurrences_are_saved(tmp_path):
+    # The rule's progress is in the same journal record as its occurrences
+    ledger = open_ledger(tmp_path)
+    ledger.add_transaction("01-01-2024", "Savings", 10000, "Income", True)
+    add_rent(ledger)
+    ledger.materialize_recurring(JUNE)
+    ledger.flush()
+    ledger.writer.close()
+
+    reopened = open_ledger(tmp_path)
+    assert reopened.rules[0].done == 6
+    assert reopened.materialize_recurring(JUNE) == []
+    assert descriptions(reopened).count("Rent") == 6
+    reopened.close()
+
+
+def test_processes_share_rules(tmp_path):
+    first, second = open_ledger(tmp_path), open_ledger(tmp_path)
+    first.add_transaction("01-01-2024", "Savings", 10000, "Income", True)
+    second.poll_external()
+    rent = add_rent(first)
+    gym = second.add_rule("Gym", 30, "Fun", False, 5, start_date="01-01-2024")
+    # Rule ids come from the shared counters too
+    assert rent.id != gym.id
+    first.flush()
+    second.flush()
+    first.poll_external()
+    second.poll_external()
+    assert [rule.id for rule in first.rules] == [rule.id for rule in second.rules] == sorted([rent.id, gym.id])
+
+    # Occurrences one process adds are not due in the other any more
+    first.materialize_recurring(JUNE)
+    first.flush()
+    assert second.materialize_recurring(JUNE) == []
+    assert descriptions(second).count("Rent") == descriptions(second).count("Gym") == 6
+
+    second.remove_rule(gym.id)
+    second.flush()
+    first.poll_external()
+    assert [rule.id for rule in first.rules] == [rent.id]
+    first.close()
+    second.close()
+
+    reopened = open_ledger(tmp_path)
+    assert [(rule.id, rule.done) for rule in reopened.rules] == [(rent.id, 6)]
+    assert descriptions(reopened).count("Rent") == 6
+    reopened.close()
+
+
+def test_removed_rule_stays_removed(tmp_path):
+    first, second = open_ledger(tmp_path), open_ledger(tmp_path)
+    first.add_transaction("01-01-2024", "Savings", 10000, "Income", True)
+    rent = add_rent(first)
+    first.flush()
+    second.poll_external()
+    # One removes the rule while the other, not knowing yet, adds its occurrences
+    first.remove_rule(rent.id)
+    first.flush()
+    second.rules[0].done += 1
+    second.add_rows(second.rules[0].transactions([second.rules[0].occurrence(0)]), rules=[{"id": rent.id, "done": 1}])
+    second.flush()
+    first.poll_external()
+    assert first.rules == []
+    first.close()
+    second.close()
+    assert open_ledger(tmp_path).rules == []
+
+
+def test_failed_budget_check_keeps_progress(make_ledger):
+    ledger = make_ledger()
+    ledger.add_transaction("01-01-2024", "Savings", 10000, "Income", True)
+    ledger.set_budget("Rent", 1000)
+    add_rent(ledger)
+    with pytest.raises(Exception):
+        ledger.materialize_recurring(JUNE)
+    assert ledger.rules[0].done == 0
+    assert len(ledger.materialize_recurring(JUNE, allow_over_budget=True)) == 6
+
+
+def test_clear_removes_rules(tmp_path):
+    ledger = open_ledger(tmp_path)
+    add_rent(ledger)
+    ledger.clear()
+    ledger.close()
+    assert open_ledger(tmp_path).rules == []
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+
+import pytest
+
+from conftest import STORAGE_MODES, open_ledger
+from ledger import Ledger
+from report import report_charts
+from storage import open_storage, write_json_atomic
+
+
+def files(directory):
+    contents = {}
+    for folder, _, names in os.walk(directory):
+        for name in names:
+            with open(os.path.join(folder, name), "rb") as f:
+                contents[os.path.relpath(os.path.join(folder, name), directory)] = f.read()
+    return contents
+
+
+def fill(ledger):
+    ledger.add_transaction("01-01-2024", "Salary", 1000, "Income", True)
+    ledger.add_transaction("02-01-2024", "Groceries", 40, "Food", False)
+    ledger.set_budget("Food", 200)
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_report_leaves_files_alone(tmp_path, mode):
+    ledger = open_ledger(tmp_path, mode)
+    fill(ledger)
+    ledger.close()
+    ledger = open_ledger(tmp_path, mode)
+    ledger.add_transaction("03-01-2024", "Bakery", 5, "Food", False)
+    ledger.flush()
+    # Left as a crash would leave it: a journal tail, cut off halfway through a record
+    ledger.writer.close()
+    if hasattr(ledger.storage, "journal_file"):
+        with open(ledger.storage.journal_file, "ab") as f:
+            f.write(b'{"op": "add", "transaction": {"id": 9')
+    elif mode == "sqlite":
+        ledger.storage.close(ledger.balance, ledger.transactions, ledger.budgets)
+    before = files(tmp_path)
+
+    charts = report_charts(str(tmp_path), mode)
+    assert [name for name, chart, args in charts][:2] == ["expenses", "budget-food"]
+    assert charts[0][2] == ({"Food": 45},)
+    assert files(tmp_path) == before
+
+
+@pytest.mark.parametrize("mode", ["sqlite", "partitioned", "binary"])
+def test_report_does_not_migrate(tmp_path, mode):
+    # A ledger still in the JSON files is read from them, not converted
+    write_json_atomic(os.path.join(tmp_path, "transactions.json"), {"balance": 960, "transactions": [
+        {"id": 1, "date": "01-01-2024", "description": "Salary", "amount": 1000, "category": "Income"},
+        {"id": 2, "date": "02-01-2024", "description": "Groceries", "amount": -40, "category": "Food"}]})
+    before = files(tmp_path)
+    charts = report_charts(str(tmp_path), mode)
+    assert charts[0] == ("expenses", "expenses", ({"Food": 40},))
+    assert files(tmp_path) == before
+
+
+def test_read_only_storage_cannot_save(tmp_path):
+    ledger = open_ledger(tmp_path, "sqlite")
+    fill(ledger)
+    ledger.close()
+    ledger = Ledger(open_storage("sqlite", str(tmp_path), read_only=True), save_delay=0)
+    assert ledger.balance == 960
+    ledger.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        ledger.storage.conn.execute("SELECT 1")
+
+    storage = open_storage("journal", str(tmp_path), read_only=True)
+    with pytest.raises(PermissionError):
+        storage.write_batch([({"op": "set_budget", "category": "Fun", "amount": 5}, None)])
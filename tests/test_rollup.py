@@ -0,0 +1,91 @@
+import pytest
+
+from conftest import STORAGE_MODES
+from transaction_store import Rollup
+
+
+def check(ledger):
+    # The running totals against a recount of every transaction in memory
+    ledger.load_years()
+    assert ledger.transactions.rollup.verify(ledger.transactions)
+
+
+def seed(ledger):
+    ledger.add_transaction("01-01-2024", "Salary", 3000, "Income", True)
+    food = ledger.add_transaction("05-01-2024", "Groceries", 82.45, "Food", False)
+    rent = ledger.add_transaction("01-02-2024", "Rent", 950, "Rent", False)
+    ledger.add_transaction("17-02-2024", "Cinema", 12.5, "Fun", False)
+    return food, rent
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_adds(make_ledger, mode):
+    ledger = make_ledger(mode)
+    seed(ledger)
+    check(ledger)
+    ledger.add_transactions([("03-03-2024", "Bakery", "4.20", "Food", False),
+                             ("04-03-2024", "Refund", 20, "Food", True)])
+    check(ledger)
+    assert ledger.transactions.rollup.spent("Food", (2024, 3)) == 420
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_edits(make_ledger, mode):
+    ledger = make_ledger(mode)
+    food, rent = seed(ledger)
+    # Another month, another category, and an expense turned into income
+    ledger.edit_transaction(food, "05-03-2024", "Groceries", 90, "Household", False)
+    check(ledger)
+    ledger.edit_transaction(rent, "01-02-2024", "Rent back", 950, "Rent", True)
+    check(ledger)
+    assert "Rent" not in ledger.expense_totals()
+    assert ledger.transactions.rollup.spent("Food") == 0
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_deletes(make_ledger, mode):
+    ledger = make_ledger(mode)
+    food, rent = seed(ledger)
+    ledger.delete_transaction(food)
+    check(ledger)
+    ledger.delete_transaction(rent)
+    check(ledger)
+    assert (2024, 2) in ledger.transactions.rollup.months()
+    assert sorted(ledger.expense_totals()) == ["Fun"]
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_imports(make_ledger, mode):
+    ledger = make_ledger(mode)
+    seed(ledger)
+    ledger.import_transactions([
+        {"date": f"{day:02d}-{month:02d}-{year}", "description": f"Row {day}", "amount": amount,
+         "category": category}
+        for year in (2022, 2023) for month in range(1, 13) for day, amount, category in
+        ((2, 1500, "Income"), (9, -41.99, "Food"), (23, -120, "Travel"))])
+    check(ledger)
+    assert len(ledger.transactions.rollup.months()) == 26
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_reload(make_ledger, mode):
+    # A ledger loaded back from disk builds the same totals
+    ledger = make_ledger(mode)
+    food, rent = seed(ledger)
+    ledger.edit_transaction(food, "05-01-2023", "Groceries", 60, "Food", False)
+    ledger.delete_transaction(rent)
+    expected = ledger.monthly_totals()
+    ledger.close()
+    reloaded = make_ledger(mode)
+    check(reloaded)
+    assert reloaded.monthly_totals() == expected
+
+
+def test_verify_spots_drift(make_ledger):
+    ledger = make_ledger()
+    seed(ledger)
+    ledger.transactions.rollup.add("Food", ledger.get(1).ordinal, -1)
+    assert not ledger.transactions.rollup.verify(ledger.transactions)
+    fresh = Rollup()
+    fresh.rebuild(ledger.transactions)
+    assert fresh.verify(ledger.transactions)
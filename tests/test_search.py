@@ -0,0 +1,114 @@
+import random
+import re
+from datetime import datetime
+
+import pytest
+
+import transaction_store
+from transaction_store import TextIndex, Transaction, TransactionStore, search_terms
+
+DESCRIPTIONS = ["Supermarket", "Super Saver store", "Bakery", "Coffee bar", "Rent", "Hardware store",
+                "Superb dinner", "Bar-B-Q", "Tax refund", "Café Zürich"]
+CATEGORIES = ["Food", "Rent", "Others", "Income"]
+QUERIES = ["sup", "SUPER", "sup*", "super*", "per*", "store", "sto* super", "super store", "ba", "b*", "bar*",
+           "q", "rent", "food bak*", "inc", "café", "zür*", "nothing", "e", "x*", "  ", "*"]
+
+
+def matches(transaction, text):
+    # What search() should find, checked row by row
+    fields = [transaction.description.lower(), transaction.category.lower()]
+    for term, prefix in search_terms(text):
+        pattern = r"(?<!\w)" + re.escape(term) if prefix else re.escape(term)
+        if not any(re.search(pattern, field) for field in fields):
+            return False
+    return True
+
+
+def random_row(rng):
+    return Transaction(None, 738000 + rng.randrange(60), rng.choice(DESCRIPTIONS), rng.randrange(1, 5000),
+                       rng.choice(CATEGORIES))
+
+
+@pytest.fixture(params=["numpy", "python"])
+def store(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(transaction_store, "np", None)
+    rng = random.Random(3)
+    return TransactionStore([random_row(rng).to_dict() for _ in range(200)])
+
+
+def check(store, queries=QUERIES):
+    for text in queries:
+        expected = [t.id for t in store if matches(t, text)] if search_terms(text) else list(store.select())
+        assert list(store.select(text=text)) == expected, text
+
+
+def test_search_matches_a_full_scan(store):
+    check(store)
+
+
+def test_terms():
+    assert search_terms("Sup* rent  *") == [("sup", True), ("rent", False)]
+    assert search_terms("") == []
+
+
+def test_all_terms_must_match(store):
+    both = store.select(text="super store")
+    assert both and all(store.get(i).description == "Super Saver store" for i in both)
+    # Terms may match the description or the category, but each has to match
+    assert store.select(text="supermarket bakery") == []
+    assert all(store.get(i).category == "Rent" for i in store.select(text="rent bakery"))
+
+
+def test_prefix_matches_word_starts(store):
+    # "per" is inside "Supermarket" but starts no word
+    assert store.select(text="per*") == []
+    assert store.select(text="per")
+    assert {store.get(i).description for i in store.select(text="bar*")} == {"Coffee bar", "Bar-B-Q"}
+
+
+def test_search_with_filters(store):
+    start, end = datetime.fromordinal(738010), datetime.fromordinal(738030)
+    expected = [t.id for t in store if matches(t, "sup*") and t.category == "Food" and 738010 <= t.ordinal <= 738030]
+    assert store.select("Food", start, end, text="sup*") == expected
+
+
+def test_index_follows_changes(store):
+    rng = random.Random(5)
+    check(store)
+    assert store.text_index is not None
+    store.append(Transaction(None, 738000, "Brand new shop", 100, "Others"))
+    store.extend([random_row(rng) for _ in range(10)])
+    store.extend([random_row(rng) for _ in range(300)])
+    for transaction_id in rng.sample(list(store.slots), 50):
+        store.update(transaction_id, random_row(rng))
+    for transaction_id in rng.sample(list(store.slots), 80):
+        store.remove(transaction_id)
+    check(store, QUERIES + ["brand", "new*"])
+
+    # The last row with a description takes it out of the index altogether
+    for transaction_id in store.select(text="brand"):
+        store.remove(transaction_id)
+    assert "Brand new shop" not in store.text_index.postings
+    assert "bra" not in store.text_index.trigrams
+    check(store, ["brand", "shop"])
+
+
+def test_compaction_drops_the_index(store):
+    check(store)
+    for transaction_id in list(store.slots)[::2]:
+        store.remove(transaction_id)
+    store.compact()
+    assert store.text_index is None
+    check(store)
+    assert store.text_index is not None
+
+
+def test_index_build(store):
+    built = TextIndex.build(store)
+    assert set(built.postings) == {t.description for t in store}
+    for description, slots in built.postings.items():
+        assert sorted(slots) == [slot for slot, i in enumerate(store.ids)
+                                 if i and store.descriptions[slot] == description]
+    assert set(built.matching("sup", False)) == {"Supermarket", "Super Saver store", "Superb dinner"}
+    assert set(built.matching("sto", True)) == {"Super Saver store", "Hardware store"}
@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import snapshot
+import transaction_store
+from snapshot import Snapshot, SnapshotError, write_snapshot
+from storage import json_to_snapshot, snapshot_to_json, write_json_atomic
+from transaction_store import TransactionStore, to_cents
+
+TRANSACTIONS = [{"id": i, "date": f"{i % 28 + 1:02d}-{i % 12 + 1:02d}-2024",
+                 "description": ["Bakery", "Rent", "Café Zürich", "Ünïcode ✓"][i % 4],
+                 "amount": round((i - 40) * 1.37, 2), "category": ["Food", "Rent", "Income"][i % 3]}
+                for i in range(1, 80)]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def packing(request, monkeypatch):
+    # Snapshots are packed and read with numpy and without it
+    if request.param == "python":
+        monkeypatch.setattr(snapshot, "np", None)
+        monkeypatch.setattr(transaction_store, "np", None)
+    return request.param
+
+
+def test_json_round_trip(tmp_path, packing):
+    json_file, binary, back = str(tmp_path / "in.json"), str(tmp_path / "out.bin"), str(tmp_path / "back.json")
+    # Rows without an id get one on the way, as when the JSON file is loaded
+    rows = TRANSACTIONS + [{"date": "01-01-2024", "description": "Old row", "amount": 5, "category": "Food"}]
+    write_json_atomic(json_file, {"balance": 1234.56, "transactions": rows})
+    json_to_snapshot(json_file, binary)
+    assert os.path.getsize(binary) < os.path.getsize(json_file)
+    snapshot_to_json(binary, back)
+    with open(back) as f:
+        data = json.load(f)
+    assert data["balance"] == 1234.56
+    assert data["transactions"] == [dict(t, amount=float(t["amount"])) for t in TRANSACTIONS] + \
+        [{"id": 80, "date": "01-01-2024", "description": "Old row", "amount": 5.0, "category": "Food"}]
+
+
+def test_load_through_from_columns(tmp_path, packing):
+    path = str(tmp_path / "t.bin")
+    original = TransactionStore(TRANSACTIONS)
+    original.remove(5)
+    write_snapshot(path, 999, original, journal_seq=7)
+    with Snapshot(path) as loaded:
+        assert (loaded.balance_cents, loaded.journal_seq, len(loaded)) == (999, 7, len(TRANSACTIONS) - 1)
+        assert [t.to_dict() for t in loaded] == list(original.dicts())
+        store = loaded.store()
+    # The store built from the columns works like one built row by row
+    assert list(store.dicts()) == list(original.dicts())
+    assert store.next_id == len(TRANSACTIONS) + 1
+    assert 5 not in store
+    assert store.get(6).description == original.get(6).description
+    assert store.rollup.verify(store)
+    march = (datetime(2024, 3, 1), datetime(2024, 3, 31))
+    assert store.select("Food", *march) == original.select("Food", *march)
+    assert store.select(text="caf*") == original.select(text="caf*")
+    assert store.append(transaction_store.Transaction(None, 738000, "New", to_cents(1), "Fun")) == 80
+
+
+def test_empty_snapshot(tmp_path, packing):
+    path = str(tmp_path / "empty.bin")
+    write_snapshot(path, 0, [])
+    with Snapshot(path) as loaded:
+        assert len(loaded) == 0
+        assert len(loaded.store()) == 0
+
+
+def corrupt(path, offset, data):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def test_tampered_files_are_rejected(tmp_path):
+    path = str(tmp_path / "t.bin")
+    write_snapshot(path, 100, TRANSACTIONS)
+    size = os.path.getsize(path)
+
+    # One flipped amount, then one flipped letter in the string table
+    corrupt(path, snapshot.HEADER.size + 12, b"\x7f")
+    with pytest.raises(SnapshotError, match="checksum"):
+        Snapshot(path)
+    write_snapshot(path, 100, TRANSACTIONS)
+    corrupt(path, size - 1, b"?")
+    with pytest.raises(SnapshotError, match="checksum"):
+        Snapshot(path)
+
+    write_snapshot(path, 100, TRANSACTIONS)
+    with open(path, "r+b") as f:
+        f.truncate(size - 10)
+    with pytest.raises(SnapshotError, match="truncated"):
+        Snapshot(path)
+
+    corrupt(path, 0, b"JSON")
+    with pytest.raises(SnapshotError, match="not a Money Map snapshot"):
+        Snapshot(path)
+
+    open(path, "wb").close()
+    with pytest.raises(SnapshotError, match="empty"):
+        Snapshot(path)
+
+
+def test_command_line(tmp_path, capsys):
+    json_file, binary = str(tmp_path / "in.json"), str(tmp_path / "out.bin")
+    write_json_atomic(json_file, {"balance": 10, "transactions": TRANSACTIONS[:3]})
+    assert snapshot.main(["to-binary", json_file, binary]) == 0
+    assert snapshot.main(["to-json", binary, str(tmp_path / "back.json")]) == 0
+    corrupt(binary, os.path.getsize(binary) - 1, b"?")
+    assert snapshot.main(["to-json", binary, str(tmp_path / "again.json")]) == 1
+    assert "checksum mismatch" in capsys.readouterr().err
+    assert not os.path.exists(tmp_path / "again.json")
@@ -0,0 +1,32 @@
+from transaction_store import Transaction, TransactionStore
+
+
+def make_store(count):
+    return TransactionStore([{"date": f"{day:02d}-01-2024", "description": f"Row {day}", "amount": day,
+                              "category": "Food"} for day in range(1, count + 1)])
+
+
+def test_select_all_is_a_copy():
+    store = make_store(3)
+    everything = store.select()
+    assert list(everything) == [1, 2, 3]
+    # Kept by the table while the store changes underneath
+    store.append(Transaction(None, 738000, "Later", 100, "Food"))
+    assert list(everything) == [1, 2, 3]
+    everything[0] = 99
+    assert store.get(1).description == "Row 1"
+    assert list(store.select()) == [1, 2, 3, 4]
+
+
+def test_columns_round_trip():
+    store = make_store(3)
+    store.update(2, Transaction(2, 738100, "Edited", -500, "Rent"))
+    store.remove(1)
+    assert len(store) == 2
+    assert 1 not in store
+    assert [t.to_dict() for t in store] == [
+        {"id": 2, "date": store.get(2).date, "description": "Edited", "amount": -5.0, "category": "Rent"},
+        {"id": 3, "date": "03-01-2024", "description": "Row 3", "amount": 3.0, "category": "Food"}]
+    store.compact()
+    assert list(store.ids) == [2, 3]
+    assert store.get(3).description == "Row 3"
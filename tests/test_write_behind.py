@@ -0,0 +1,78 @@
+import threading
+import time
+from datetime import datetime
+
+from storage import WriteBehind
+
+
+class RecordingStorage:
+    # Keeps every batch it is asked to write
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def write_batch(self, batch):
+        self.batches.append(batch)
+        self.written.set()
+
+
+def test_only_the_newest_snapshot_is_queued():
+    storage = RecordingStorage()
+    writer = WriteBehind(storage, delay=60, max_delay=60)
+    try:
+        for i in range(1000):
+            writer.submit({"op": "add", "n": i}, ("state", i))
+        with writer.condition:
+            snapshots = [snapshot for record, snapshot in writer.queue if snapshot is not None]
+        assert snapshots == [("state", 999)]
+        assert writer.flush(timeout=5)
+    finally:
+        writer.close()
+    batch, = storage.batches
+    # Every record still goes through, in order
+    assert [record["n"] for record, snapshot in batch] == list(range(1000))
+    assert batch[-1][1] == ("state", 999)
+
+
+def test_a_full_save_is_replaced_by_a_newer_one():
+    storage = RecordingStorage()
+    writer = WriteBehind(storage, delay=60, max_delay=60)
+    try:
+        writer.submit(None, ("state", 1))
+        writer.submit({"op": "delete", "id": 1})
+        writer.submit(None, ("state", 2))
+        writer.flush(timeout=5)
+    finally:
+        writer.close()
+    assert storage.batches == [[({"op": "delete", "id": 1}, None), (None, ("state", 2))]]
+
+
+def test_a_steady_stream_is_written_within_max_delay():
+    # Changes arriving faster than `delay` used to postpone the write forever
+    storage = RecordingStorage()
+    writer = WriteBehind(storage, delay=0.2, max_delay=0.5)
+    try:
+        start = time.monotonic()
+        while not storage.written.is_set() and time.monotonic() - start < 5:
+            writer.submit({"op": "add"})
+            time.sleep(0.01)
+        assert storage.written.is_set()
+        assert time.monotonic() - start < 1.5
+    finally:
+        writer.close()
+
+
+def test_sqlite_filters_see_unsaved_changes(make_ledger):
+    # Filters must not go to the database, which lags behind the writer
+    ledger = make_ledger("sqlite", save_delay=60)
+    salary = ledger.add_transaction("01-01-2024", "Salary", 1000, "Income", True)
+    food = ledger.add_transaction("02-01-2024", "Groceries", 40, "Food", False)
+    january = (datetime(2024, 1, 1), datetime(2024, 1, 31))
+    assert list(ledger.filter()) == [salary, food]
+    assert list(ledger.filter("Food", *january)) == [food]
+    ledger.delete_transaction(food)
+    assert list(ledger.filter()) == [salary]
+    assert ledger.filter("Food", *january) == []
+    assert [ledger.get(i).description for i in ledger.filter(text="sal*")] == ["Salary"]
+    # None of it has reached the database yet
+    assert ledger.writer.pending()
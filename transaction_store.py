@@ -0,0 +1,652 @@
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import compress, repeat
+
+try:
+    import numpy as np
+except ImportError:  # Index building falls back to plain Python loops
+    np = None
+
+
+@lru_cache(maxsize=8192)
+def date_to_ordinal(date_str):
+    return datetime.strptime(date_str, "%d-%m-%Y").toordinal()
+
+
+@lru_cache(maxsize=8192)
+def ordinal_to_date(ordinal):
+    return date.fromordinal(ordinal).strftime("%d-%m-%Y")
+
+
+@lru_cache(maxsize=8192)
+def ordinal_to_month(ordinal):
+    day = date.fromordinal(ordinal)
+    return day.year, day.month
+
+
+# Cents are stored in 64-bit integer columns
+MAX_CENTS = 2 ** 63
+
+
+def to_cents(amount):
+    # Euros (float or numeric string) to integer cents; anything past the cent
+    # is rounded. NaN, infinity and amounts the columns cannot hold are a ValueError.
+    cents = float(amount) * 100
+    if not abs(cents) < MAX_CENTS:
+        raise ValueError(f"{amount} is not a valid amount")
+    return round(cents)
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+class Transaction:
+    # One transaction with its amount in cents, its date as an ordinal and an
+    # interned category. The JSON files keep the old dict format, and
+    # from_dict/to_dict convert between the two without loss.
+    __slots__ = ("id", "ordinal", "description", "cents", "category")
+
+    def __init__(self, transaction_id, ordinal, description, cents, category):
+        self.id = transaction_id
+        self.ordinal = ordinal
+        self.description = description
+        self.cents = cents
+        self.category = category
+
+    @property
+    def date(self):
+        return ordinal_to_date(self.ordinal)
+
+    @property
+    def amount(self):
+        return from_cents(self.cents)
+
+    @classmethod
+    def from_dict(cls, t):
+        return cls(t.get("id"), date_to_ordinal(t["date"]), sys.intern(t["description"]),
+                   to_cents(t["amount"]), sys.intern(t["category"]))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "date": self.date,
+            "description": self.description,
+            "amount": self.amount,
+            "category": self.category
+        }
+
+    def __repr__(self):
+        return f"Transaction({self.to_dict()})"
+
+
+class Rollup:
+    # Month x category cube of (income, expense, count) in cents, updated in
+    # O(1) on every change. Budget checks and the trend reports read these few hundred
+    # cells instead of rescanning the ledger. Expense totals per category are
+    # kept separately so the all-time figures are O(1) as well.
+    def __init__(self):
+        self.cells = {}
+        self.by_category = {}
+
+    def add(self, category, ordinal, cents, sign=1):
+        key = (ordinal_to_month(ordinal), category)
+        income, expense, count = self.cells.get(key, (0, 0, 0))
+        if cents >= 0:
+            income += cents * sign
+        else:
+            expense -= cents * sign
+            total, expense_count = self.by_category.get(category, (0, 0))
+            self.by_category[category] = (total - cents * sign, expense_count + sign)
+        if count + sign:
+            self.cells[key] = (income, expense, count + sign)
+        else:
+            self.cells.pop(key, None)
+
+    def remove(self, category, ordinal, cents):
+        self.add(category, ordinal, cents, sign=-1)
+
+    def spent(self, category, period=None):
+        # Amount spent in `category` overall, or in the (year, month) `period`
+        if period is None:
+            total, count = self.by_category.get(category, (0, 0))
+            return total if count else 0
+        return self.cells.get((period, category), (0, 0, 0))[1]
+
+    def totals(self):
+        return {category: total for category, (total, count) in self.by_category.items() if count}
+
+    def months(self):
+        return sorted({period for period, category in self.cells})
+
+    def monthly_totals(self):
+        # [(period, income, expense), ...] in month order
+        months = {}
+        for (period, category), (income, expense, count) in self.cells.items():
+            month_income, month_expense = months.get(period, (0, 0))
+            months[period] = (month_income + income, month_expense + expense)
+        return [(period, income, expense) for period, (income, expense) in sorted(months.items())]
+
+    def category_trends(self):
+        # Month axis plus the expense of every category for each month on it
+        months = self.months()
+        position = {period: i for i, period in enumerate(months)}
+        trends = {}
+        for (period, category), (income, expense, count) in self.cells.items():
+            if expense:
+                trends.setdefault(category, [0] * len(months))[position[period]] = expense
+        return months, trends
+
+    def compare(self, period, previous):
+        # {category: (expense in previous, expense in period)}
+        comparison = {}
+        for (cell_period, category), (income, expense, count) in self.cells.items():
+            if cell_period in (period, previous) and expense:
+                before, after = comparison.get(category, (0, 0))
+                comparison[category] = (before, after + expense) if cell_period == period else (before + expense, after)
+        return comparison
+
+    def to_json(self):
+        # Amounts stay in cents
+        return [[year, month, category, income, expense, count]
+                for ((year, month), category), (income, expense, count) in sorted(self.cells.items())]
+
+    def add_cells(self, rows, sign=1):
+        # Merges in (or with sign=-1 takes back out) cells in the to_json() layout.
+        # The per-category counts only need to be non-zero, so cells stand in for rows.
+        for year, month, category, income, expense, count in rows:
+            key = ((year, month), category)
+            cell_income, cell_expense, cell_count = self.cells.get(key, (0, 0, 0))
+            if cell_count + count * sign:
+                self.cells[key] = (cell_income + income * sign, cell_expense + expense * sign, cell_count + count * sign)
+            else:
+                self.cells.pop(key, None)
+            if expense:
+                total, expense_count = self.by_category.get(category, (0, 0))
+                self.by_category[category] = (total + expense * sign, expense_count + sign)
+
+    def rebuild(self, store):
+        self.cells = {}
+        self.by_category = {}
+        if np is not None and len(store):
+            self.rebuild_vectorized(store)
+            return
+        for transaction_id, ordinal, cents, code in zip(store.ids, store.dates, store.cents, store.categories):
+            if transaction_id:
+                self.add(store.category_names[code], ordinal, cents)
+
+    def rebuild_vectorized(self, store):
+        # Groups rows by (month, category) code and sums each group with bincount
+        alive = np.frombuffer(store.ids, dtype=np.int64) != 0
+        ordinals = np.frombuffer(store.dates, dtype=np.intc)[alive].astype(np.int64)
+        cents = np.frombuffer(store.cents, dtype=np.int64)[alive]
+        codes = np.frombuffer(store.categories, dtype=np.intc)[alive].astype(np.int64)
+        days = (ordinals - date(1970, 1, 1).toordinal()).astype("datetime64[D]")
+        months = days.astype("datetime64[M]").astype(np.int64)
+        width = max(1, len(store.category_names))
+        keys, groups = np.unique(months * width + codes, return_inverse=True)
+        # Float sums of whole cents are exact up to 2**53 cents
+        expenses = cents < 0
+        income = np.bincount(groups, weights=np.where(expenses, 0, cents)).round().astype(np.int64)
+        expense = np.bincount(groups, weights=np.where(expenses, -cents, 0)).round().astype(np.int64)
+        count = np.bincount(groups)
+        expense_count = np.bincount(groups, weights=expenses)
+        for key, cell_income, cell_expense, cell_count, cell_expenses in zip(
+                keys.tolist(), income.tolist(), expense.tolist(), count.tolist(), expense_count.tolist()):
+            month, code = divmod(key, width)
+            category = store.category_names[code]
+            self.cells[((1970 + month // 12, month % 12 + 1), category)] = (cell_income, cell_expense, cell_count)
+            if cell_expenses:
+                total, expense_total_count = self.by_category.get(category, (0, 0))
+                self.by_category[category] = (total + cell_expense, expense_total_count + int(cell_expenses))
+
+    def verify(self, store):
+        # Recomputes everything from scratch and reports whether the running totals agree
+        fresh = Rollup()
+        fresh.rebuild(store)
+        for mine, theirs in ((self.by_category, fresh.by_category), (self.cells, fresh.cells)):
+            for key in set(mine) | set(theirs):
+                values = mine.get(key) or (0,) * len(theirs[key])
+                expected = theirs.get(key) or (0,) * len(values)
+                if tuple(values) != tuple(expected):
+                    return False
+        return True
+
+
+class DateIndex:
+    # Row positions kept sorted by date ordinal, so a date range is a bisect plus a slice
+    def __init__(self):
+        self.dates = array("i")
+        self.positions = array("i")
+
+    def __len__(self):
+        return len(self.positions)
+
+    def insert(self, ordinal, position):
+        i = bisect_right(self.dates, ordinal)
+        self.dates.insert(i, ordinal)
+        self.positions.insert(i, position)
+
+    def remove(self, ordinal, position):
+        i = bisect_left(self.dates, ordinal)
+        while self.positions[i] != position:
+            i += 1
+        del self.dates[i]
+        del self.positions[i]
+
+    def range(self, start=None, end=None):
+        # Positions with start <= date <= end (ordinals), in date order
+        lo = bisect_left(self.dates, start) if start is not None else 0
+        hi = bisect_right(self.dates, end) if end is not None else len(self.dates)
+        return self.positions[lo:hi]
+
+
+def search_terms(text):
+    # "sup* rent" -> [("sup", True), ("rent", False)]: every term has to match;
+    # a trailing * makes it a word prefix, otherwise it matches anywhere
+    terms = []
+    for word in text.lower().split():
+        term = word.rstrip("*")
+        if term:
+            terms.append((term, term != word))
+    return terms
+
+
+def term_matcher(term, prefix):
+    # Predicate on lowercased text
+    if prefix:
+        return re.compile(r"(?<!\w)" + re.escape(term)).search
+    return lambda text: term in text
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TextIndex:
+    # Inverted index for the description search: every distinct description
+    # maps to the slots of its rows, and a trigram index over the lowercased
+    # distinct descriptions finds the ones containing a term without scanning
+    # them all. Descriptions repeat a lot, so the trigram side stays small
+    # however long the ledger is.
+    def __init__(self):
+        self.postings = {}
+        self.lowered = {}
+        self.trigrams = {}
+
+    @classmethod
+    def build(cls, store):
+        index = cls()
+        if np is not None and len(store):
+            # Distinct descriptions get codes, and the live slots are grouped by code with one sort
+            vocabulary = dict.fromkeys(store.descriptions)
+            names = list(vocabulary)
+            for code, description in enumerate(names):
+                vocabulary[description] = code
+            codes = np.fromiter(map(vocabulary.__getitem__, store.descriptions), dtype=np.intc,
+                                count=len(store.descriptions))
+            slots = np.flatnonzero(np.frombuffer(store.ids, dtype=np.int64)).astype(np.intc)
+            slots = slots[np.argsort(codes[slots], kind="stable")]
+            ordered = codes[slots]
+            bounds = np.flatnonzero(np.diff(ordered)) + 1
+            for first, group in zip(np.concatenate([[0], bounds]).tolist(), np.split(slots, bounds)):
+                index.add_description(names[ordered[first]], array("i", group.tobytes()))
+            return index
+
+        postings = {}
+        for slot, (transaction_id, description) in enumerate(zip(store.ids, store.descriptions)):
+            if transaction_id:
+                postings.setdefault(description, []).append(slot)
+        for description, slots in postings.items():
+            index.add_description(description, array("i", slots))
+        return index
+
+    def add_description(self, description, slots):
+        lower = self.lowered[description] = description.lower()
+        self.postings[description] = slots
+        for gram in trigrams(lower):
+            self.trigrams.setdefault(gram, set()).add(description)
+
+    def add(self, description, slot):
+        slots = self.postings.get(description)
+        if slots is None:
+            self.add_description(description, array("i", [slot]))
+        else:
+            slots.append(slot)
+
+    def remove(self, description, slot):
+        slots = self.postings[description]
+        slots.remove(slot)
+        if not slots:
+            del self.postings[description]
+            for gram in trigrams(self.lowered.pop(description)):
+                descriptions = self.trigrams[gram]
+                descriptions.discard(description)
+                if not descriptions:
+                    del self.trigrams[gram]
+
+    def matching(self, term, prefix):
+        # Distinct descriptions that `term` matches
+        if len(term) >= 3:
+            sets = sorted((self.trigrams.get(gram, ()) for gram in trigrams(term)), key=len)
+            candidates = set(sets[0]).intersection(*sets[1:])
+        else:
+            candidates = self.lowered
+        matches = term_matcher(term, prefix)
+        lowered = self.lowered
+        return [description for description in candidates if matches(lowered[description])]
+
+
+class TransactionStore:
+    # Column-oriented transaction table: dates are parsed once into ordinals,
+    # amounts are integer cents and categories are interned into small integer
+    # codes, so filters never touch strings and sums are exact. Every transaction has a stable id, and `slots` maps ids to their
+    # row, so lookups are O(1). Deleted rows are only tombstoned (id 0) and
+    # squeezed out once they pile up. A date index (overall and per category)
+    # is kept sorted on every change, and so is the month x category `rollup`.
+    # With partitioned storage `partitions` is the set of years held in memory
+    # (None means everything). The description search index is built on the
+    # first search and kept up to date from then on.
+    def __init__(self, transactions=()):
+        self.ids = array("q")
+        self.dates = array("i")
+        self.cents = array("q")
+        self.categories = array("i")
+        self.descriptions = []
+        self.category_names = []
+        self.category_codes = {}
+        self.slots = {}
+        self.next_id = 1
+        self.dead = 0
+        self.date_index = DateIndex()
+        self.category_indexes = {}
+        self.rollup = Rollup()
+        self.partitions = None
+        self.text_index = None
+        # `transactions` are dicts in the JSON file format
+        for t in transactions:
+            self.append_columns(Transaction.from_dict(t))
+        self.rebuild_indexes()
+        self.rollup.rebuild(self)
+
+    @classmethod
+    def from_columns(cls, ids, dates, cents, categories, descriptions, category_names):
+        # Adopts ready-made columns (e.g. from a binary snapshot) without going
+        # through a Transaction per row
+        store = cls()
+        store.ids, store.dates, store.cents, store.categories = ids, dates, cents, categories
+        store.descriptions = descriptions
+        store.category_names = list(category_names)
+        store.category_codes = {name: code for code, name in enumerate(store.category_names)}
+        store.slots = dict(zip(ids, range(len(ids))))
+        store.next_id = max(ids, default=0) + 1
+        store.rebuild_indexes()
+        store.rollup.rebuild(store)
+        return store
+
+    def rebuild_indexes(self):
+        self.date_index = DateIndex()
+        self.category_indexes = {code: DateIndex() for code in range(len(self.category_names))}
+        if np is not None and len(self):
+            dates = np.frombuffer(self.dates, dtype=np.intc)
+            categories = np.frombuffer(self.categories, dtype=np.intc)
+            order = np.argsort(dates, kind="stable").astype(np.intc)
+            if self.dead:
+                order = order[np.frombuffer(self.ids, dtype=np.int64)[order] != 0]
+            self.date_index.dates = array("i", dates[order].tobytes())
+            self.date_index.positions = array("i", order.tobytes())
+            ordered_categories = categories[order]
+            for code, index in self.category_indexes.items():
+                selected = order[ordered_categories == code]
+                index.dates = array("i", dates[selected].tobytes())
+                index.positions = array("i", selected.tobytes())
+            return
+
+        for slot in sorted((slot for slot, i in enumerate(self.ids) if i), key=self.dates.__getitem__):
+            for index in (self.date_index, self.category_indexes[self.categories[slot]]):
+                index.dates.append(self.dates[slot])
+                index.positions.append(slot)
+
+    def category_code(self, category):
+        code = self.category_codes.get(category)
+        if code is None:
+            code = len(self.category_names)
+            self.category_codes[category] = code
+            self.category_names.append(category)
+            self.category_indexes[code] = DateIndex()
+        return code
+
+    def index_slot(self, slot):
+        self.date_index.insert(self.dates[slot], slot)
+        self.category_indexes[self.categories[slot]].insert(self.dates[slot], slot)
+        self.rollup.add(self.category_names[self.categories[slot]], self.dates[slot], self.cents[slot])
+        if self.text_index is not None:
+            self.text_index.add(self.descriptions[slot], slot)
+
+    def unindex_slot(self, slot):
+        self.date_index.remove(self.dates[slot], slot)
+        self.category_indexes[self.categories[slot]].remove(self.dates[slot], slot)
+        self.rollup.remove(self.category_names[self.categories[slot]], self.dates[slot], self.cents[slot])
+        if self.text_index is not None:
+            self.text_index.remove(self.descriptions[slot], slot)
+
+    def __len__(self):
+        return len(self.ids) - self.dead
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self.slots
+
+    def row(self, slot):
+        return Transaction(self.ids[slot], self.dates[slot], self.descriptions[slot], self.cents[slot],
+                           self.category_names[self.categories[slot]])
+
+    def get(self, transaction_id):
+        return self.row(self.slots[transaction_id])
+
+    def __iter__(self):
+        for slot, transaction_id in enumerate(self.ids):
+            if transaction_id:
+                yield self.row(slot)
+
+    def dicts(self):
+        # The transactions in the JSON file format
+        for t in self:
+            yield t.to_dict()
+
+    def append_columns(self, transaction):
+        # Transactions from older files, and new ones, have no id yet and get the next free one
+        transaction_id = transaction.id or self.next_id
+        code = self.category_code(transaction.category)
+        description = sys.intern(transaction.description)
+        # The amount can overflow its column, so it goes first and a bad row
+        # leaves the columns as they were
+        self.cents.append(transaction.cents)
+        self.next_id = max(self.next_id, transaction_id + 1)
+        self.slots[transaction_id] = len(self.ids)
+        self.ids.append(transaction_id)
+        self.dates.append(transaction.ordinal)
+        self.categories.append(code)
+        self.descriptions.append(description)
+        return transaction_id
+
+    def append(self, transaction):
+        transaction_id = self.append_columns(transaction)
+        self.index_slot(len(self.ids) - 1)
+        return transaction_id
+
+    def extend(self, transactions):
+        # Bulk append: a large batch re-sorts the date indexes once instead of
+        # paying for a sorted insert per row
+        start = len(self.ids)
+        ids = [self.append_columns(t) for t in transactions]
+        if len(ids) < 256:
+            for slot in range(start, len(self.ids)):
+                self.index_slot(slot)
+            return ids
+        for slot in range(start, len(self.ids)):
+            self.rollup.add(self.category_names[self.categories[slot]], self.dates[slot], self.cents[slot])
+            if self.text_index is not None:
+                self.text_index.add(self.descriptions[slot], slot)
+        self.rebuild_indexes()
+        return ids
+
+    def update(self, transaction_id, transaction):
+        slot = self.slots[transaction_id]
+        self.unindex_slot(slot)
+        self.dates[slot] = transaction.ordinal
+        self.cents[slot] = transaction.cents
+        self.categories[slot] = self.category_code(transaction.category)
+        self.descriptions[slot] = sys.intern(transaction.description)
+        self.index_slot(slot)
+
+    def remove(self, transaction_id):
+        slot = self.slots.pop(transaction_id)
+        self.unindex_slot(slot)
+        self.ids[slot] = 0
+        self.descriptions[slot] = ""
+        self.dead += 1
+        if self.dead > 1024 and self.dead * 4 > len(self.ids):
+            self.compact()
+
+    def compact(self):
+        # Drops tombstoned rows; slots change, so the date indexes are rebuilt
+        alive = [bool(transaction_id) for transaction_id in self.ids]
+        self.ids = array("q", compress(self.ids, alive))
+        self.dates = array("i", compress(self.dates, alive))
+        self.cents = array("q", compress(self.cents, alive))
+        self.categories = array("i", compress(self.categories, alive))
+        self.descriptions = list(compress(self.descriptions, alive))
+        self.slots = {transaction_id: slot for slot, transaction_id in enumerate(self.ids)}
+        self.dead = 0
+        self.rebuild_indexes()
+        self.text_index = None
+
+    def copy(self, with_slots=False):
+        # Frozen copy of the columns, enough to iterate the transactions from
+        # another thread while this store keeps changing (and to look them up
+        # by id if `with_slots`)
+        clone = TransactionStore.__new__(TransactionStore)
+        clone.slots = dict(self.slots) if with_slots else {}
+        clone.ids = self.ids[:]
+        clone.dates = self.dates[:]
+        clone.cents = self.cents[:]
+        clone.categories = self.categories[:]
+        clone.descriptions = self.descriptions[:]
+        clone.category_names = self.category_names[:]
+        clone.dead = self.dead
+        clone.partitions = set(self.partitions) if self.partitions is not None else None
+        return clone
+
+    def select(self, category=None, start=None, end=None, by_date=False, text=None):
+        # Ids of transactions matching the category and the inclusive
+        # [start, end] datetime range, in insertion order (or date order).
+        # Binary search on the date index narrows the range, so the cost is
+        # O(log n + k) rather than a full scan.
+        if text and search_terms(text):
+            return self.search(text, category, start, end)
+        if category is None:
+            index = self.date_index
+        else:
+            index = self.category_indexes.get(self.category_codes.get(category))
+            if index is None:
+                return []
+        if category is None and start is None and end is None and not by_date:
+            # A copy, since callers keep the result while the store goes on changing
+            return self.ids[:] if not self.dead else [i for i in self.ids if i]
+
+        slots = index.range(start.toordinal() if start is not None else None,
+                            end.toordinal() if end is not None else None)
+        ids = self.ids
+        return [ids[slot] for slot in (slots if by_date else sorted(slots))]
+
+    def refine(self, ids, category=None, start=None, end=None, text=None):
+        # The subset of an earlier result `ids` that also matches, in the same
+        # order, by checking the columns of just those rows; ids deleted since
+        # are dropped
+        low = start.toordinal() if start is not None else -1
+        high = end.toordinal() if end is not None else 1 << 30
+        code = self.category_codes.get(category, -1) if category is not None else None
+        found = self.search_descriptions(text)
+        if np is not None:
+            slots = np.fromiter(map(self.slots.get, ids, repeat(-1)), dtype=np.int64, count=len(ids))
+            live = slots >= 0
+            dates = np.frombuffer(self.dates, dtype=np.intc)[slots]
+            keep = live & (dates >= low) & (dates <= high)
+            if code is not None:
+                keep &= np.frombuffer(self.categories, dtype=np.intc)[slots] == code
+            ids = np.asarray(ids, dtype=np.int64)[keep].tolist()
+        else:
+            slots, dates, categories = self.slots, self.dates, self.categories
+            ids = [i for i, slot in zip(ids, map(slots.get, ids)) if slot is not None and
+                   low <= dates[slot] <= high and (code is None or categories[slot] == code)]
+        if found is None:
+            return ids
+        slots, descriptions, categories = self.slots, self.descriptions, self.categories
+        return [i for i in ids if all(descriptions[slots[i]] in matched or categories[slots[i]] in codes
+                                      for matched, codes in found)]
+
+    def search_descriptions(self, text):
+        # Per search term, the set of descriptions and of category codes it
+        # matches, or None when there is nothing to search for
+        terms = search_terms(text or "")
+        if not terms:
+            return None
+        if self.text_index is None:
+            self.text_index = TextIndex.build(self)
+        found = []
+        for term, prefix in terms:
+            matches = term_matcher(term, prefix)
+            found.append((set(self.text_index.matching(term, prefix)),
+                          {code for code, name in enumerate(self.category_names) if matches(name.lower())}))
+        return found
+
+    def search(self, text, category=None, start=None, end=None):
+        # Ids whose description or category matches every term of `text`, and
+        # the category and date filters, in insertion order. The rarest term
+        # is looked up in the index; the others are then checked against just
+        # those rows, or intersected the same way if that is cheaper.
+        found = self.search_descriptions(text)
+        postings = self.text_index.postings
+        terms = []
+        for matched, codes in found:
+            lists = [postings[description] for description in matched]
+            lists += [self.category_indexes[code].positions for code in codes]
+            terms.append((sum(map(len, lists)), lists, matched, codes))
+        terms.sort(key=lambda term: term[0])
+
+        result = None
+        descriptions, categories = self.descriptions, self.categories
+        for size, lists, matched, codes in terms:
+            if result is not None and len(result) <= size:
+                keep = [descriptions[slot] in matched or categories[slot] in codes
+                        for slot in (result.tolist() if np is not None else result)]
+                result = result[np.array(keep, dtype=bool)] if np is not None else list(compress(result, keep))
+                continue
+            slots = array("i")
+            for positions in lists:
+                slots.extend(positions)
+            if np is None:
+                slots = set(slots)
+                result = sorted(slots) if result is None else [slot for slot in result if slot in slots]
+                continue
+            # A row mask, so neither the union nor the intersection needs sorting
+            mask = np.zeros(len(self.ids), dtype=bool)
+            mask[np.frombuffer(slots, dtype=np.intc)] = True
+            result = np.flatnonzero(mask) if result is None else result[mask[result]]
+
+        low = start.toordinal() if start is not None else -1
+        high = end.toordinal() if end is not None else 1 << 30
+        code = self.category_codes.get(category, -1) if category is not None else None
+        if np is not None:
+            dates = np.frombuffer(self.dates, dtype=np.intc)[result]
+            keep = (dates >= low) & (dates <= high)
+            if code is not None:
+                keep &= np.frombuffer(categories, dtype=np.intc)[result] == code
+            return np.frombuffer(self.ids, dtype=np.int64)[result[keep]].tolist()
+        ids, dates = self.ids, self.dates
+        return [ids[slot] for slot in result
+                if low <= dates[slot] <= high and (code is None or categories[slot] == code)]
@@ -0,0 +1,103 @@
+import perf
+
+
+class VirtualTable:
+    # Treeview that only ever holds one item per visible line. The full result
+    # stays in `items` (any sequence, e.g. a list of positions or a range) and
+    # scrolling rewrites the values of the same recycled rows, so refreshing a
+    # huge result costs as much as refreshing one screenful.
+    def __init__(self, master, columns, height, format_row):
+        # Tk is only needed for the widgets, so the rest runs headlessly (see benchmark.py)
+        import tkinter as tk
+        import ttkbootstrap as tb
+        self.height = height
+        self.format_row = format_row
+        self.items = []
+        self.offset = 0
+        self.selected = None
+
+        self.tree = tb.Treeview(master, columns=columns, show="headings", height=height, selectmode="browse")
+        self.scrollbar = tb.Scrollbar(master, orient=tk.VERTICAL, command=self.yview)
+        self.rows = [self.tree.insert("", "end", iid=f"row{slot}") for slot in range(height)]
+
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda event: self.move_selection(-self.height))
+        self.tree.bind("<Next>", lambda event: self.move_selection(self.height))
+
+    def set_items(self, items):
+        self.items = items
+        self.selected = None
+        self.offset = max(0, min(self.offset, len(items) - self.height))
+        self.refresh()
+
+    @perf.timed("table.refresh")
+    def refresh(self):
+        for slot, row in enumerate(self.rows):
+            index = self.offset + slot
+            if index < len(self.items):
+                self.tree.item(row, values=self.format_row(self.items[index]))
+                self.tree.move(row, "", slot)
+            else:
+                self.tree.detach(row)
+
+        perf.count("rows rendered", min(self.height, max(0, len(self.items) - self.offset)))
+
+        if self.selected is not None and self.offset <= self.selected < self.offset + self.height:
+            self.tree.selection_set(self.rows[self.selected - self.offset])
+        else:
+            self.tree.selection_set(())
+
+        if self.items:
+            self.scrollbar.set(self.offset / len(self.items),
+                               min(1.0, (self.offset + self.height) / len(self.items)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.items) - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def scroll(self, lines):
+        self.scroll_to(self.offset + lines)
+
+    def yview(self, *args):
+        # Scrollbar callback: ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.items)))
+        elif args[0] == "scroll":
+            step = self.height if args[2] == "pages" else 1
+            self.scroll(int(args[1]) * step)
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        lines = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        self.scroll(lines * 3)
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self.selected = self.offset + self.rows.index(selection[0])
+
+    def move_selection(self, step):
+        if not self.items:
+            return "break"
+        current = self.selected if self.selected is not None else self.offset
+        self.selected = max(0, min(current + step, len(self.items) - 1))
+        if self.selected < self.offset:
+            self.offset = self.selected
+        elif self.selected >= self.offset + self.height:
+            self.offset = self.selected - self.height + 1
+        self.refresh()
+        return "break"
+
+    def selected_item(self):
+        if self.selected is None or self.selected >= len(self.items):
+            return None
+        return self.items[self.selected]